@@ -1,96 +1,641 @@
 from __future__ import annotations
-from typing import List
+from contextlib import nullcontext
+from typing import Callable, List, Dict, Any, AsyncIterator, Iterator, Optional
+import asyncio
+import json
+import random
+import re
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from models import Message
+from llm_scheduler import CHAT, TITLE, BACKGROUND, LLMBusyError, LLMScheduler
+from context_builder import ContextBuilder
+from model_residency import ModelResidency
+import metrics
+
+try:
+    import httpx
+    # What requests reports as ConnectionError: refused/reset/dropped connections.
+    _ASYNC_CONNECTION_ERRORS = (httpx.NetworkError, httpx.RemoteProtocolError)
+except ImportError:  # only needed by the *Async methods (ASGI mode)
+    httpx = None
+    _ASYNC_CONNECTION_ERRORS = ()
+
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+
+class SentenceBuffer:
+    """Accumulates streamed tokens and releases complete sentences"""
+
+    def __init__(self):
+        self._buf = ""
+
+    def feed(self, token: str) -> List[str]:
+        self._buf += token
+        out = []
+        while True:
+            m = _SENTENCE_END.search(self._buf)
+            if not m:
+                return out
+            sentence = self._buf[:m.end()].strip()
+            self._buf = self._buf[m.end():]
+            if sentence:
+                out.append(sentence)
+
+    def flush(self) -> Optional[str]:
+        rest = self._buf.strip()
+        self._buf = ""
+        return rest or None
+
+class CircuitOpenError(Exception):
+    pass
+
+class _RetryableStatus(Exception):
+    pass
+
+class CircuitBreaker:
+    """Opens after consecutive failed calls; lets one trial call through once resetTimeout has passed"""
+
+    def __init__(self, failureThreshold: int = 5, resetTimeout: float = 30.0):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._openedAt = 0.0
+        self._trialInFlight = False
+        self._opens = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._openedAt >= self.resetTimeout:
+                self._state = "half-open"
+                self._trialInFlight = False
+            if self._state == "half-open" and not self._trialInFlight:
+                self._trialInFlight = True
+                return True
+            return False
+
+    def recordSuccess(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._trialInFlight = False
+
+    def recordFailure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half-open" or self._failures >= self.failureThreshold:
+                if self._state != "open":
+                    self._opens += 1
+                self._state = "open"
+                self._openedAt = time.monotonic()
+                self._trialInFlight = False
+
+    def recordAbandoned(self):
+        """The call ended without an answer either way (it was cancelled); a later call may be the trial"""
+        with self._lock:
+            self._trialInFlight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self._state, "consecutiveFailures": self._failures, "opens": self._opens}
 
 class AIService:
-    def __init__(self, apiEndpoint: str):
+    SYSTEM_PROMPT = (
+        "You are talking with an English learner and they need your help practicing English. Make sure you respond with 2-3 sentences at max and do not use any emojis or symbols that aren't punctuation marks" \
+        "Also, do not focus entirely on fixing the mistakes. Chatting and considering students' opinions are also priorities for you. Think of yourself as a friendly teacher who is students' favorite."
+    )
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    EMPTY_REPLY = "I understand. Please continue."
+    TIMEOUT_REPLY = "I'm taking a bit longer to respond. Could you try again?"
+    UNREACHABLE_REPLY = "I couldn't reach the AI service, but I got your message."
+    ERROR_REPLY = "I couldn't process that right now, but I'm here listening."
+
+    def __init__(self, apiEndpoint: str, model: str = "gpt-oss:120b-cloud", poolSize: int = 10,
+                 maxRetries: int = 2, backoffBase: float = 0.2,
+                 breakerThreshold: int = 5, breakerResetSeconds: float = 30.0,
+                 asyncPoolSize: int = 200, scheduler: Optional[LLMScheduler] = None,
+                 contextBuilder: Optional[ContextBuilder] = None, residency: Optional[ModelResidency] = None):
         self.apiEndpoint = apiEndpoint
+        self.model = model
+        self.asyncPoolSize = asyncPoolSize
+        self._asyncClient = None
+        # Optional: caps concurrent Ollama calls and queues chat turns ahead of titles.
+        self.scheduler = scheduler
+        self.contextBuilder = contextBuilder or ContextBuilder()
+        # Optional: keep_alive on every call, cold/warm first-token latency.
+        self.residency = residency
+        self.maxRetries = maxRetries
+        self.backoffBase = backoffBase
+        
+        # One keep-alive session for every call to Ollama; retries are handled in
+        # _post so that they can feed the circuit breaker.
+        self._session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize, max_retries=0)
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+        self._breaker = CircuitBreaker(breakerThreshold, breakerResetSeconds)
+        
+        self._statsLock = threading.Lock()
+        self._streamStats = {"streams": 0, "firstTokens": 0, "ttftMsTotal": 0.0, "ttftMsMax": 0.0, "lastTtftMs": 0.0}
+        self._callStats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "shortCircuits": 0}
 
-    def generateResponse(self, text: str, context: List[Message]) -> str:
-        SYSTEM_PROMPT = (
-            "You are talking with an English learner and they need your help practicing English. Make sure you respond with 2-3 sentences at max and do not use any emojis or symbols that aren't punctuation marks" \
-            "Also, do not focus entirely on fixing the mistakes. Chatting and considering students' opinions are also priorities for you. Think of yourself as a friendly teacher who is students' favorite."
-        )
+    def _slot(self, priority: int, userId: str):
+        return self.scheduler.slot(priority, userId) if self.scheduler else nullcontext()
 
-        try: 
-            msgs = []
+    def _asyncSlot(self, priority: int, userId: str):
+        return self.scheduler.asyncSlot(priority, userId) if self.scheduler else nullcontext()
 
-            msgs = [{"role": "system", "content": SYSTEM_PROMPT}]
+    def _modelState(self) -> str:
+        return self.residency.state() if self.residency else "unknown"
 
-            for m in context[-6:]:
-                role = "user" if m.senderId == "user" else "assistant"
-                msgs.append({"role": role, "content": m.content})
-            
-            msgs.append({"role": "user", "content": text})
-            
+    def _keepAlive(self, payload: Dict[str, Any]):
+        if self.residency:
+            payload["keep_alive"] = self.residency.keepAlive
+            self.residency.touch()
+
+    def _post(self, payload: Dict[str, Any], timeout, stream: bool = False) -> requests.Response:
+        """POST to Ollama through the pooled session, retrying transient failures with jittered backoff"""
+        self._keepAlive(payload)
+        self._count("calls")
+        if not self._breaker.allow():
+            self._count("shortCircuits")
+            raise CircuitOpenError("AI backend is unavailable (circuit open)")
+        
+        attempt = 0
+        while True:
+            self._count("attempts")
+            try:
+                r = self._session.post(self.apiEndpoint, json=payload, timeout=timeout, stream=stream)
+                if r.status_code in self.RETRY_STATUSES and attempt < self.maxRetries:
+                    r.close()
+                    raise _RetryableStatus(f"HTTP {r.status_code}")
+                if r.status_code >= 500:
+                    self._breaker.recordFailure()
+                    self._count("failures")
+                else:
+                    self._breaker.recordSuccess()
+                r.raise_for_status()
+                return r
+            except (requests.exceptions.ConnectionError, _RetryableStatus):
+                # ConnectionError includes ConnectTimeout. Read timeouts are not retried:
+                # the model is already working and a retry would only double the wait.
+                if attempt >= self.maxRetries:
+                    self._breaker.recordFailure()
+                    self._count("failures")
+                    raise
+                attempt += 1
+                self._count("retries")
+                time.sleep(random.uniform(0, self.backoffBase * (2 ** attempt)))
+            except requests.exceptions.Timeout:
+                self._breaker.recordFailure()
+                self._count("failures")
+                raise
+            except requests.exceptions.HTTPError:
+                # A 4xx answer; already recorded above.
+                raise
+            except Exception:
+                # Anything else (a broken body, too many redirects, a bad URL) must still settle
+                # the breaker, or a half-open trial would stay in flight for good.
+                self._breaker.recordFailure()
+                self._count("failures")
+                raise
+
+    def _count(self, key: str):
+        with self._statsLock:
+            self._callStats[key] += 1
+
+    @metrics.counters("calls", "attempts", "retries", "failures", "shortCircuits", "connectionsOpened", "requestsSent",
+                      "breaker_opens", "stream_streams", "stream_firstTokens", "stream_ttftMsTotal")
+    def metrics(self) -> Dict[str, Any]:
+        with self._statsLock:
+            out = dict(self._callStats)
+        
+        opened = 0
+        reused = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            reused += pool.num_requests
+        out["connectionsOpened"] = opened
+        out["requestsSent"] = reused
+        out["breaker"] = self._breaker.stats()
+        out["stream"] = self.streamStats()
+        return out
+
+    def _buildMessages(self, text: str, context: List[Message], summary: str = "") -> List[Dict[str, str]]:
+        return self.contextBuilder.build(self.SYSTEM_PROMPT, text, context, summary)
+
+    def generateResponse(self, text: str, context: List[Message], userId: str = "", summary: str = "") -> str:
+        """Chat reply; raises LLMBusyError when the scheduler has no room"""
+        with self._slot(CHAT, userId):
+            return self._generateResponse(text, context, summary)
+
+    def _generateResponse(self, text: str, context: List[Message], summary: str = "") -> str:
+        start = time.monotonic()
+        outcome = "error"
+        data = {}
+        try: 
             payload = {
-                "model": "gpt-oss:120b-cloud",
-                "messages": msgs,
+                "model": self.model,
+                "messages": self._buildMessages(text, context, summary),
                 "stream": False
             }
             
-            r = requests.post(self.apiEndpoint, json=payload, timeout=8)
-            r.raise_for_status()
+            r = self._post(payload, timeout=8)
             data = r.json()
             
             out = data.get("message", {}).get("content")
             if out:
+                outcome = "ok"
                 return out.strip()
             
-            return "I understand. Please continue."
+            outcome = "empty"
+            return self.EMPTY_REPLY
             
         except requests.exceptions.Timeout:
-            return "I'm taking a bit longer to respond. Could you try again?"
-        except requests.exceptions.ConnectionError:
-            return "I couldn't reach the AI service, but I got your message."
+            outcome = "timeout"
+            return self.TIMEOUT_REPLY
+        except (requests.exceptions.ConnectionError, CircuitOpenError):
+            outcome = "unreachable"
+            return self.UNREACHABLE_REPLY
         except Exception as e:
             print(f"AI Service Error: {str(e)}")
-            return "I couldn't process that right now, but I'm here listening."
+            return self.ERROR_REPLY
+        finally:
+            self._observeCall("chat", outcome, start, data)
 
-    def generateTitle(self, text: str) -> str:
-        """Generate conversation title from first message using AI (FR9)"""
-        t = (text or "").strip()
-        if not t:
-            return "New conversation"
+    def _observeCall(self, mode: str, outcome: str, start: float, data: Dict[str, Any], phase: Optional[str] = "llm"):
+        elapsed = time.monotonic() - start
+        if phase:
+            metrics.record(phase, elapsed)
+        metrics.LLM_SECONDS.observe(elapsed, mode=mode)
+        metrics.LLM_REQUESTS.inc(mode=mode, outcome=outcome)
+        self._observeUsage(data, mode)
+
+    def _observeUsage(self, data: Dict[str, Any], mode: str):
+        metrics.recordLlmTokens(data, mode)
+        if self.residency and data.get("done"):
+            self.residency.observe(data)
+
+    def streamResponse(self, text: str, context: List[Message], userId: str = "", summary: str = "",
+                       priority: int = CHAT, onSlot: Optional[Callable[[], None]] = None,
+                       raiseOnError: bool = False) -> Iterator[str]:
+        """Yield reply tokens as Ollama produces them; failures yield the usual fallback text.
+        
+        onSlot is called once the scheduler grants the slot, right before the request.
+        With raiseOnError a failed call or an empty answer raises instead.
+        """
+        # The slot is held until the stream finishes or the consumer closes it.
+        with self._slot(priority, userId):
+            if onSlot is not None:
+                onSlot()
+            yield from self._streamResponse(text, context, summary, raiseOnError)
+
+    def _streamResponse(self, text: str, context: List[Message], summary: str = "",
+                        raiseOnError: bool = False) -> Iterator[str]:
+        start = time.monotonic()
+        first = True
+        produced = False
+        outcome = "error"
+        final = {}
+        state = self._modelState()
+        with self._statsLock:
+            self._streamStats["streams"] += 1
+        
+        try:
+            payload = {
+                "model": self.model,
+                "messages": self._buildMessages(text, context, summary),
+                "stream": True
+            }
+            
+            # (connect, read) timeout: the read timeout applies between chunks,
+            # so a long answer is fine as long as tokens keep arriving.
+            with self._post(payload, timeout=(3, 8), stream=True) as r:
+                for line in r.iter_lines(chunk_size=None):
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    token = data.get("message", {}).get("content", "")
+                    if token:
+                        if first:
+                            self._recordFirstToken(start, state)
+                            first = False
+                        produced = True
+                        yield token
+                    if data.get("done"):
+                        final = data
+                        break
+            
+            outcome = "ok" if produced else "empty"
+            if not produced:
+                if raiseOnError:
+                    raise ValueError("The model returned an empty reply")
+                yield self.EMPTY_REPLY
+            
+        except requests.exceptions.Timeout:
+            outcome = "timeout"
+            if raiseOnError:
+                raise
+            if not produced:
+                yield self.TIMEOUT_REPLY
+        except (requests.exceptions.ConnectionError, CircuitOpenError):
+            outcome = "unreachable"
+            if raiseOnError:
+                raise
+            if not produced:
+                yield self.UNREACHABLE_REPLY
+        except Exception as e:
+            if raiseOnError:
+                raise
+            print(f"AI Service Stream Error: {str(e)}")
+            if not produced:
+                yield self.ERROR_REPLY
+        finally:
+            self._observeCall("stream", outcome, start, final)
+
+    def _getAsyncClient(self):
+        if httpx is None:
+            raise RuntimeError("httpx is required for the async AI client (pip install httpx)")
+        if self._asyncClient is None:
+            self._asyncClient = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=self.asyncPoolSize,
+                max_keepalive_connections=self.asyncPoolSize,
+            ))
+        return self._asyncClient
+
+    async def aclose(self):
+        if self._asyncClient is not None:
+            await self._asyncClient.aclose()
+            self._asyncClient = None
+
+    async def _postAsync(self, payload: Dict[str, Any], timeout, stream: bool = False):
+        """_post for the event loop: same retries, backoff and breaker, on a shared httpx.AsyncClient.
+        
+        With stream=True the caller must close the returned response (await r.aclose()).
+        """
+        client = self._getAsyncClient()
+        self._keepAlive(payload)
+        self._count("calls")
+        if not self._breaker.allow():
+            self._count("shortCircuits")
+            raise CircuitOpenError("AI backend is unavailable (circuit open)")
         
+        attempt = 0
+        while True:
+            self._count("attempts")
+            try:
+                req = client.build_request("POST", self.apiEndpoint, json=payload, timeout=timeout)
+                r = await client.send(req, stream=stream)
+                if r.status_code in self.RETRY_STATUSES and attempt < self.maxRetries:
+                    await r.aclose()
+                    raise _RetryableStatus(f"HTTP {r.status_code}")
+                if r.status_code >= 500:
+                    self._breaker.recordFailure()
+                    self._count("failures")
+                else:
+                    self._breaker.recordSuccess()
+                if r.is_error:
+                    await r.aclose()
+                    r.raise_for_status()
+                return r
+            except _ASYNC_CONNECTION_ERRORS + (httpx.ConnectTimeout, _RetryableStatus):
+                if attempt >= self.maxRetries:
+                    self._breaker.recordFailure()
+                    self._count("failures")
+                    raise
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(random.uniform(0, self.backoffBase * (2 ** attempt)))
+            except httpx.TimeoutException:
+                self._breaker.recordFailure()
+                self._count("failures")
+                raise
+            except httpx.HTTPStatusError:
+                raise
+            except asyncio.CancelledError:
+                self._breaker.recordAbandoned()
+                raise
+            except Exception:
+                self._breaker.recordFailure()
+                self._count("failures")
+                raise
+
+    async def generateResponseAsync(self, text: str, context: List[Message], userId: str = "", summary: str = "") -> str:
+        async with self._asyncSlot(CHAT, userId):
+            return await self._generateResponseAsync(text, context, summary)
+
+    async def _generateResponseAsync(self, text: str, context: List[Message], summary: str = "") -> str:
+        start = time.monotonic()
+        outcome = "error"
+        data = {}
         try:
             payload = {
-                "model": "gpt-oss:120b-cloud",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a title generator. Given a message, create a short, concise title (maximum 4 words) that summarizes the topic. Respond with ONLY the title, nothing else."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Create a short title for this message: {t}"
-                    }
-                ],
+                "model": self.model,
+                "messages": self._buildMessages(text, context, summary),
                 "stream": False
             }
             
-            r = requests.post(self.apiEndpoint, json=payload, timeout=5)
-            r.raise_for_status()
+            r = await self._postAsync(payload, timeout=8)
             data = r.json()
             
-            title = data.get("message", {}).get("content", "").strip()
+            out = data.get("message", {}).get("content")
+            if out:
+                outcome = "ok"
+                return out.strip()
+            
+            outcome = "empty"
+            return self.EMPTY_REPLY
             
-            title = title.strip('"').strip("'")
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            return self.TIMEOUT_REPLY
+        except _ASYNC_CONNECTION_ERRORS + (CircuitOpenError,):
+            outcome = "unreachable"
+            return self.UNREACHABLE_REPLY
+        except Exception as e:
+            print(f"AI Service Error: {str(e)}")
+            return self.ERROR_REPLY
+        finally:
+            self._observeCall("chat", outcome, start, data)
+
+    async def streamResponseAsync(self, text: str, context: List[Message], userId: str = "", summary: str = "") -> AsyncIterator[str]:
+        async with self._asyncSlot(CHAT, userId):
+            async for token in self._streamResponseAsync(text, context, summary):
+                yield token
+
+    async def _streamResponseAsync(self, text: str, context: List[Message], summary: str = "") -> AsyncIterator[str]:
+        start = time.monotonic()
+        first = True
+        produced = False
+        outcome = "error"
+        final = {}
+        state = self._modelState()
+        with self._statsLock:
+            self._streamStats["streams"] += 1
+        
+        try:
+            payload = {
+                "model": self.model,
+                "messages": self._buildMessages(text, context, summary),
+                "stream": True
+            }
             
-            if len(title) > 35:
-                title = title[:32] + "..."
+            r = await self._postAsync(payload, timeout=httpx.Timeout(8.0, connect=3.0), stream=True)
+            try:
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    token = data.get("message", {}).get("content", "")
+                    if token:
+                        if first:
+                            self._recordFirstToken(start, state)
+                            first = False
+                        produced = True
+                        yield token
+                    if data.get("done"):
+                        final = data
+                        break
+            finally:
+                await r.aclose()
             
-            return title if title else self._fallbackTitle(t)
+            outcome = "ok" if produced else "empty"
+            if not produced:
+                yield self.EMPTY_REPLY
             
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            if not produced:
+                yield self.TIMEOUT_REPLY
+        except _ASYNC_CONNECTION_ERRORS + (CircuitOpenError,):
+            outcome = "unreachable"
+            if not produced:
+                yield self.UNREACHABLE_REPLY
+        except Exception as e:
+            print(f"AI Service Stream Error: {str(e)}")
+            if not produced:
+                yield self.ERROR_REPLY
+        finally:
+            self._observeCall("stream", outcome, start, final)
+
+    def streamStats(self) -> Dict[str, Any]:
+        with self._statsLock:
+            out = dict(self._streamStats)
+        out["avgTtftMs"] = round(out["ttftMsTotal"] / out["firstTokens"], 2) if out["firstTokens"] else 0.0
+        return out
+
+    def _recordFirstToken(self, start: float, state: str):
+        ttft = (time.monotonic() - start) * 1000
+        metrics.LLM_TTFT_SECONDS.observe(ttft / 1000, state=state)
+        if self.residency:
+            self.residency.recordFirstToken(state, ttft)
+        with self._statsLock:
+            self._streamStats["firstTokens"] += 1
+            self._streamStats["ttftMsTotal"] += ttft
+            self._streamStats["lastTtftMs"] = ttft
+            self._streamStats["ttftMsMax"] = max(self._streamStats["ttftMsMax"], ttft)
+
+    def generateTitle(self, text: str, userId: str = "") -> str:
+        """Generate conversation title from first message using AI (FR9); falls back when the call fails"""
+        t = (text or "").strip()
+        if not t:
+            return "New conversation"
+        
+        try:
+            return self.requestTitle(t, userId) or self.fallbackTitle(t)
         except Exception as e:
             print(f"AI Title Generation Error: {str(e)}")
-            return self._fallbackTitle(t)
+            return self.fallbackTitle(t)
+
+    def requestTitle(self, text: str, userId: str = "") -> str:
+        """One title call to the model; raises on failure, returns "" for an empty answer"""
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are a title generator. Given a message, create a short, concise title (maximum 4 words) that summarizes the topic. Respond with ONLY the title, nothing else."
+                },
+                {
+                    "role": "user",
+                    "content": f"Create a short title for this message: {text.strip()}"
+                }
+            ],
+            "stream": False
+        }
+        
+        data = self._backgroundCall("title", TITLE, userId, payload, timeout=5)
+        title = data.get("message", {}).get("content", "").strip()
+        
+        title = title.strip('"').strip("'")
+        
+        if len(title) > 35:
+            title = title[:32] + "..."
+        
+        return title
     
-    def _fallbackTitle(self, text: str) -> str:
+    def summarize(self, previous: str, messages: List[Message], userId: str = "") -> str:
+        """Fold older messages into the rolling conversation summary; raises on failure"""
+        lines = "\n".join(f"{'Learner' if m.senderId == 'user' else 'Partner'}: {m.content}" for m in messages)
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You keep a running summary of an English practice conversation between a learner and a speaking partner. Update the summary with the new messages. Keep the topics, facts about the learner and open questions. At most 120 words. Respond with ONLY the summary."
+                },
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{lines}"
+                }
+            ],
+            "stream": False
+        }
+        
+        data = self._backgroundCall("summary", BACKGROUND, userId, payload, timeout=15)
+        return data.get("message", {}).get("content", "").strip()
+    
+    def _backgroundCall(self, mode: str, priority: int, userId: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """One non-streamed call for a title or summary; raises on failure, every outcome is counted"""
+        start = time.monotonic()
+        outcome = "error"
+        data = {}
+        try:
+            # The llm_<mode> phase includes the wait for a slot; the call's own latency is timed from the grant.
+            with self._slot(priority, userId), metrics.span(f"llm_{mode}"):
+                start = time.monotonic()
+                r = self._post(payload, timeout=timeout)
+                data = r.json()
+            outcome = "ok" if data.get("message", {}).get("content", "").strip() else "empty"
+            return data
+        except LLMBusyError:
+            outcome = "busy"
+            raise
+        except requests.exceptions.Timeout:
+            outcome = "timeout"
+            raise
+        except (requests.exceptions.ConnectionError, CircuitOpenError):
+            outcome = "unreachable"
+            raise
+        finally:
+            self._observeCall(mode, outcome, start, data, phase=None)
+
+    def fallbackTitle(self, text: str) -> str:
         """Fallback title generation if AI fails"""
-        t = text.replace("\n", " ").strip()
+        t = (text or "").replace("\n", " ").strip()
+        if not t:
+            return "New conversation"
         if len(t) > 31:
             return t[:28] + "..."
         return t
-
@@ -1,16 +1,35 @@
 from __future__ import annotations
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import json
+import click
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
+try:
+    from flask_sock import Sock
+except ImportError:  # optional: without it clients send interim transcripts to POST /api/messages/interim
+    Sock = None
 
-from database import Database
+from database import Database, ConversationNotFoundError
+from context_cache import ConversationContextCache
+from context_builder import ContextBuilder
 from auth_service import AuthService
+from session_cache import SessionCache
+from password_hasher import PasswordHasher, HasherBusyError
 from account_controller import AccountController
 from ai_service import AIService
+from llm_scheduler import LLMScheduler, LLMBusyError
+from model_residency import ModelResidency
 from nlp_engine import NLPEngine
+from nlp_service import NLPScoringService
 from message_controller import MessageController
 from conversation_controller import ConversationController
+from title_jobs import TitleJobQueue
+from summary_jobs import SummaryJobQueue
+from interim_analysis import InterimAnalyzer
+from speculation import SpeculativeResponder
+from feedback_store import FeedbackStore
 from settings_controller import SettingsController
 from profile_controller import ProfileController
+import metrics
 
 def create_app():
     app = Flask(__name__, static_folder="../frontend", static_url_path="")
@@ -19,18 +38,198 @@ def create_app():
         "DATABASE_URL",
         "dbname=seng321 user=postgres password=011186 host=localhost port=5432"
     )
-    db = Database(connectionString)
+    # Prompt budget: recent messages plus a rolling summary of the older ones.
+    contextBuilder = ContextBuilder(
+        maxPromptTokens=int(os.getenv("CONTEXT_MAX_TOKENS", "1200")),
+        maxRecentMessages=int(os.getenv("CONTEXT_RECENT_MESSAGES", "12")),
+        summaryMaxTokens=int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "250")),
+        summarizeEvery=int(os.getenv("SUMMARY_EVERY_TURNS", "4")),
+    )
+    cacheConversations = int(os.getenv("CONTEXT_CACHE_CONVERSATIONS", "1000"))
+    contextCache = ConversationContextCache(
+        window=contextBuilder.window,
+        maxConversations=cacheConversations,
+        maxBytes=int(os.getenv("CONTEXT_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    ) if cacheConversations > 0 else None
+    
+    db = Database(
+        connectionString,
+        minConnections=int(os.getenv("DB_POOL_MIN", "1")),
+        maxConnections=int(os.getenv("DB_POOL_MAX", "10")),
+        checkoutTimeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        maxIdleSeconds=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        contextCache=contextCache,
+    )
 
-    authService = AuthService(db)
+    passwordHasher = PasswordHasher(
+        algorithm=os.getenv("PASSWORD_KDF", "pbkdf2-sha256"),
+        iterations=int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "120000")),
+        scryptN=int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14))),
+        scryptR=int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+        scryptP=int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+        workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+        maxQueue=int(os.getenv("PASSWORD_HASH_QUEUE", "4")),
+    )
+    authService = AuthService(db, SessionCache(
+        ttl=float(os.getenv("SESSION_CACHE_TTL", "60")),
+        negativeTtl=float(os.getenv("SESSION_CACHE_NEGATIVE_TTL", "10")),
+        maxEntries=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    ), passwordHasher)
     accountController = AccountController(db, authService)
 
-    aiService = AIService(os.getenv("OLLAMA_ENDPOINT", "http://127.0.0.1:11434/api/chat"))
-    mlEngine = NLPEngine("")
+    llmScheduler = LLMScheduler(
+        maxConcurrent=int(os.getenv("LLM_MAX_CONCURRENT", "4")),
+        maxQueue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+        maxWait=float(os.getenv("LLM_MAX_WAIT", "10")),
+    )
+    ollamaEndpoint = os.getenv("OLLAMA_ENDPOINT", "http://127.0.0.1:11434/api/chat")
+    ollamaModel = os.getenv("OLLAMA_MODEL", "gpt-oss:120b-cloud")
+    # Preload the model once the app serves and keep it loaded while there is traffic (MODEL_RESIDENCY=0 leaves it to Ollama).
+    residency = ModelResidency(
+        ollamaEndpoint,
+        ollamaModel,
+        leaseSeconds=float(os.getenv("OLLAMA_KEEP_ALIVE", "300")),
+        heartbeatSeconds=float(os.getenv("OLLAMA_HEARTBEAT", "60")),
+        idleSeconds=float(os.getenv("OLLAMA_IDLE_UNLOAD", "900")),
+    ) if os.getenv("MODEL_RESIDENCY", "1") == "1" else None
+    aiService = AIService(
+        ollamaEndpoint,
+        model=ollamaModel,
+        poolSize=int(os.getenv("OLLAMA_POOL_SIZE", "10")),
+        maxRetries=int(os.getenv("OLLAMA_MAX_RETRIES", "2")),
+        breakerThreshold=int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "5")),
+        breakerResetSeconds=float(os.getenv("OLLAMA_BREAKER_RESET", "30")),
+        scheduler=llmScheduler,
+        contextBuilder=contextBuilder,
+        residency=residency,
+    )
+    mlEngine = NLPScoringService(
+        NLPEngine(""),
+        workers=int(os.getenv("NLP_WORKERS", "2")),
+        batchSize=int(os.getenv("NLP_BATCH_SIZE", "16")),
+        maxWaitMs=float(os.getenv("NLP_MAX_WAIT_MS", "5")),
+    )
 
-    messageController = MessageController(db, aiService, mlEngine)
-    conversationController = ConversationController(db, aiService, messageController)
+    titleJobs = TitleJobQueue(
+        db,
+        aiService,
+        workers=int(os.getenv("TITLE_WORKERS", "1")),
+        maxRetries=int(os.getenv("TITLE_MAX_RETRIES", "2")),
+        retryDelay=float(os.getenv("TITLE_RETRY_DELAY", "2")),
+    )
+    summaryJobs = SummaryJobQueue(db, aiService, contextBuilder, workers=int(os.getenv("SUMMARY_WORKERS", "1")))
+    feedbackStore = FeedbackStore(db, mlEngine, workers=int(os.getenv("FEEDBACK_WORKERS", "1")),
+                                  rescoreAfterSeconds=float(os.getenv("FEEDBACK_RESCORE_AFTER", "60")))
+    # Default for requests that do not say; clients opt in per request with "deferFeedback".
+    deferFeedbackDefault = os.getenv("DEFER_FEEDBACK", "0") == "1"
+    # Parses the learner's speech from interim transcripts while they are still talking.
+    interimAnalyzer = InterimAnalyzer(mlEngine) if os.getenv("INTERIM_ANALYSIS", "1") == "1" else None
+    # Starts the reply once the interim transcript has stopped changing; reused if the sent text matches.
+    speculation = None
+    if os.getenv("SPECULATIVE_GENERATION", "1") == "1":
+        speculation = SpeculativeResponder(db, aiService, contextBuilder,
+                                           workers=int(os.getenv("SPECULATION_WORKERS", "2")),
+                                           maxAgeSeconds=float(os.getenv("SPECULATION_MAX_AGE", "30")))
+    messageController = MessageController(db, aiService, mlEngine, titleJobs=titleJobs, feedbackStore=feedbackStore,
+                                          summaryJobs=summaryJobs, interimAnalyzer=interimAnalyzer,
+                                          speculation=speculation)
+    conversationController = ConversationController(db, aiService, messageController, titleJobs)
     settingsController = SettingsController(db)
     profileController = ProfileController(db)
+    
+    metricsCollectors = {
+        "db_pool": db.poolStats,
+        "llm": aiService.metrics,
+        "llm_scheduler": llmScheduler.stats,
+        "title_jobs": titleJobs.stats,
+        "summary_jobs": summaryJobs.stats,
+        "feedback": feedbackStore.stats,
+        "nlp": mlEngine.stats,
+        "pipeline": messageController.pipelineStats,
+        "cancellation": messageController.cancellationStats,
+        "session_cache": authService.sessionCache.stats,
+        "password_hasher": authService.hasher.stats,
+    }
+    if contextCache is not None:
+        metricsCollectors["context_cache"] = contextCache.stats
+    if residency is not None:
+        metricsCollectors["model_residency"] = residency.stats
+    if interimAnalyzer is not None:
+        metricsCollectors["interim"] = interimAnalyzer.stats
+    if speculation is not None:
+        metricsCollectors["speculation"] = speculation.stats
+
+    # Shared with the ASGI entry point (asgi_app.py), which serves the chat-turn
+    # routes asynchronously on top of the same caches, AI client and NLP pool.
+    app.extensions["echera"] = {
+        "connectionString": connectionString,
+        "db": db,
+        "contextCache": contextCache,
+        "authService": authService,
+        "aiService": aiService,
+        "residency": residency,
+        "mlEngine": mlEngine,
+        "titleJobs": titleJobs,
+        "summaryJobs": summaryJobs,
+        "interimAnalyzer": interimAnalyzer,
+        "speculation": speculation,
+        "feedbackStore": feedbackStore,
+        "deferFeedbackDefault": deferFeedbackDefault,
+        "metricsCollectors": metricsCollectors,
+    }
+
+    # Background threads and worker pools start on first use; the model preload waits for
+    # the first request, so CLI commands and the reloader's parent process never start it.
+    if residency is not None:
+        @app.before_request
+        def preload_model():
+            residency.start()
+
+    # Registered before require_session so the session lookup is part of the trace.
+    @app.before_request
+    def start_trace():
+        metrics.startRequest()
+
+    @app.after_request
+    def finish_trace(response):
+        # For streamed responses this covers the work up to the first byte only.
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        trace = metrics.finishRequest(route, request.method, response.status_code)
+        if trace is not None:
+            response.headers["Server-Timing"] = trace.serverTiming()
+        return response
+
+    @app.get("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.render(metricsCollectors), mimetype="text/plain; version=0.0.4")
+
+    # API routes reachable without a session; every other /api/* call must present one.
+    publicEndpoints = {"register", "login", "logout"}
+
+    @app.before_request
+    def require_session():
+        if not request.path.startswith("/api/") or request.endpoint in publicEndpoints:
+            return None
+        
+        data = request.get_json(silent=True) if request.is_json else None
+        data = data if isinstance(data, dict) else {}
+        sessionId = (
+            request.headers.get("X-Session-Id")
+            or request.args.get("sessionId")
+            or data.get("sessionId")
+            or ""
+        )
+        
+        userId = authService.resolveSession(sessionId)
+        if not userId:
+            return jsonify({"error": "Not authenticated"}), 401
+        
+        claimed = request.args.get("userId") or data.get("userId")
+        if claimed and claimed != userId:
+            return jsonify({"error": "Session does not belong to this user"}), 403
+        
+        g.userId = userId
+        return None
 
     @app.get("/")
     def index():
@@ -46,6 +245,8 @@ def create_app():
                 data.get("nickname", "")
             )
             return jsonify(result)
+        except HasherBusyError as e:
+            return jsonify({"error": str(e)}), 503
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
@@ -58,6 +259,8 @@ def create_app():
                 data.get("password", "")
             )
             return jsonify(result)
+        except HasherBusyError as e:
+            return jsonify({"error": str(e)}), 503
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
@@ -75,7 +278,7 @@ def create_app():
         data = request.get_json(force=True) or {}
         try:
             result = accountController.updateProfile(
-                data.get("userId", ""),
+                g.userId,
                 data.get("data") or {}
             )
             return jsonify(result)
@@ -84,35 +287,46 @@ def create_app():
 
     @app.post("/api/conversations")
     def create_conversation():
-        data = request.get_json(force=True) or {}
         try:
-            result = conversationController.createConversation(data.get("userId", ""))
+            result = conversationController.createConversation(g.userId)
             return jsonify(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.get("/api/conversations")
     def get_history():
-        userId = request.args.get("userId", "")
         try:
-            conversations = conversationController.getHistory(userId)
-            return jsonify({"conversations": conversations})
+            result = conversationController.getHistoryPage(
+                g.userId,
+                request.args.get("limit", type=int),
+                request.args.get("cursor")
+            )
+            return jsonify(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.get("/api/conversations/<conversationId>")
     def get_details(conversationId: str):
         try:
-            result = conversationController.getDetails(conversationId)
+            result = conversationController.getDetails(
+                conversationId,
+                g.userId,
+                request.args.get("limit", type=int),
+                request.args.get("cursor")
+            )
             return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.delete("/api/conversations/<conversationId>")
     def delete_conversation(conversationId: str):
         try:
-            result = conversationController.delete(conversationId)
+            result = conversationController.delete(conversationId, g.userId)
             return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
@@ -120,9 +334,19 @@ def create_app():
     def first_title(conversationId: str):
         data = request.get_json(force=True) or {}
         try:
-            title = conversationController.processFirstMessage(data.get("text", ""))
-            db.updateTitle(conversationId, title)
-            return jsonify({"title": title})
+            result = conversationController.processFirstMessage(conversationId, data.get("text", ""), g.userId)
+            return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.get("/api/conversations/<conversationId>/title")
+    def get_title(conversationId: str):
+        try:
+            return jsonify(conversationController.getTitle(conversationId, g.userId))
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
@@ -130,30 +354,122 @@ def create_app():
     def send_message():
         data = request.get_json(force=True) or {}
         try:
-            messageController._setActive(
+            result = messageController.sendMessage(
+                data.get("conversationId", ""),
+                g.userId,
+                data.get("text", ""),
+                bool(data.get("deferFeedback", deferFeedbackDefault))
+            )
+            return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except LLMBusyError as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.post("/api/messages/retry")
+    def retry_message():
+        data = request.get_json(force=True) or {}
+        try:
+            result = messageController.retry(
                 data.get("conversationId", ""),
-                data.get("userId", "")
+                g.userId,
+                bool(data.get("deferFeedback", deferFeedbackDefault))
             )
-            
-            result = messageController.sendMessage(data.get("text", ""))
             return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except LLMBusyError as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.post("/api/messages/send-stream")
+    def send_message_stream():
+        """Streaming variant of /api/messages/send: one JSON event per line (NDJSON)"""
+        data = request.get_json(force=True) or {}
+        try:
+            events = messageController.processMessageStream(
+                data.get("conversationId", ""),
+                g.userId,
+                data.get("text", ""),
+                bool(data.get("deferFeedback", deferFeedbackDefault))
+            )
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+        
+        def ndjson():
+            try:
+                for event in events:
+                    yield json.dumps(event) + "\n"
+            finally:
+                # Runs when the client disconnects too: stops the turn instead of finishing it unseen.
+                events.close()
+        
+        return Response(
+            stream_with_context(ndjson()),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.post("/api/messages/cancel")
+    def cancel_message():
+        """Stop the conversation's turn in progress (the reply is not saved)"""
+        data = request.get_json(force=True) or {}
+        try:
+            return jsonify(messageController.cancelInput(data.get("conversationId", ""), g.userId))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.post("/api/messages/interim")
+    def interim_message():
+        """HTTP fallback for the interim-transcript channel (same events as /api/ws/interim)"""
+        data = request.get_json(force=True) or {}
+        try:
+            return jsonify(messageController.interimEvent(g.userId, data))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    if Sock is not None:
+        sock = Sock(app)
+        
+        @sock.route("/api/ws/interim")
+        def interim_channel(ws):
+            """Interim transcripts while the learner speaks: one JSON event in, one JSON reply out"""
+            userId = g.userId
+            while True:
+                raw = ws.receive()
+                if raw is None:
+                    break
+                try:
+                    reply = messageController.interimEvent(userId, json.loads(raw))
+                except Exception as e:
+                    reply = {"error": str(e)}
+                ws.send(json.dumps(reply))
+
+    @app.get("/api/messages/<messageId>/feedback")
+    def get_feedback(messageId: str):
+        """Scores and tips of a turn sent with deferFeedback: {"status": "pending" | "ready" | "failed", ...}"""
+        try:
+            return jsonify(feedbackStore.get(messageId, g.userId))
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.get("/api/profile/statistics")
     def profile_stats():
-        userId = request.args.get("userId", "")
         try:
-            result = profileController.getStatistics(userId)
+            result = profileController.getStatistics(g.userId)
             return jsonify(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.get("/api/settings/load")
     def load_settings():
-        userId = request.args.get("userId", "")
         try:
-            result = settingsController.loadVoiceSettings(userId)
+            result = settingsController.loadVoiceSettings(g.userId)
             return jsonify(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
@@ -169,16 +485,26 @@ def create_app():
         data = request.get_json(force=True) or {}
         try:
             result = settingsController.saveVoicePreference(
-                data.get("userId", ""),
+                g.userId,
                 data.get("voiceId", "")
             )
             return jsonify(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
+    @app.cli.command("rebuild-stats")
+    @click.option("--user", "userId", default=None, help="Only rebuild this user's row")
+    def rebuild_stats(userId):
+        """Backfill/rebuild the user_stats aggregates from existing data"""
+        count = db.rebuildUserStats(userId)
+        click.echo(f"Rebuilt statistics for {count} user(s)")
+
     return app
 
-app = create_app()
+# Pool workers are spawned, and a spawned process re-imports the main script as
+# __mp_main__; under "python app.py" it must not build a second app.
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000, debug=True)
\ No newline at end of file
+    app.run(host="127.0.0.1", port=5000, debug=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""ASGI serving mode.
+
+The chat-turn routes (/api/messages/send, /send-stream, /retry, /cancel) and the
+interim-transcript WebSocket (/api/ws/interim) are served by a Quart app that
+awaits Postgres (psycopg 3 async pool) and Ollama (httpx), so a turn waiting on
+the model holds no thread. Every other route is the unchanged
+Flask app from app.py, run on a thread pool through a2wsgi.
+
+    hypercorn asgi_app:app --bind 127.0.0.1:5000
+    uvicorn asgi_app:app --port 5000
+
+Needs quart, a2wsgi, httpx, psycopg[binary] and psycopg_pool in addition to the
+sync requirements. The sync mode (python app.py / any WSGI server on app:app)
+is unaffected.
+"""
+from __future__ import annotations
+import json
+import os
+from a2wsgi import WSGIMiddleware
+from quart import Quart, Response, g, request, jsonify, websocket
+from app import app as flaskApp
+from llm_scheduler import LLMBusyError
+from async_database import AsyncDatabase
+from database import ConversationNotFoundError
+from async_message_controller import AsyncMessageController
+import metrics
+
+def create_asgi_app(syncApp=flaskApp):
+    services = syncApp.extensions["echera"]
+    authService = services["authService"]
+    aiService = services["aiService"]
+
+    asyncDb = AsyncDatabase(
+        services["connectionString"],
+        minConnections=int(os.getenv("ASYNC_DB_POOL_MIN", "1")),
+        maxConnections=int(os.getenv("ASYNC_DB_POOL_MAX", "20")),
+        checkoutTimeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        maxIdleSeconds=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        contextCache=services["contextCache"],
+    )
+    messageController = AsyncMessageController(
+        services["db"], asyncDb, aiService, services["mlEngine"],
+        scoringThreads=int(os.getenv("ASYNC_SCORING_THREADS", "8")),
+        titleJobs=services["titleJobs"],
+        feedbackStore=services["feedbackStore"],
+        summaryJobs=services["summaryJobs"],
+        interimAnalyzer=services["interimAnalyzer"],
+        speculation=services["speculation"],
+    )
+    deferFeedbackDefault = services["deferFeedbackDefault"]
+
+    # /metrics is served by the Flask app; add the async side's gauges to it.
+    services["metricsCollectors"]["async_db_pool"] = asyncDb.poolStats
+    services["metricsCollectors"]["async_pipeline"] = messageController.pipelineStats
+    services["metricsCollectors"]["async_cancellation"] = messageController.cancellationStats
+
+    app = Quart(__name__)
+    # Streams end when the model stops producing; AIService enforces the per-chunk timeout.
+    app.config["RESPONSE_TIMEOUT"] = None
+
+    @app.before_serving
+    async def startup():
+        await asyncDb.open()
+        if services["residency"] is not None:
+            services["residency"].start()
+
+    @app.after_serving
+    async def shutdown():
+        await asyncDb.close()
+        await aiService.aclose()
+
+    @app.before_request
+    async def start_trace():
+        metrics.startRequest()
+
+    @app.after_request
+    async def finish_trace(response):
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        trace = metrics.finishRequest(route, request.method, response.status_code)
+        if trace is not None:
+            response.headers["Server-Timing"] = trace.serverTiming()
+        return response
+
+    @app.before_request
+    async def require_session():
+        data = await request.get_json(silent=True) if request.is_json else None
+        data = data if isinstance(data, dict) else {}
+        sessionId = (
+            request.headers.get("X-Session-Id")
+            or request.args.get("sessionId")
+            or data.get("sessionId")
+            or ""
+        )
+        
+        userId = await authService.resolveSessionAsync(sessionId, asyncDb)
+        if not userId:
+            return jsonify({"error": "Not authenticated"}), 401
+        
+        claimed = request.args.get("userId") or data.get("userId")
+        if claimed and claimed != userId:
+            return jsonify({"error": "Session does not belong to this user"}), 403
+        
+        g.userId = userId
+        return None
+
+    @app.post("/api/messages/send")
+    async def send_message():
+        data = await request.get_json(force=True) or {}
+        try:
+            result = await messageController.sendMessageAsync(
+                data.get("conversationId", ""),
+                g.userId,
+                data.get("text", ""),
+                bool(data.get("deferFeedback", deferFeedbackDefault))
+            )
+            return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except LLMBusyError as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.post("/api/messages/retry")
+    async def retry_message():
+        data = await request.get_json(force=True) or {}
+        try:
+            result = await messageController.retryAsync(
+                data.get("conversationId", ""),
+                g.userId,
+                bool(data.get("deferFeedback", deferFeedbackDefault))
+            )
+            return jsonify(result)
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except LLMBusyError as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.post("/api/messages/send-stream")
+    async def send_message_stream():
+        data = await request.get_json(force=True) or {}
+        try:
+            events = await messageController.processMessageStreamAsync(
+                data.get("conversationId", ""),
+                g.userId,
+                data.get("text", ""),
+                bool(data.get("deferFeedback", deferFeedbackDefault))
+            )
+        except ConversationNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+        
+        async def ndjson():
+            try:
+                async for event in events:
+                    yield json.dumps(event) + "\n"
+            finally:
+                await events.aclose()
+        
+        return Response(
+            ndjson(),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.post("/api/messages/cancel")
+    async def cancel_message():
+        # Turns served here are tracked by this controller, not the Flask app's.
+        data = await request.get_json(force=True) or {}
+        try:
+            return jsonify(messageController.cancelInput(data.get("conversationId", ""), g.userId))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.websocket("/api/ws/interim")
+    async def interim_channel():
+        # before_request hooks do not run for websockets; the session comes from the query string.
+        userId = await authService.resolveSessionAsync(websocket.args.get("sessionId", ""), asyncDb)
+        if not userId:
+            await websocket.close(1008)
+            return
+        
+        while True:
+            raw = await websocket.receive()
+            try:
+                reply = messageController.interimEvent(userId, json.loads(raw))
+            except Exception as e:
+                reply = {"error": str(e)}
+            await websocket.send(json.dumps(reply))
+
+    asyncPaths = {rule.rule for rule in app.url_map.iter_rules() if rule.endpoint != "static"}
+    syncApp = WSGIMiddleware(syncApp, workers=int(os.getenv("ASGI_SYNC_THREADS", "16")))
+
+    async def router(scope, receive, send):
+        # Lifespan goes to Quart so the async pool opens/closes with the server.
+        if scope["type"] == "lifespan" or scope.get("path") in asyncPaths:
+            await app(scope, receive, send)
+        else:
+            await syncApp(scope, receive, send)
+
+    return router
+
+app = create_asgi_app()
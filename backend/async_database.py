@@ -0,0 +1,141 @@
+from __future__ import annotations
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Tuple
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from models import ConversationSummary, Session, Message, Scores
+from context_cache import ConversationContextCache
+import metrics
+from database import ConversationNotFoundError, _SAVE_TURN, _LOCK_CONVERSATION, _TURN_CONTEXT, _FIND_SESSION, _REPLACE_TITLE, _saveTurnParams
+
+class AsyncUnitOfWork:
+    """Async counterpart of UnitOfWork: writes of one chat turn in one transaction"""
+
+    def __init__(self, conn, contextCache: Optional[ConversationContextCache] = None):
+        self._conn = conn
+        self._contextCache = contextCache
+        self._locked: Dict[str, int] = {}
+        self._afterCommit = []
+
+    async def lockConversation(self, conversationId: str, userId: str) -> int:
+        async with self._conn.cursor() as cur:
+            with metrics.span("db"):
+                await cur.execute(_LOCK_CONVERSATION, (conversationId, userId))
+                row = await cur.fetchone()
+            if not row:
+                raise ConversationNotFoundError("Conversation not found")
+            self._locked[conversationId] = int(row[0])
+            return int(row[0])
+
+    async def saveTurn(self, conversationId: str, userText: str, aiText: str,
+                       scores: Scores, tips: List[str]) -> Tuple[Message, Message]:
+        async with self._conn.cursor() as cur:
+            with metrics.span("db"):
+                await cur.execute(_SAVE_TURN, _saveTurnParams(conversationId, userText, aiText, scores, tips))
+                userMessageId, userTs, aiMessageId, aiTs = await cur.fetchone()
+            saved = (
+                Message(str(userMessageId), conversationId, userText, "user", userTs),
+                Message(str(aiMessageId), conversationId, aiText, "ai", aiTs),
+            )
+        
+            if self._contextCache is not None:
+                cache = self._contextCache
+                expected = self._locked.get(conversationId)
+                self._afterCommit.append(lambda: cache.append(conversationId, list(saved), expected))
+            return saved
+
+    async def replaceTitle(self, conversationId: str, userId: str, old: str, new: str) -> bool:
+        async with self._conn.cursor() as cur:
+            with metrics.span("db"):
+                await cur.execute(_REPLACE_TITLE, (new, conversationId, userId, old))
+            return cur.rowcount > 0
+
+class AsyncDatabase:
+    """psycopg 3 async pool for the queries on the chat-turn path (ASGI mode).
+
+    Runs the same SQL as Database and shares its context cache, so both can
+    serve the same process; everything else stays on the sync Database.
+    """
+
+    def __init__(self, connectionString: str, minConnections: int = 1, maxConnections: int = 20,
+                 checkoutTimeout: float = 10.0, maxIdleSeconds: float = 300.0,
+                 contextCache: Optional[ConversationContextCache] = None):
+        self.connectionString = connectionString
+        self.contextCache = contextCache
+        self._pool = AsyncConnectionPool(
+            connectionString,
+            min_size=minConnections,
+            max_size=maxConnections,
+            timeout=checkoutTimeout,
+            max_idle=maxIdleSeconds,
+            open=False,
+        )
+
+    async def open(self):
+        await self._pool.open()
+
+    async def close(self):
+        await self._pool.close()
+
+    @metrics.counters("usage_ms", "requests_num", "requests_queued", "requests_wait_ms", "requests_errors", "returns_bad",
+                      "connections_num", "connections_ms", "connections_errors", "connections_lost")
+    def poolStats(self) -> Dict[str, Any]:
+        return self._pool.get_stats()
+
+    @asynccontextmanager
+    async def unitOfWork(self):
+        # pool.connection() commits on a clean exit and rolls back (or discards a
+        # broken connection) on error.
+        async with self._pool.connection() as conn:
+            uow = AsyncUnitOfWork(conn, self.contextCache)
+            yield uow
+        
+        for callback in uow._afterCommit:
+            callback()
+
+    async def getTurnContext(self, conversationId: str, userId: str,
+                             count: int) -> Tuple[int, List[Message], ConversationSummary]:
+        if self.contextCache is not None:
+            cached = self.contextCache.get(conversationId, count, userId)
+            if cached is not None:
+                return cached
+        
+        async with self._pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                with metrics.span("db"):
+                    await cur.execute(_TURN_CONTEXT, (count, conversationId, userId))
+                    rows = await cur.fetchall()
+        
+        if not rows:
+            raise ConversationNotFoundError("Conversation not found")
+        rows.reverse()
+        messageCount = int(rows[0]["messageCount"])
+        summary = ConversationSummary(rows[0]["summary"], int(rows[0]["summaryCount"]))
+        messages = [Message(
+            messageId=str(r["messageId"]),
+            conversationId=conversationId,
+            content=r["content"],
+            senderId=r["senderId"],
+            timestamp=r["timestamp"],
+        ) for r in rows if r["messageId"] is not None]
+        
+        if self.contextCache is not None and count >= self.contextCache.window:
+            self.contextCache.fill(conversationId, userId, messageCount, messages, summary)
+        return messageCount, messages, summary
+
+    async def findSession(self, sessionId: str) -> Optional[Session]:
+        async with self._pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                with metrics.span("db"):
+                    await cur.execute(_FIND_SESSION, (sessionId,))
+                    r = await cur.fetchone()
+        
+        if not r:
+            return None
+        return Session(
+            sessionId=str(r["sessionId"]),
+            userId=str(r["userId"]),
+            createdAt=r["createdAt"],
+            expiresAt=r["expiresAt"],
+            invalidatedAt=r["invalidatedAt"],
+        )
@@ -0,0 +1,180 @@
+from __future__ import annotations
+from typing import Union, AsyncIterator, Dict, Any, List, Optional, Tuple
+import asyncio
+import time
+from ai_service import AIService
+from llm_scheduler import LLMBusyError
+from async_database import AsyncDatabase
+from database import Database, DEFAULT_TITLE
+from models import ConversationSummary, Message
+from nlp_engine import NLPEngine
+from nlp_service import NLPScoringService
+from title_jobs import TitleJobQueue
+from summary_jobs import SummaryJobQueue
+from interim_analysis import InterimAnalyzer
+from speculation import SpeculativeResponder
+from feedback_store import FeedbackStore
+from message_controller import MessageController, TurnCancelledError, _ActiveTurn, _ReplyStream
+
+class AsyncMessageController(MessageController):
+    """MessageController for ASGI mode: the turn path awaits Postgres and Ollama instead of holding a thread.
+
+    NLP scoring still runs on the scoring executor / process pool and is awaited via its future.
+    """
+
+    def __init__(self, database: Database, asyncDatabase: AsyncDatabase, aiService: AIService,
+                 mlEngine: Union[NLPEngine, NLPScoringService], scoringThreads: int = 4,
+                 titleJobs: Optional[TitleJobQueue] = None, feedbackStore: Optional[FeedbackStore] = None,
+                 summaryJobs: Optional[SummaryJobQueue] = None, interimAnalyzer: Optional[InterimAnalyzer] = None,
+                 speculation: Optional[SpeculativeResponder] = None):
+        super().__init__(database, aiService, mlEngine, scoringThreads, titleJobs, feedbackStore, summaryJobs,
+                         interimAnalyzer, speculation)
+        self.asyncDatabase = asyncDatabase
+
+    async def sendMessageAsync(self, conversationId: str, userId: str, text: str, deferFeedback: bool = False):
+        return await self.processMessageAsync(conversationId, userId, text, deferFeedback)
+
+    async def retryAsync(self, conversationId: str, userId: str, deferFeedback: bool = False):
+        with self._retryLock:
+            owner, text = self._lastTexts.get(conversationId, ("", ""))
+        if not text or owner != userId:
+            raise ValueError("Nothing to retry")
+        return await self.processMessageAsync(conversationId, userId, text, deferFeedback)
+
+    async def _loadTurnAsync(self, conversationId: str, userId: str,
+                             text: str) -> Tuple[int, List[Message], ConversationSummary]:
+        if not conversationId:
+            raise ValueError("No active conversation")
+        turn = await self.asyncDatabase.getTurnContext(conversationId, userId, self.contextBuilder.window)
+        return self._turnContext(turn, text)
+
+    async def _replyTokensAsync(self, text: str, context: List[Message], userId: str, summary: ConversationSummary,
+                                speculation=None) -> AsyncIterator[str]:
+        if speculation is not None:
+            produced = False
+            try:
+                async for token in speculation.replayAsync():
+                    produced = True
+                    yield token
+            finally:
+                self._endReplay(speculation)
+            if self._replayAnswered(speculation, produced):
+                return
+        async for token in self.aiService.streamResponseAsync(text, context, userId, summary.text):
+            yield token
+
+    async def _saveTurnAsync(self, active: _ActiveTurn, aiText: str, sc, tips,
+                             summary: Optional[ConversationSummary] = None) -> Tuple[str, Optional[str]]:
+        conversationId = active.conversationId
+        async with self.asyncDatabase.unitOfWork() as uow:
+            count = await uow.lockConversation(conversationId, active.userId)
+            self._checkLimit(count)
+            userMessage, _ = await uow.saveTurn(conversationId, active.text, aiText, sc, tips)
+            title = self._firstTitle(count, active.text)
+            if title and not await uow.replaceTitle(conversationId, active.userId, DEFAULT_TITLE, title):
+                title = None
+        
+        self._turnSaved(active, count, title, summary)
+        return userMessage.messageId, title
+
+    async def _scoringResultAsync(self, active: _ActiveTurn):
+        try:
+            return await asyncio.wrap_future(active.scoring)
+        except asyncio.CancelledError:
+            # Raised both when cancelInput() dropped the scoring job and when this task is cancelled.
+            if self._scoringDropped(active):
+                raise TurnCancelledError("The message was cancelled")
+            raise
+
+    async def processMessageAsync(self, conversationId: str, userId: str, text: str, deferFeedback: bool = False):
+        messageCount, context, summary = await self._loadTurnAsync(conversationId, userId, text)
+        
+        active = self._startTurn(conversationId, userId, text)
+        speculation = self._claimSpeculation(conversationId, userId, text, messageCount)
+        tokens = self._replyTokensAsync(text, context, userId, summary, speculation)
+        parts = []
+        
+        active.llmStart = time.monotonic()
+        try:
+            # Streamed internally too, so a cancel stops the model request at the next token.
+            async for token in tokens:
+                active.check()
+                parts.append(token)
+            self._replyFinished(active)
+            aiText = "".join(parts).strip()
+            
+            deferred = self._deferScoring(active.scoring, deferFeedback)
+            sc, tips = (None, []) if deferred else await self._scoringResultAsync(active)
+            self._releaseTurn(active)
+        except LLMBusyError:
+            active.scoring.cancel()
+            raise
+        except TurnCancelledError:
+            await tokens.aclose()
+            self._abortTurn(active, len(parts))
+            raise
+        except asyncio.CancelledError:
+            # The client disconnected while the turn was running.
+            active.cancel("disconnected")
+            await tokens.aclose()
+            self._abortTurn(active, len(parts))
+            raise
+        finally:
+            self._untrackTurn(active)
+        
+        messageId, title = await self._saveTurnAsync(active, aiText, sc, tips, summary)
+        return self._finishTurn(active, aiText, messageId, title, sc, tips, deferred)
+
+    async def processMessageStreamAsync(self, conversationId: str, userId: str, text: str,
+                                        deferFeedback: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Validate the turn up front, then return an async iterator of the same events as processMessageStream"""
+        messageCount, context, summary = await self._loadTurnAsync(conversationId, userId, text)
+        speculation = self._claimSpeculation(conversationId, userId, text, messageCount)
+        return self._streamTurnAsync(conversationId, userId, text, context, summary, deferFeedback, speculation)
+
+    async def _streamTurnAsync(self, conversationId: str, userId: str, text: str, context: List[Message],
+                               summary: ConversationSummary, deferFeedback: bool = False,
+                               speculation=None) -> AsyncIterator[Dict[str, Any]]:
+        active = self._startTurn(conversationId, userId, text)
+        reply = _ReplyStream(active.start)
+        tokens = self._replyTokensAsync(text, context, userId, summary, speculation)
+        active.llmStart = time.monotonic()
+        
+        try:
+            async for token in tokens:
+                active.check()
+                for event in reply.feed(token):
+                    yield event
+            self._replyFinished(active)
+            for event in reply.flush():
+                yield event
+            
+            deferred = self._deferScoring(active.scoring, deferFeedback)
+            sc, tips = (None, []) if deferred else await self._scoringResultAsync(active)
+            self._releaseTurn(active)
+            messageId, title = await self._saveTurnAsync(active, reply.text, sc, tips, summary)
+        except LLMBusyError as e:
+            active.scoring.cancel()
+            yield {"type": "error", "error": str(e)}
+            return
+        except TurnCancelledError as e:
+            await tokens.aclose()
+            self._abortTurn(active, len(reply.parts))
+            yield {"type": "cancelled", "error": str(e)}
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away: the server cancels the response task or closes the iterator.
+            active.cancel("disconnected")
+            await tokens.aclose()
+            self._abortTurn(active, len(reply.parts))
+            raise
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+            return
+        finally:
+            self._untrackTurn(active)
+        
+        done = self._finishTurn(active, reply.text, messageId, title, sc, tips, deferred)
+        done["type"] = "done"
+        done["ttftMs"] = reply.ttftMs
+        yield done
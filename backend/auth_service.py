@@ -1,12 +1,18 @@
 from __future__ import annotations
 from datetime import datetime, timedelta
-import os, uuid, hashlib, hmac
+from typing import Optional
+import os, uuid
 from database import Database
 from models import Session
+from password_hasher import PasswordHasher
+from session_cache import SessionCache
 
 class AuthService:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, sessionCache: Optional[SessionCache] = None,
+                 hasher: Optional[PasswordHasher] = None):
         self.database = database
+        self.sessionCache = sessionCache or SessionCache()
+        self.hasher = hasher or PasswordHasher(workers=0)
         self._pepper = os.getenv("AUTH_PEPPER", "pepper")
 
     def authenticate(self, email: str, password: str) -> bool:
@@ -15,34 +21,24 @@ class AuthService:
         except Exception:
             return False
         
-        return self.validatePassword(password, user.passwordHash)
+        ok, needsRehash = self.hasher.verify(self._secret(password), user.passwordHash)
+        if ok and needsRehash:
+            # Upgrade hashes made with an older algorithm or cost while we have the plaintext.
+            try:
+                self.database.updateUser(user.userId, {"passwordHash": self.hashPassword(password)})
+            except Exception as e:
+                print(f"Password rehash failed for {user.userId}: {e}")
+        
+        return ok
 
     def hashPassword(self, password: str) -> str:
-        salt = os.urandom(16)
-        dk = hashlib.pbkdf2_hmac(
-            "sha256",
-            (password + self._pepper).encode("utf-8"),
-            salt,
-            120_000  
-        )
-        return salt.hex() + "$" + dk.hex()
+        return self.hasher.hash(self._secret(password))
 
     def validatePassword(self, password: str, hash: str) -> bool:
-        try:
-            salt_hex, dk_hex = hash.split("$", 1)
-            salt = bytes.fromhex(salt_hex)
-            expected = bytes.fromhex(dk_hex)
-            
-            got = hashlib.pbkdf2_hmac(
-                "sha256",
-                (password + self._pepper).encode("utf-8"),
-                salt,
-                120_000
-            )
-            
-            return hmac.compare_digest(got, expected)
-        except Exception:
-            return False
+        return self.hasher.verify(self._secret(password), hash)[0]
+
+    def _secret(self, password: str) -> bytes:
+        return (password + self._pepper).encode("utf-8")
 
     def createSession(self, userId: str) -> Session:
         sessionId = str(uuid.uuid4())
@@ -50,6 +46,7 @@ class AuthService:
         expiresAt = createdAt + timedelta(days=7)  
         
         self.database._saveSession(sessionId, userId, createdAt, expiresAt)
+        self.sessionCache.put(sessionId, userId, expiresAt)
         
         return Session(
             sessionId=sessionId,
@@ -59,4 +56,43 @@ class AuthService:
         )
 
     def endSession(self, sessionId: str):
-        self.database._invalidateSession(sessionId)
\ No newline at end of file
+        self.database._invalidateSession(sessionId)
+        self.sessionCache.invalidate(sessionId)
+
+    def resolveSession(self, sessionId: str) -> Optional[str]:
+        """Return the userId of a valid session, or None; usually answered from the session cache"""
+        sessionId = self._normalizeSessionId(sessionId)
+        if not sessionId:
+            return None
+        
+        found, userId = self.sessionCache.get(sessionId)
+        if found:
+            return userId
+        
+        return self._remember(sessionId, self.database.findSession(sessionId))
+
+    async def resolveSessionAsync(self, sessionId: str, database) -> Optional[str]:
+        """resolveSession for ASGI mode; database is an AsyncDatabase"""
+        sessionId = self._normalizeSessionId(sessionId)
+        if not sessionId:
+            return None
+        
+        found, userId = self.sessionCache.get(sessionId)
+        if found:
+            return userId
+        
+        return self._remember(sessionId, await database.findSession(sessionId))
+
+    def _normalizeSessionId(self, sessionId: str) -> Optional[str]:
+        try:
+            return str(uuid.UUID(sessionId or ""))
+        except ValueError:
+            return None
+
+    def _remember(self, sessionId: str, session: Optional[Session]) -> Optional[str]:
+        if session is None or not session.isValid():
+            self.sessionCache.putNegative(sessionId)
+            return None
+        
+        self.sessionCache.put(sessionId, session.userId, session.expiresAt)
+        return session.userId
@@ -0,0 +1,155 @@
+"""Concurrency stress check for the shared MessageController.
+
+Many threads send turns to many conversations through ONE controller, the way
+threaded Flask workers do. The database and LLM are replaced by in-memory
+stand-ins that echo a per-conversation marker after a random delay, so any state
+leaking between requests shows up as a reply, context message or retry landing in
+the wrong conversation. Exits non-zero if any violation is found.
+
+Run from the backend directory:
+
+    python -m benchmarks.concurrency_stress --threads 32 --conversations 16 --turns 20
+"""
+from __future__ import annotations
+import argparse
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+from message_controller import MessageController
+from context_builder import ContextBuilder
+from models import ConversationSummary, Message, Scores
+
+class MemoryDatabase:
+    """Just enough of Database for the send path, with a lock standing in for row locks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages: Dict[str, List[Message]] = {}
+
+    def addConversation(self, conversationId: str):
+        self.messages[conversationId] = []
+
+    def getTurnContext(self, conversationId: str, userId: str, count: int) -> Tuple[int, List[Message], ConversationSummary]:
+        with self._lock:
+            msgs = self.messages[conversationId]
+            return len(msgs), list(msgs[-count:]), ConversationSummary()
+
+    @contextmanager
+    def unitOfWork(self):
+        with self._lock:
+            yield self
+
+    def lockConversation(self, conversationId: str, userId: str) -> int:
+        return len(self.messages[conversationId])
+
+    def saveTurn(self, conversationId: str, userText: str, aiText: str, scores: Scores, tips: List[str]):
+        now = datetime.utcnow()
+        pair = (
+            Message(str(uuid.uuid4()), conversationId, userText, "user", now),
+            Message(str(uuid.uuid4()), conversationId, aiText, "ai", now),
+        )
+        self.messages[conversationId].extend(pair)
+        return pair
+
+    def replaceTitle(self, conversationId: str, userId: str, old: str, new: str) -> bool:
+        return True
+
+class EchoAIService:
+    contextBuilder = ContextBuilder()
+
+    def streamResponse(self, userText: str, context: List[Message], userId: str = "", summary: str = "") -> Iterator[str]:
+        time.sleep(random.uniform(0, 0.003))
+        owners = sorted({m.conversationId for m in context})
+        yield f"echo:{userText}"
+        yield f"|context:{','.join(owners)}"
+
+    def fallbackTitle(self, text: str) -> str:
+        return text[:31]
+
+class FixedScorer:
+    def evaluate(self, text: str):
+        time.sleep(random.uniform(0, 0.002))
+        return Scores(fluency=3, wordChoice=3, grammar=3), []
+
+def _marker(conversationId: str, userId: str, turn: int) -> str:
+    return f"[{conversationId}/{userId}] turn {turn}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--conversations", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=20, help="turns per thread")
+    args = parser.parse_args()
+
+    db = MemoryDatabase()
+    controller = MessageController(db, EchoAIService(), FixedScorer(), scoringThreads=8)
+    owners = {}
+    for i in range(args.conversations):
+        cid = str(uuid.uuid4())
+        db.addConversation(cid)
+        owners[cid] = f"user{i}"
+
+    conversations = list(owners)
+    errors: List[str] = []
+    errorsLock = threading.Lock()
+
+    def fail(msg: str):
+        with errorsLock:
+            errors.append(msg)
+
+    def worker(n: int):
+        rng = random.Random(n)
+        for turn in range(args.turns):
+            cid = rng.choice(conversations)
+            userId = owners[cid]
+            text = _marker(cid, userId, turn)
+            try:
+                out = controller.sendMessage(cid, userId, text)
+            except ValueError as e:
+                if str(e) != MessageController.LIMIT_ERROR:
+                    fail(f"unexpected error: {e}")
+                continue
+            if not out["aiText"].startswith(f"echo:{text}|"):
+                fail(f"reply for {cid} was {out['aiText']!r}")
+            context = out["aiText"].split("|context:", 1)[1]
+            if context and context != cid:
+                fail(f"context for {cid} came from {context}")
+        
+            # Another user's retry must never replay this conversation's text.
+            other = rng.choice(conversations)
+            if owners[other] != userId:
+                try:
+                    controller.retry(cid, owners[other])
+                    fail(f"{owners[other]} retried a turn in {cid}")
+                except ValueError:
+                    pass
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - start
+
+    for cid, msgs in db.messages.items():
+        for m in msgs:
+            if m.conversationId != cid or f"[{cid}/" not in m.content:
+                fail(f"message {m.messageId} in {cid} belongs elsewhere: {m.content!r}")
+        if len(msgs) > MessageController.MAX_MESSAGES:
+            fail(f"{cid} has {len(msgs)} messages, over the limit")
+
+    saved = sum(len(m) for m in db.messages.values()) // 2
+    print(f"{saved} turns across {args.conversations} conversations from {args.threads} threads in {elapsed:.2f}s")
+    if errors:
+        for e in errors[:20]:
+            print("FAIL:", e)
+        raise SystemExit(f"{len(errors)} cross-conversation violation(s)")
+    print("OK: no messages crossed conversations")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+from typing import List
+
+# Learner-style messages of varied length and quality, including the kind of
+# lowercase, unpunctuated input the speech recognizer produces.
+LEARNER_MESSAGES: List[str] = [
+    "hello",
+    "I am fine thank you",
+    "yesterday i go to the market with my mother",
+    "What do you think about learning English with movies?",
+    "My favourite food is pizza because it is very delicious.",
+    "i like play football but my brother he like basketball more",
+    "Last summer we travelled to Istanbul and visited many beautiful places.",
+    "I want to improve my speaking. Sometimes I feel nervous when I talk to native speakers.",
+    "can you help me with my homework its about the history of england",
+    "I have been working as a software engineer for three years, and recently I started thinking about moving to London.",
+    "The weather today is quite cold, so I decided to stay at home and read a book about Japanese culture.",
+    "when i was child i lived in small village there was no internet and we play outside all day",
+    "In my opinion, technology makes our lives easier, but it also makes people more lonely. What is your opinion?",
+    "I went to the cinema with my friends last night. The film was boring, however the popcorn was amazing!",
+    (
+        "Honestly I think that the education system in my country needs to change. Students memorize a lot of "
+        "information for exams but they forget everything after. Teachers should focus on practical skills and "
+        "critical thinking instead of only grammar rules and vocabulary lists."
+    ),
+    (
+        "Yesterday morning I woke up late because my alarm did not ring. I ran to the bus stop, but the bus had "
+        "already left. Luckily my neighbour was driving to the city centre, so she gave me a lift. I arrived at "
+        "the office only ten minutes late and my manager did not notice."
+    ),
+]
+
+def corpus(size: int) -> List[str]:
+    return [LEARNER_MESSAGES[i % len(LEARNER_MESSAGES)] for i in range(size)]
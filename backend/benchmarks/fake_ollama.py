@@ -0,0 +1,263 @@
+"""Local stand-in for Ollama's /api/chat, for load tests and offline benchmarks.
+
+Answers both stream=false and stream=true (chunked NDJSON, one token per chunk)
+with configurable latency and token rate. It can also inject failures: HTTP
+errors, dropped connections and stalls longer than the client's read timeout.
+With --load-ms it also models residency: the first call after the keep_alive
+lease ran out pays the load time (reported as load_duration), an empty
+"messages" list only loads the model and keep_alive=0 unloads it.
+
+Run from the backend directory, then point the app at it:
+
+    python -m benchmarks.fake_ollama --port 11435 --ttft-ms 300 --tokens-per-sec 40 --error-rate 0.02
+    OLLAMA_ENDPOINT=http://127.0.0.1:11435/api/chat python app.py
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List
+
+WORDS = (
+    "that sounds really interesting and I would love to hear more about it "
+    "what do you usually do on weekends with your friends or family "
+    "your English is getting better every day so keep practicing like this"
+).split()
+
+class FakeOllamaConfig:
+    def __init__(self, ttftMs: float = 200.0, tokensPerSec: float = 50.0, replyWords: int = 30,
+                 jitter: float = 0.2, errorRate: float = 0.0, errorStatus: int = 503,
+                 dropRate: float = 0.0, stallRate: float = 0.0, stallSeconds: float = 12.0,
+                 loadMs: float = 0.0, defaultKeepAlive: float = 300.0):
+        self.ttftMs = ttftMs
+        self.tokensPerSec = tokensPerSec
+        self.replyWords = replyWords
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.dropRate = dropRate
+        self.stallRate = stallRate
+        self.stallSeconds = stallSeconds
+        self.loadMs = loadMs
+        self.defaultKeepAlive = defaultKeepAlive
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "streams": 0, "errors": 0, "drops": 0, "stalls": 0, "loads": 0, "unloads": 0}
+
+    def inc(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default (5) resets connections under a burst of clients.
+    request_queue_size = 1024
+
+    def __init__(self, address, config: FakeOllamaConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.stats = _Stats()
+        self.residencyLock = threading.Lock()
+        self.loadedUntil = 0.0
+
+def _reply(config: FakeOllamaConfig) -> List[str]:
+    words = [random.choice(WORDS) for _ in range(max(1, config.replyWords))]
+    words[0] = words[0].capitalize()
+    text = " ".join(words) + "."
+    tokens = text.split(" ")
+    return [tokens[0]] + [" " + t for t in tokens[1:]]
+
+def _keepAliveSeconds(value, default: float) -> float:
+    """Ollama's keep_alive: seconds as a number, or a duration such as "300s" / "5m" (negative: forever)"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        unit = next((u for u in ("ms", "s", "m", "h") if value.endswith(u)), "s")
+        seconds = float(value[:-len(unit)] if value.endswith(unit) else value) * units[unit]
+    return float("inf") if seconds < 0 else seconds
+
+def _jittered(seconds: float, jitter: float) -> float:
+    return max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter))
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._json(200, {"models": [{"name": "fake"}]})
+        elif self.path == "/stats":
+            with self.server.stats.lock:
+                self._json(200, dict(self.server.stats.counts))
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/chat":
+            self._json(404, {"error": "not found"})
+            return
+        
+        config: FakeOllamaConfig = self.server.config
+        stats: _Stats = self.server.stats
+        stats.inc("requests")
+        
+        roll = random.random()
+        if roll < config.dropRate:
+            stats.inc("drops")
+            self.close_connection = True
+            self.connection.close()
+            return
+        roll -= config.dropRate
+        if roll < config.errorRate:
+            stats.inc("errors")
+            self._json(config.errorStatus, {"error": "injected failure"})
+            return
+        roll -= config.errorRate
+        if roll < config.stallRate:
+            stats.inc("stalls")
+            time.sleep(config.stallSeconds)
+        
+        loadDuration = self._load(body)
+        if not body.get("messages"):
+            unloaded = body.get("keep_alive") == 0
+            self._json(200, {
+                "model": body.get("model", "fake"),
+                "message": {"role": "assistant", "content": ""},
+                "done_reason": "unload" if unloaded else "load",
+                "done": True,
+                "load_duration": loadDuration,
+            })
+            return
+        
+        tokens = _reply(config)
+        promptTokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        tokenDelay = 1.0 / config.tokensPerSec if config.tokensPerSec > 0 else 0.0
+        time.sleep(_jittered(config.ttftMs / 1000, config.jitter))
+        
+        if not body.get("stream"):
+            time.sleep(tokenDelay * (len(tokens) - 1))
+            self._json(200, {
+                "model": body.get("model", "fake"),
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "done": True,
+                "prompt_eval_count": promptTokens,
+                "eval_count": len(tokens),
+                "load_duration": loadDuration,
+            })
+            return
+        
+        stats.inc("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(_jittered(tokenDelay, config.jitter))
+                self._chunk({"message": {"role": "assistant", "content": token}, "done": False})
+            self._chunk({
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "prompt_eval_count": promptTokens,
+                "eval_count": len(tokens),
+                "load_duration": loadDuration,
+            })
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _load(self, body: Dict[str, Any]) -> int:
+        """Apply the request's keep_alive; sleep for the load if the model is not resident. Returns load_duration (ns)."""
+        server: FakeOllamaServer = self.server
+        config = server.config
+        if config.loadMs <= 0:
+            return 0
+        keepAlive = _keepAliveSeconds(body.get("keep_alive"), config.defaultKeepAlive)
+        with server.residencyLock:
+            if keepAlive == 0 and not body.get("messages"):
+                if server.loadedUntil:
+                    server.stats.inc("unloads")
+                server.loadedUntil = 0.0
+                return 0
+            cold = time.monotonic() >= server.loadedUntil
+            if cold:
+                # Concurrent requests wait for the same load, as they would on Ollama.
+                time.sleep(config.loadMs / 1000)
+                server.stats.inc("loads")
+            server.loadedUntil = time.monotonic() + keepAlive
+        return int(config.loadMs * 1e6) if cold else 50_000
+
+    def _chunk(self, data: Dict[str, Any]):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _json(self, status: int, data: Dict[str, Any]):
+        out = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+def start(config: FakeOllamaConfig, host: str = "127.0.0.1", port: int = 11435) -> FakeOllamaServer:
+    """Serve on a background thread (for benchmarks that embed the fake); returns the server"""
+    server = FakeOllamaServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="delay before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--reply-words", type=int, default=30)
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="close the connection without a response")
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=12.0)
+    parser.add_argument("--load-ms", type=float, default=0.0, help="model load time after the keep_alive lease ran out (0: always loaded)")
+    parser.add_argument("--keep-alive", type=float, default=300.0, help="lease in seconds when a request sends no keep_alive")
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        ttftMs=args.ttft_ms,
+        tokensPerSec=args.tokens_per_sec,
+        replyWords=args.reply_words,
+        jitter=args.jitter,
+        errorRate=args.error_rate,
+        errorStatus=args.error_status,
+        dropRate=args.drop_rate,
+        stallRate=args.stall_rate,
+        stallSeconds=args.stall_seconds,
+        loadMs=args.load_ms,
+        defaultKeepAlive=args.keep_alive,
+    )
+    server = FakeOllamaServer((args.host, args.port), config)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}/api/chat")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
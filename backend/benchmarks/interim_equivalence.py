@@ -0,0 +1,78 @@
+"""Interim analysis: same scores as a whole-text parse, and how much of the wait it saves.
+
+Every utterance is fed to InterimAnalyzer the way the recognizer finalizes speech, in
+several segments split mid-sentence, then sent. The scores and tips scoringFor()
+returns must equal NLPEngine.evaluate() of the whole sent text; any difference is
+printed and the run exits non-zero. Also reports the wait from send to scores, with
+and without the interim parse.
+
+Run from the backend directory:
+
+    python -m benchmarks.interim_equivalence --utterances 200 --segments 3
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import time
+from typing import List
+from nlp_engine import NLPEngine
+from interim_analysis import InterimAnalyzer, normalizeSpeech
+from benchmarks.corpus import corpus
+
+def _segments(text: str, count: int) -> List[str]:
+    """Finalized transcript after each recognizer segment (cumulative)"""
+    words = text.split()
+    step = max(1, len(words) // count)
+    cuts = list(range(step, len(words), step))[:count - 1] + [len(words)]
+    return [" ".join(words[:c]) for c in cuts]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--utterances", type=int, default=200)
+    parser.add_argument("--segments", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = NLPEngine("", cacheSize=0)
+    if not engine._nlp:
+        raise SystemExit("spaCy model en_core_web_sm is not installed (python -m spacy download en_core_web_sm)")
+    analyzer = InterimAnalyzer(engine)
+
+    # Two messages per utterance so most of them span a sentence boundary.
+    texts = corpus(args.utterances * 2)
+    utterances = [normalizeSpeech(texts[i] + " " + texts[i + 1]) for i in range(0, len(texts) - 1, 2)]
+
+    mismatches = 0
+    warm: List[float] = []
+    cold: List[float] = []
+    for i, text in enumerate(utterances):
+        userId = f"bench-{i}"
+        for final in _segments(text, args.segments):
+            analyzer.update(userId, final)
+        # The learner pauses before sending: let the interim parse finish (one parser thread, in order).
+        analyzer._executor.submit(lambda: None).result()
+        
+        start = time.perf_counter()
+        fut = analyzer.scoringFor(userId, text)
+        got = fut.result() if fut is not None else None
+        warm.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        expected = engine.evaluate(text)
+        cold.append(time.perf_counter() - start)
+        
+        if got != expected:
+            mismatches += 1
+            print(f"MISMATCH: {text!r}\n  interim: {got}\n  whole:   {expected}")
+
+    print(f"{'path':<10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for name, xs in (("interim", warm), ("whole", cold)):
+        xs.sort()
+        print(f"{name:<10}{xs[len(xs) // 2] * 1000:>10.2f}{xs[int(len(xs) * 0.95) - 1] * 1000:>10.2f}"
+              f"{statistics.mean(xs) * 1000:>10.2f}")
+    print("analyzer stats:", analyzer.stats())
+    if mismatches:
+        raise SystemExit(f"FAIL: {mismatches} of {len(utterances)} utterances scored differently from a whole-text parse")
+    print(f"OK: {len(utterances)} multi-segment utterances scored the same as a whole-text parse")
+
+if __name__ == "__main__":
+    main()
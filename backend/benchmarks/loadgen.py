@@ -0,0 +1,190 @@
+"""End-to-end load generator for a running backend.
+
+Each virtual user does the following over HTTP, like the frontend:
+- registers and logs in
+- creates a conversation
+- sends the first message and asks for a title
+- keeps chatting, starting a new conversation at the message limit
+- every few turns loads the history and profile statistics
+The report gives throughput and p50/p95/p99 latency per endpoint.
+
+Typical offline setup, from the backend directory:
+
+    psql -f ../schema.sql seng321                                   # fresh local Postgres
+    python -m benchmarks.fake_ollama --port 11435 &
+    OLLAMA_ENDPOINT=http://127.0.0.1:11435/api/chat python app.py &
+    python -m benchmarks.loadgen --users 20 --turns 15 [--stream]
+"""
+from __future__ import annotations
+import argparse
+import random
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+import requests
+from benchmarks.corpus import LEARNER_MESSAGES
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed: float):
+        def pct(values: List[float], q: float) -> float:
+            return values[min(len(values) - 1, int(len(values) * q))] * 1000
+        
+        print(f"{'endpoint':<34}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        total = 0
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            total += len(values)
+            print(f"{endpoint:<34}{len(values):>7}{self.errors.get(endpoint, 0):>8}{len(values) / elapsed:>9.1f}"
+                  f"{pct(values, 0.50):>10.1f}{pct(values, 0.95):>10.1f}{pct(values, 0.99):>10.1f}")
+        print(f"{'total':<34}{total:>7}{sum(self.errors.values()):>8}{total / elapsed:>9.1f}")
+
+class VirtualUser:
+    MAX_TURNS_PER_CONVERSATION = 50
+
+    def __init__(self, baseUrl: str, recorder: Recorder, rng: random.Random, stream: bool, thinkMs: float):
+        self.baseUrl = baseUrl.rstrip("/")
+        self.recorder = recorder
+        self.rng = rng
+        self.stream = stream
+        self.thinkMs = thinkMs
+        self.http = requests.Session()
+        self.userId = ""
+
+    def call(self, name: str, method: str, path: str, body: Optional[dict] = None,
+             params: Optional[dict] = None) -> Tuple[bool, dict]:
+        start = time.perf_counter()
+        try:
+            r = self.http.request(method, self.baseUrl + path, json=body, params=params, timeout=60)
+            ok = r.ok
+            data = r.json() if r.content else {}
+        except (requests.RequestException, ValueError) as e:
+            ok, data = False, {"error": str(e)}
+        self.recorder.add(name, time.perf_counter() - start, ok)
+        return ok, data
+
+    def streamTurn(self, conversationId: str, text: str) -> bool:
+        start = time.perf_counter()
+        first = None
+        ok = False
+        try:
+            with self.http.post(self.baseUrl + "/api/messages/send-stream",
+                                json={"conversationId": conversationId, "text": text},
+                                stream=True, timeout=60) as r:
+                if r.ok:
+                    for line in r.iter_lines(chunk_size=None):
+                        if not line:
+                            continue
+                        if first is None:
+                            first = time.perf_counter() - start
+                        if b'"type": "done"' in line:
+                            ok = True
+                        elif b'"type": "error"' in line:
+                            break
+        except requests.RequestException:
+            ok = False
+        self.recorder.add("POST send-stream", time.perf_counter() - start, ok)
+        if first is not None:
+            self.recorder.add("POST send-stream (first event)", first, True)
+        return ok
+
+    def login(self, index: int, runId: str) -> bool:
+        email = f"load-{runId}-{index}@example.com"
+        password = "loadtest-password"
+        ok, _ = self.call("POST /api/account/register", "POST", "/api/account/register",
+                          {"email": email, "password": password, "nickname": f"load{index}"})
+        if not ok:
+            return False
+        ok, data = self.call("POST /api/account/login", "POST", "/api/account/login",
+                             {"email": email, "password": password})
+        if not ok:
+            return False
+        self.userId = data["userId"]
+        self.http.headers["X-Session-Id"] = data["sessionId"]
+        return True
+
+    def newConversation(self) -> Optional[str]:
+        ok, data = self.call("POST /api/conversations", "POST", "/api/conversations", {})
+        return data.get("conversationId") if ok else None
+
+    def run(self, turns: int, readEvery: int):
+        conversationId = None
+        turnsHere = 0
+        for turn in range(turns):
+            if conversationId is None or turnsHere >= self.MAX_TURNS_PER_CONVERSATION:
+                conversationId = self.newConversation()
+                turnsHere = 0
+                if not conversationId:
+                    return
+        
+            text = self.rng.choice(LEARNER_MESSAGES)
+            if turnsHere == 0:
+                self.call("POST first-title", "POST", f"/api/conversations/{conversationId}/first-title", {"text": text})
+        
+            if self.stream:
+                self.streamTurn(conversationId, text)
+            else:
+                self.call("POST /api/messages/send", "POST", "/api/messages/send",
+                          {"conversationId": conversationId, "text": text})
+            turnsHere += 1
+        
+            if readEvery and (turn + 1) % readEvery == 0:
+                self.call("GET /api/conversations", "GET", "/api/conversations", params={"limit": 20})
+                self.call("GET conversation details", "GET", f"/api/conversations/{conversationId}", params={"limit": 20})
+                self.call("GET /api/profile/statistics", "GET", "/api/profile/statistics")
+        
+            if self.thinkMs:
+                time.sleep(self.rng.uniform(0.5, 1.5) * self.thinkMs / 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--turns", type=int, default=15, help="chat turns per user")
+    parser.add_argument("--read-every", type=int, default=5, help="history/statistics reads every N turns (0 = never)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's turns")
+    parser.add_argument("--stream", action="store_true", help="use /api/messages/send-stream")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup = Recorder()
+    recorder = Recorder()
+    runId = uuid.uuid4().hex[:8]
+    users = [VirtualUser(args.base_url, setup, random.Random(args.seed + i), args.stream, args.think_ms)
+             for i in range(args.users)]
+
+    # Sign-up is setup, not load: do it before the clock starts and report it separately.
+    setupStart = time.perf_counter()
+    ready = [u for i, u in enumerate(users) if u.login(i, runId)]
+    if not ready:
+        raise SystemExit("No virtual user could register/login; is the backend running?")
+    print(f"setup: {len(ready)} users registered and logged in")
+    setup.report(time.perf_counter() - setupStart)
+    print()
+    for u in ready:
+        u.recorder = recorder
+
+    threads = [threading.Thread(target=u.run, args=(args.turns, args.read_every)) for u in ready]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(ready)} users x {args.turns} turns in {elapsed:.1f}s ({'stream' if args.stream else 'send'})")
+    recorder.report(elapsed)
+
+if __name__ == "__main__":
+    main()
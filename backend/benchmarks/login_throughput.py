@@ -0,0 +1,126 @@
+"""Login throughput and chat latency while a login burst shares the request workers.
+
+A fixed pool of request threads stands in for the Flask workers. Login clients hash
+passwords through a PasswordHasher (inline, or on its process pool) while chat clients
+issue small CPU-bound requests at a steady rate; the chat latency percentiles show
+how much a burst of logins slows everyone else down.
+
+Run from the backend directory:
+
+    python -m benchmarks.login_throughput --threads 8 --logins 200 --login-clients 32 --hash-workers 2
+"""
+from __future__ import annotations
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from password_hasher import PasswordHasher, HasherBusyError
+from benchmarks.corpus import LEARNER_MESSAGES
+
+def _chatRequest():
+    # Roughly the CPU a chat round-trip spends in Flask: parse a body, build a reply payload.
+    body = json.dumps({"conversationId": "c", "text": LEARNER_MESSAGES[-1] * 4})
+    payload = json.loads(body)
+    return json.dumps({"aiText": payload["text"][::-1], "scores": [1.0, 2.0, 3.0]})
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+def _run(hasher: PasswordHasher, stored: str, args) -> Dict[str, float]:
+    server = ThreadPoolExecutor(max_workers=args.threads)
+    secret = b"correct horse battery staple"
+    chatLatencies: List[float] = []
+    loginLatencies: List[float] = []
+    counts = {"ok": 0, "busy": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def login():
+        try:
+            hasher.verify(secret, stored)
+            return "ok"
+        except HasherBusyError:
+            return "busy"
+
+    def loginClient(n: int):
+        for _ in range(n):
+            start = time.perf_counter()
+            outcome = server.submit(login).result()
+            with lock:
+                counts[outcome] += 1
+                if outcome == "ok":
+                    loginLatencies.append(time.perf_counter() - start)
+
+    def chatClient():
+        while not stop.is_set():
+            start = time.perf_counter()
+            server.submit(_chatRequest).result()
+            with lock:
+                chatLatencies.append(time.perf_counter() - start)
+            time.sleep(args.chat_interval_ms / 1000)
+
+    chats = [threading.Thread(target=chatClient) for _ in range(args.chat_clients)]
+    perClient = max(1, args.logins // args.login_clients)
+    logins = [threading.Thread(target=loginClient, args=(perClient,)) for _ in range(args.login_clients)]
+
+    for th in chats:
+        th.start()
+    start = time.perf_counter()
+    for th in logins:
+        th.start()
+    for th in logins:
+        th.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for th in chats:
+        th.join()
+    server.shutdown()
+
+    return {
+        "logins/s": counts["ok"] / elapsed,
+        "busy": counts["busy"],
+        "login p95": _percentile(loginLatencies, 0.95),
+        "chat p50": _percentile(chatLatencies, 0.50),
+        "chat p95": _percentile(chatLatencies, 0.95),
+        "chat p99": _percentile(chatLatencies, 0.99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8, help="request worker threads")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-clients", type=int, default=32)
+    parser.add_argument("--chat-clients", type=int, default=4)
+    parser.add_argument("--chat-interval-ms", type=float, default=20.0)
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--hash-queue", type=int, default=4)
+    parser.add_argument("--kdf", default="pbkdf2-sha256")
+    parser.add_argument("--iterations", type=int, default=120_000)
+    args = parser.parse_args()
+
+    modes = (
+        ("inline", PasswordHasher(args.kdf, iterations=args.iterations, workers=0)),
+        ("pooled", PasswordHasher(args.kdf, iterations=args.iterations,
+                                  workers=args.hash_workers, maxQueue=args.hash_queue)),
+    )
+    stored = modes[0][1].hash(b"correct horse battery staple")
+
+    columns = ("logins/s", "busy", "login p95", "chat p50", "chat p95", "chat p99")
+    print(f"{'mode':<8}" + "".join(f"{c:>12}" for c in columns))
+    for name, hasher in modes:
+        try:
+            # Warm up: spawn the worker processes before timing starts.
+            hasher.verify(b"warm-up", stored)
+            r = _run(hasher, stored, args)
+            print(f"{name:<8}" + "".join(f"{r[c]:>12.1f}" for c in columns))
+            print(f"{'':<8}hasher stats: {hasher.stats()}")
+        finally:
+            hasher.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Micro-benchmarks for the scoring and persistence hot paths, with saved baselines.
+
+Cases:
+- nlp.*: NLPEngine.analyzeText / generateTips / evaluate per message-length bucket.
+  The feature cache is off, so every call parses.
+- db.*: the Database calls of one chat turn (session lookup, turn context, locked
+  save), against DATABASE_URL with the context cache off.
+
+Each case reports ops/s and p50/p95/p99 latency from a timing pass. A separate
+tracemalloc pass reports peak memory per op, net allocated blocks per op and gen-0
+GC collections per 1k ops (a proxy for allocation churn).
+
+Run from the backend directory:
+
+    python -m benchmarks.micro --save before           # writes benchmarks/baselines/before.json
+    python -m benchmarks.micro --compare before        # flags regressions > --threshold (exit 1)
+    python -m benchmarks.micro --only nlp --iterations 500
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from benchmarks.corpus import LEARNER_MESSAGES
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# metric -> True when higher is better
+METRICS = {
+    "opsPerSec": True,
+    "p50Us": False,
+    "p95Us": False,
+    "p99Us": False,
+    "peakBytesPerOp": False,
+    "netBlocksPerOp": False,
+    "gen0Per1kOps": False,
+}
+
+Case = Tuple[str, Callable[[int], None]]
+
+def _buckets() -> Dict[str, List[str]]:
+    out = {"short": [], "medium": [], "long": []}
+    for text in LEARNER_MESSAGES:
+        words = len(text.split())
+        out["short" if words < 8 else "medium" if words <= 25 else "long"].append(text)
+    return out
+
+def _measure(fn: Callable[[int], None], iterations: int, warmup: int) -> Dict[str, float]:
+    for i in range(warmup):
+        fn(i)
+
+    samples = []
+    gc.collect()
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        fn(i)
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+
+    def pct(q: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * q))] / 1000
+
+    memIterations = max(1, iterations // 5)
+    gc.collect()
+    gen0Before = gc.get_stats()[0]["collections"]
+    blocksBefore = sys.getallocatedblocks()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for i in range(memIterations):
+        fn(i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocksAfter = sys.getallocatedblocks()
+    gen0After = gc.get_stats()[0]["collections"]
+
+    return {
+        "opsPerSec": round(1e9 / statistics.mean(samples), 1),
+        "p50Us": round(pct(0.50), 1),
+        "p95Us": round(pct(0.95), 1),
+        "p99Us": round(pct(0.99), 1),
+        "peakBytesPerOp": round((peak - base) / memIterations, 1),
+        "netBlocksPerOp": round((blocksAfter - blocksBefore) / memIterations, 2),
+        "gen0Per1kOps": round((gen0After - gen0Before) * 1000 / memIterations, 2),
+    }
+
+def nlpCases() -> List[Case]:
+    from nlp_engine import NLPEngine
+
+    engine = NLPEngine("", cacheSize=0)
+    if not engine._nlp:
+        print("skipping nlp.*: spaCy model en_core_web_sm is not installed")
+        return []
+
+    cases: List[Case] = []
+    for name, texts in _buckets().items():
+        if not texts:
+            continue
+        scored = [(t, engine.analyzeText(t)) for t in texts]
+        cases.append((f"nlp.analyzeText.{name}", lambda i, texts=texts: engine.analyzeText(texts[i % len(texts)])))
+        cases.append((f"nlp.generateTips.{name}",
+                      lambda i, scored=scored: engine.generateTips(*scored[i % len(scored)])))
+        cases.append((f"nlp.evaluate.{name}", lambda i, texts=texts: engine.evaluate(texts[i % len(texts)])))
+    return cases
+
+class _DbFixture:
+    """A bench user with a session and a conversation of realistic length; removed on close()"""
+
+    EMAIL = "micro-bench@example.com"
+
+    def __init__(self, db):
+        import uuid
+        self.db = db
+        try:
+            self.userId = db.findUserByEmail(self.EMAIL).userId
+        except Exception:
+            self.userId = db.saveUser(self.EMAIL, "x", "bench")
+        self.sessionId = str(uuid.uuid4())
+        db._saveSession(self.sessionId, self.userId, datetime.utcnow(), datetime.utcnow() + timedelta(hours=1))
+        self.readConversation = db.saveConversation(self.userId, self.sessionId)
+        for text in LEARNER_MESSAGES[:20]:
+            db.saveMessage(self.readConversation, text)
+        self.writeConversations: List[str] = []
+
+    def freshConversation(self) -> str:
+        cid = self.db.saveConversation(self.userId, self.sessionId)
+        self.writeConversations.append(cid)
+        return cid
+
+    def close(self):
+        for cid in [self.readConversation] + self.writeConversations:
+            self.db.deleteConversation(cid, self.userId)
+        self.db._invalidateSession(self.sessionId)
+
+def dbCases() -> Tuple[List[Case], Optional[_DbFixture]]:
+    from database import Database
+    from models import Scores
+
+    connectionString = os.getenv(
+        "DATABASE_URL",
+        "dbname=seng321 user=postgres password=011186 host=localhost port=5432"
+    )
+    try:
+        db = Database(connectionString, minConnections=1, maxConnections=2, contextCache=None)
+        fixture = _DbFixture(db)
+    except Exception as e:
+        print(f"skipping db.*: cannot reach Postgres ({str(e).strip().splitlines()[0]})")
+        return [], None
+
+    scores = Scores(fluency=3, wordChoice=4, grammar=3)
+    state = {"cid": fixture.freshConversation(), "turns": 0}
+
+    def saveTurn(i: int):
+        # Stay under the 100-message limit the controller enforces.
+        if state["turns"] >= 45:
+            state["cid"] = fixture.freshConversation()
+            state["turns"] = 0
+        with db.unitOfWork() as uow:
+            uow.lockConversation(state["cid"], fixture.userId)
+            uow.saveTurn(state["cid"], "I goes to school yesterday", "Nice! Where did you go?", scores, ["tip"])
+        state["turns"] += 1
+
+    cases: List[Case] = [
+        ("db.findSession", lambda i: db.findSession(fixture.sessionId)),
+        ("db.getTurnContext", lambda i: db.getTurnContext(fixture.readConversation, fixture.userId, 6)),
+        ("db.getLastMessages", lambda i: db.getLastMessages(fixture.readConversation, 6)),
+        ("db.unitOfWork.saveTurn", saveTurn),
+    ]
+    return cases, fixture
+
+def _environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        "createdAt": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+    }
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'case':<30}{'metric':<16}{'baseline':>12}{'now':>12}{'change':>9}")
+    for case, now in results.items():
+        before = baseline.get(case)
+        if not before:
+            continue
+        for metric, higherIsBetter in METRICS.items():
+            old, new = before.get(metric), now.get(metric)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / abs(old)
+            worse = -change if higherIsBetter else change
+            flag = ""
+            # Tiny absolute numbers (e.g. 0.1 blocks/op) swing by large percentages; ignore them.
+            if worse > threshold and abs(new - old) > 1:
+                flag = "  REGRESSION"
+                regressions.append(f"{case} {metric}: {old} -> {new} ({change:+.0%})")
+            print(f"{case:<30}{metric:<16}{old:>12}{new:>12}{change:>+9.0%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--only", choices=("nlp", "db"))
+    parser.add_argument("--save", metavar="NAME", help="write results to benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    cases: List[Case] = []
+    fixture = None
+    if args.only in (None, "nlp"):
+        cases += nlpCases()
+    if args.only in (None, "db"):
+        dbList, fixture = dbCases()
+        cases += dbList
+    if not cases:
+        raise SystemExit("Nothing to benchmark")
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'case':<30}{'ops/s':>10}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'peak B/op':>11}{'blocks/op':>11}{'gc0/1k':>8}")
+    try:
+        for name, fn in cases:
+            r = _measure(fn, args.iterations, args.warmup)
+            results[name] = r
+            print(f"{name:<30}{r['opsPerSec']:>10}{r['p50Us']:>10}{r['p95Us']:>10}{r['p99Us']:>10}"
+                  f"{r['peakBytesPerOp']:>11}{r['netBlocksPerOp']:>11}{r['gen0Per1kOps']:>8}")
+    finally:
+        if fixture is not None:
+            fixture.close()
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump({"environment": _environment(), "iterations": args.iterations, "results": results}, f, indent=2)
+        print(f"\nSaved baseline to {path}")
+
+    if args.compare:
+        path = os.path.join(BASELINE_DIR, f"{args.compare}.json")
+        with open(path) as f:
+            baseline = json.load(f)
+        env = baseline.get("environment", {})
+        print(f"\nBaseline {args.compare}: commit {env.get('commit') or '?'}, {env.get('machine', '?')}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for r in regressions:
+                print("  " + r)
+            raise SystemExit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Inline vs pooled NLP scoring throughput.
+
+Run from the backend directory:
+
+    python -m benchmarks.nlp_throughput --messages 512 --workers 4 --batch-size 16 --max-wait-ms 5
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import threading
+import time
+from typing import Callable, List
+from nlp_engine import NLPEngine
+from nlp_service import NLPScoringService
+from benchmarks.corpus import corpus
+
+SENDERS = (1, 8, 64)
+
+def _drive(score: Callable[[str], object], texts: List[str], senders: int):
+    latencies: List[float] = []
+    lock = threading.Lock()
+    chunks = [texts[i::senders] for i in range(senders)]
+    
+    def sender(chunk: List[str]):
+        local = []
+        for t in chunk:
+            start = time.perf_counter()
+            score(t)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=sender, args=(c,)) for c in chunks]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    return {
+        "throughput": len(texts) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "mean": statistics.mean(latencies) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    
+    inline = NLPEngine("", cacheSize=0)
+    if not inline._nlp:
+        raise SystemExit("spaCy model en_core_web_sm is not installed (python -m spacy download en_core_web_sm)")
+    
+    pooled = NLPScoringService(
+        NLPEngine("", cacheSize=0),
+        workers=args.workers,
+        batchSize=args.batch_size,
+        maxWaitMs=args.max_wait_ms,
+    )
+    texts = corpus(args.messages)
+    
+    # Warm up: every worker loads its model before timing starts.
+    _drive(pooled.evaluate, texts[: args.workers * args.batch_size], args.workers * args.batch_size)
+    
+    print(f"{'mode':<8}{'senders':>8}{'msg/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    try:
+        for senders in SENDERS:
+            for mode, fn in (("inline", inline.evaluate), ("pooled", pooled.evaluate)):
+                r = _drive(fn, texts, senders)
+                print(f"{mode:<8}{senders:>8}{r['throughput']:>10.1f}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['mean']:>10.2f}")
+        print("pool stats:", pooled.stats())
+    finally:
+        pooled.shutdown()
+
+if __name__ == "__main__":
+    main()
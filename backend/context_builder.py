@@ -0,0 +1,70 @@
+from __future__ import annotations
+from typing import List, Dict, Optional
+from models import ConversationSummary, Message
+import metrics
+
+# Chat formats add a few tokens per message for the role markers.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimateTokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English); no tokenizer needed for budgeting"""
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+def _truncateToTokens(text: str, maxTokens: int) -> str:
+    maxChars = max(0, (maxTokens - MESSAGE_OVERHEAD_TOKENS) * 4)
+    if len(text) <= maxChars:
+        return text
+    cut = text[:maxChars]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > maxChars // 2 else cut).rstrip() + "..."
+
+class ContextBuilder:
+    """Assembles the chat prompt within a token budget.
+
+    The prompt is the system prompt, the conversation's rolling summary (folded into
+    the system message), as many of the most recent messages as fit, and the new
+    user text; messages that do not fit are dropped oldest first. The summary covers
+    the oldest messages and is kept current by SummaryJobQueue every summarizeEvery
+    turns, so the prompt size stays bounded no matter how long the conversation gets.
+    """
+
+    def __init__(self, maxPromptTokens: int = 1200, maxRecentMessages: int = 12,
+                 summaryMaxTokens: int = 250, summarizeEvery: int = 4):
+        self.maxPromptTokens = maxPromptTokens
+        self.maxRecentMessages = maxRecentMessages
+        self.summaryMaxTokens = summaryMaxTokens
+        self.summarizeEvery = max(1, summarizeEvery)
+        # Messages to load per turn: the recent window plus the ones that aged out of it
+        # but are not summarized yet (at most summarizeEvery turns' worth).
+        self.window = maxRecentMessages + 2 * self.summarizeEvery
+
+    def recent(self, messageCount: int, messages: List[Message],
+               summary: Optional[ConversationSummary]) -> List[Message]:
+        """The loaded messages that the summary does not cover yet"""
+        if summary is None or not summary.messageCount:
+            return messages
+        first = messageCount - len(messages)
+        return [m for i, m in enumerate(messages) if first + i >= summary.messageCount]
+
+    def summaryDue(self, messageCount: int, summary: Optional[ConversationSummary]) -> bool:
+        """True once summarizeEvery turns have aged out of the recent window without being summarized"""
+        covered = summary.messageCount if summary is not None else 0
+        return messageCount - self.maxRecentMessages - covered >= self.summarizeEvery * 2
+
+    def build(self, systemPrompt: str, text: str, context: List[Message], summary: str = "") -> List[Dict[str, str]]:
+        system = systemPrompt
+        if summary:
+            system += "\n\nSummary of the earlier conversation:\n" + _truncateToTokens(summary, self.summaryMaxTokens)
+        
+        used = estimateTokens(system) + estimateTokens(text)
+        recent: List[Dict[str, str]] = []
+        for m in reversed(context):
+            cost = estimateTokens(m.content)
+            if used + cost > self.maxPromptTokens:
+                break
+            used += cost
+            recent.append({"role": "user" if m.senderId == "user" else "assistant", "content": m.content})
+        recent.reverse()
+        
+        metrics.PROMPT_TOKENS.observe(used)
+        return [{"role": "system", "content": system}] + recent + [{"role": "user", "content": text}]
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Tuple
+import threading
+from models import ConversationSummary, Message
+import metrics
+
+# Rough per-message bookkeeping cost on top of the text itself.
+_MESSAGE_OVERHEAD = 200
+
+class _Entry:
+    __slots__ = ("userId", "messages", "messageCount", "summary", "size")
+
+    def __init__(self, window: int, userId: Optional[str], messageCount: int, messages: List[Message],
+                 summary: Optional[ConversationSummary] = None):
+        self.userId = userId
+        self.messages = deque(messages[-window:], maxlen=window)
+        self.messageCount = messageCount
+        self.summary = summary or ConversationSummary()
+        self.size = 0
+        self.resize()
+
+    def resize(self):
+        self.size = sum(len(m.content) + _MESSAGE_OVERHEAD for m in self.messages) + len(self.summary.text)
+
+    def lastSender(self) -> Optional[str]:
+        return self.messages[-1].senderId if self.messages else None
+
+class ConversationContextCache:
+    """Bounded LRU of each conversation's recent messages, message count and rolling summary.
+
+    Database fills it on a read miss and keeps it current on every write that goes
+    through this process. The limit check under the row lock stays authoritative.
+    """
+
+    def __init__(self, window: int = 6, maxConversations: int = 1000, maxBytes: int = 16 * 1024 * 1024):
+        self.window = window
+        self.maxConversations = maxConversations
+        self.maxBytes = maxBytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, conversationId: str, count: int,
+            userId: Optional[str] = None) -> Optional[Tuple[int, List[Message], ConversationSummary]]:
+        """userId: only a hit if that user owns the conversation (a miss falls back to the owner-checked query)"""
+        with self._lock:
+            entry = self._entries.get(conversationId)
+            if entry is None or count > self.window or (userId is not None and entry.userId != userId):
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(conversationId)
+            self._stats["hits"] += 1
+            return entry.messageCount, list(entry.messages)[-count:] if count else [], entry.summary
+
+    def lastSender(self, conversationId: str) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            entry = self._entries.get(conversationId)
+            if entry is None:
+                return False, None
+            return True, entry.lastSender()
+
+    def fill(self, conversationId: str, userId: str, messageCount: int, messages: List[Message],
+             summary: Optional[ConversationSummary] = None):
+        with self._lock:
+            self._put(conversationId, _Entry(self.window, userId, messageCount, messages, summary))
+
+    def setSummary(self, conversationId: str, summary: ConversationSummary):
+        with self._lock:
+            entry = self._entries.get(conversationId)
+            if entry is None:
+                return
+            self._bytes -= entry.size
+            entry.summary = summary
+            entry.resize()
+            self._bytes += entry.size
+            self._evict()
+
+    def append(self, conversationId: str, messages: List[Message], expectedCount: Optional[int] = None):
+        """Record freshly written messages; drop the entry if another writer got there first"""
+        with self._lock:
+            entry = self._entries.get(conversationId)
+            if entry is None:
+                return
+            if expectedCount is not None and entry.messageCount != expectedCount:
+                self._drop(conversationId)
+                self._stats["invalidations"] += 1
+                return
+            self._bytes -= entry.size
+            entry.messages.extend(messages)
+            entry.messageCount += len(messages)
+            entry.resize()
+            self._bytes += entry.size
+            self._entries.move_to_end(conversationId)
+            self._evict()
+
+    def reset(self, conversationId: str):
+        """The conversation's messages were deleted: it is now known to be empty"""
+        with self._lock:
+            entry = self._entries.get(conversationId)
+            self._put(conversationId, _Entry(self.window, entry.userId if entry else None, 0, []))
+
+    def invalidate(self, conversationId: str):
+        with self._lock:
+            if self._drop(conversationId):
+                self._stats["invalidations"] += 1
+
+    @metrics.counters("hits", "misses", "evictions", "invalidations")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["conversations"] = len(self._entries)
+            out["bytes"] = self._bytes
+        lookups = out["hits"] + out["misses"]
+        out["hitRate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        return out
+
+    def _put(self, conversationId: str, entry: _Entry):
+        self._drop(conversationId)
+        self._entries[conversationId] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _drop(self, conversationId: str) -> bool:
+        entry = self._entries.pop(conversationId, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        return True
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.maxConversations or self._bytes > self.maxBytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._stats["evictions"] += 1
@@ -1,13 +1,40 @@
 from __future__ import annotations
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
 import uuid
-from database import Database
+from database import Database, DEFAULT_TITLE
 from ai_service import AIService
+from title_jobs import TitleJobQueue
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encodeCursor(ts: datetime, rowId: str) -> str:
+    raw = f"{ts.isoformat()}|{rowId}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decodeCursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    if not cursor:
+        return None
+    try:
+        ts, rowId = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(ts), str(uuid.UUID(rowId))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _pageSize(limit: Optional[int]) -> int:
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(MAX_PAGE_SIZE, int(limit)))
 
 class ConversationController:
-    def __init__(self, database: Database, aiService: AIService, messageController=None):
+    def __init__(self, database: Database, aiService: AIService, messageController=None,
+                 titleJobs: Optional[TitleJobQueue] = None):
         self.database = database
         self.aiService = aiService
         self.messageController = messageController
+        self.titleJobs = titleJobs
 
     def createConversation(self, userId: str):
         if self.database.countConversations(userId) >= 50:
@@ -25,29 +52,68 @@ class ConversationController:
             "createdAt": c.createdAt.isoformat(),
         } for c in items]
 
-    def getDetails(self, conversationId: str):
-        c = self.database.findConversation(conversationId)
-        msgs = self.database.findMessages(conversationId)
+    def getHistoryPage(self, userId: str, limit: Optional[int] = None, cursor: Optional[str] = None):
+        size = _pageSize(limit)
+        # One extra row tells us whether another page exists without a COUNT(*).
+        items = self.database.findConversationsPage(userId, size + 1, decodeCursor(cursor))
+        more = len(items) > size
+        items = items[:size]
+        return {
+            "conversations": [{
+                "conversationId": c.conversationId,
+                "title": c.title,
+                "messageCount": c.messageCount,
+                "createdAt": c.createdAt.isoformat(),
+            } for c in items],
+            "nextCursor": encodeCursor(items[-1].createdAt, items[-1].conversationId) if more else None
+        }
+
+    def getDetails(self, conversationId: str, userId: str, limit: Optional[int] = None,
+                   cursor: Optional[str] = None):
+        """Conversation header plus its newest page of messages; nextCursor pages towards older messages"""
+        c = self.database.findConversation(conversationId, userId)
+        size = _pageSize(limit)
+        msgs = self.database.findMessagesPage(conversationId, size + 1, decodeCursor(cursor))
+        more = len(msgs) > size
+        msgs = msgs[-size:] if msgs else msgs
         return {
             "conversationId": c.conversationId,
             "title": c.title,
             "messages": [{
+                "messageId": m.messageId,
                 "senderId": m.senderId,
                 "content": m.content,
                 "timestamp": m.timestamp.isoformat()
-            } for m in msgs]
+            } for m in msgs],
+            "nextCursor": encodeCursor(msgs[0].timestamp, msgs[0].messageId) if more else None
         }
 
-    def continueConversation(self, conversationId: str):
-        return self.getDetails(conversationId)
+    def continueConversation(self, conversationId: str, userId: str):
+        return self.getDetails(conversationId, userId)
 
-    def delete(self, conversationId: str):
-        self.database.deleteMessages(conversationId)
-        self.database.deleteConversation(conversationId)
+    def delete(self, conversationId: str, userId: str):
+        self.database.deleteMessages(conversationId, userId)
+        self.database.deleteConversation(conversationId, userId)
         return {"ok": True}
 
-    def processFirstMessage(self, text: str):
-        return self.aiService.generateTitle(text)
+    def processFirstMessage(self, conversationId: str, text: str, userId: str):
+        """Set the fallback title now and queue the AI title; without a job queue, generate it inline"""
+        if self.titleJobs is None:
+            # Check the owner before spending a model call on someone else's conversation.
+            self.database.findConversation(conversationId, userId)
+            title = self.aiService.generateTitle(text, userId)
+            self.database.updateTitle(conversationId, userId, title)
+            return {"title": title, "pending": False}
+        
+        title = self.aiService.fallbackTitle(text)
+        if self.database.replaceTitle(conversationId, userId, DEFAULT_TITLE, title):
+            self.titleJobs.enqueue(conversationId, userId, text, title)
+        return self.getTitle(conversationId, userId)
+
+    def getTitle(self, conversationId: str, userId: str):
+        c = self.database.findConversation(conversationId, userId)
+        pending = self.titleJobs.isPending(conversationId) if self.titleJobs is not None else False
+        return {"title": c.title, "pending": pending}
 
     def generateSessionId(self):
         return str(uuid.uuid4())
\ No newline at end of file
@@ -1,25 +1,486 @@
 from __future__ import annotations
+from collections import deque
 from contextlib import contextmanager
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
-from models import User, Conversation, Message, Scores
+from models import User, Session, Conversation, ConversationSummary, Message, Scores, UserStats
+from context_cache import ConversationContextCache
+import metrics
+
+class PoolTimeoutError(Exception):
+    pass
+
+class ConversationNotFoundError(ValueError):
+    """The conversation does not exist or belongs to another user"""
+    pass
+
+class _TimedCursorMixin:
+    """Records every statement as a "db" span (latency histogram + per-request query count)"""
+
+    def execute(self, query, vars=None):
+        with metrics.span("db"):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with metrics.span("db"):
+            return super().executemany(query, vars_list)
+
+class _TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+class _TimedDictCursor(_TimedCursorMixin, psycopg2.extras.RealDictCursor):
+    pass
+
+class _TimedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory")
+        if factory is None:
+            kwargs["cursor_factory"] = _TimedCursor
+        elif factory is psycopg2.extras.RealDictCursor:
+            kwargs["cursor_factory"] = _TimedDictCursor
+        return super().cursor(*args, **kwargs)
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections shared by all Database methods.
+
+    The first checkout starts a background fill up to minSize connections, and the
+    pool tops back up whenever a discard takes it below that, so bursts find
+    connections already open. Nothing connects before the first checkout.
+    """
+
+    def __init__(self, connectionString: str, minSize: int = 1, maxSize: int = 10,
+                 timeout: float = 10.0, maxIdle: float = 300.0, healthCheckAfter: float = 30.0):
+        if minSize < 0 or maxSize < 1 or minSize > maxSize:
+            raise ValueError("Invalid pool size (need 0 <= min <= max and max >= 1)")
+        self.connectionString = connectionString
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.timeout = timeout
+        self.maxIdle = maxIdle
+        self.healthCheckAfter = healthCheckAfter
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._filling = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "waitTimeMs": 0.0,
+            "maxWaitMs": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "healthChecks": 0,
+            "discardedBroken": 0,
+            "closedIdle": 0,
+        }
+
+    def getconn(self):
+        self._topUp()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        
+        while True:
+            candidate = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Connection pool is closed")
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        break
+                    if self._size < self.maxSize:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError("Timed out waiting for a database connection")
+                    waited = True
+                    self._cond.wait(remaining)
+            
+            if candidate is None:
+                try:
+                    conn = psycopg2.connect(self.connectionString, connection_factory=_TimedConnection)
+                except Exception:
+                    self._release()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+                self._recordCheckout(start, waited)
+                return conn
+            
+            conn, lastUsed = candidate
+            if self._isUsable(conn, lastUsed):
+                self._recordCheckout(start, waited)
+                return conn
+
+    def putconn(self, conn, broken: bool = False):
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                broken = True
+        
+        if broken or conn.closed:
+            with self._cond:
+                self._stats["discardedBroken"] += 1
+            self._discard(conn)
+            return
+        
+        expired = []
+        with self._cond:
+            if self._closed:
+                expired.append(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                now = time.monotonic()
+                while self._idle and self._size > self.minSize and now - self._idle[0][1] > self.maxIdle:
+                    old, _ = self._idle.popleft()
+                    expired.append(old)
+                    self._size -= 1
+                    self._stats["closedIdle"] += 1
+            self._cond.notify()
+        
+        for old in expired:
+            self._close(old)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out = dict(self._stats)
+            out["size"] = self._size
+            out["idle"] = len(self._idle)
+            out["inUse"] = self._size - len(self._idle)
+            out["minSize"] = self.minSize
+            out["maxSize"] = self.maxSize
+            out["avgWaitMs"] = round(out["waitTimeMs"] / out["checkouts"], 3) if out["checkouts"] else 0.0
+            return out
+
+    def closeAll(self):
+        with self._cond:
+            self._closed = True
+            conns = [c for c, _ in self._idle]
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in conns:
+            self._close(conn)
+
+    def _isUsable(self, conn, lastUsed: float) -> bool:
+        idleFor = time.monotonic() - lastUsed
+        
+        if conn.closed:
+            with self._cond:
+                self._stats["discardedBroken"] += 1
+            self._discard(conn)
+            return False
+        
+        if idleFor > self.maxIdle:
+            with self._cond:
+                self._stats["closedIdle"] += 1
+            self._discard(conn)
+            return False
+        
+        if idleFor > self.healthCheckAfter:
+            with self._cond:
+                self._stats["healthChecks"] += 1
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                with self._cond:
+                    self._stats["discardedBroken"] += 1
+                self._discard(conn)
+                return False
+        
+        return True
+
+    def _recordCheckout(self, start: float, waited: bool):
+        waitMs = (time.monotonic() - start) * 1000
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["waitTimeMs"] += waitMs
+            if waited:
+                self._stats["waits"] += 1
+            if waitMs > self._stats["maxWaitMs"]:
+                self._stats["maxWaitMs"] = waitMs
+        if waited:
+            metrics.record("db_pool_wait", waitMs / 1000)
+
+    def _discard(self, conn):
+        self._close(conn)
+        self._release()
+        self._topUp()
+
+    def _topUp(self):
+        with self._cond:
+            if self._filling or self._closed or self._size >= self.minSize:
+                return
+            self._filling = True
+        threading.Thread(target=self._fill, name="db-pool-fill", daemon=True).start()
+
+    def _fill(self):
+        """Open idle connections until the pool holds minSize"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minSize:
+                    self._filling = False
+                    return
+                self._size += 1
+            try:
+                conn = psycopg2.connect(self.connectionString, connection_factory=_TimedConnection)
+            except Exception as e:
+                print(f"Connection pool: could not open a connection: {e}")
+                with self._cond:
+                    self._filling = False
+                self._release()
+                return
+            with self._cond:
+                self._stats["created"] += 1
+                if not self._closed:
+                    self._idle.append((conn, time.monotonic()))
+                    self._cond.notify()
+                    continue
+            self._close(conn)
+            self._release()
+
+    def _release(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+# Upsert that adds the given deltas to a user's row in user_stats; used with
+# INSERT INTO user_stats(...) SELECT ... so every writer updates the aggregates
+# in the same statement/transaction as the rows they summarize.
+_STATS_ADD = '''ON CONFLICT ("userId") DO UPDATE SET
+    "fluencySum"=user_stats."fluencySum"+EXCLUDED."fluencySum",
+    "wordChoiceSum"=user_stats."wordChoiceSum"+EXCLUDED."wordChoiceSum",
+    "grammarSum"=user_stats."grammarSum"+EXCLUDED."grammarSum",
+    "scoreCount"=user_stats."scoreCount"+EXCLUDED."scoreCount",
+    "messageCount"=user_stats."messageCount"+EXCLUDED."messageCount",
+    "conversationCount"=user_stats."conversationCount"+EXCLUDED."conversationCount"'''
+
+# Removes one conversation's user messages and scores from its owner's totals;
+# %(dropConversation)s is 1 when the conversation itself is being deleted.
+_STATS_SUBTRACT_CONVERSATION = '''UPDATE user_stats s SET
+    "fluencySum"=s."fluencySum"-agg.f,
+    "wordChoiceSum"=s."wordChoiceSum"-agg.w,
+    "grammarSum"=s."grammarSum"-agg.g,
+    "scoreCount"=s."scoreCount"-agg.n,
+    "messageCount"=s."messageCount"-agg.m,
+    "conversationCount"=s."conversationCount"-%(dropConversation)s
+FROM (
+    SELECT c."userId",
+           COALESCE(SUM(f."fluencyScore"),0) AS f,
+           COALESCE(SUM(f."wordChoiceScore"),0) AS w,
+           COALESCE(SUM(f."grammarScore"),0) AS g,
+           COUNT(f."messageId") AS n,
+           COUNT(m."messageId") AS m
+    FROM conversations c
+    LEFT JOIN messages m ON m."conversationId"=c."conversationId" AND m."senderId"='user'
+    LEFT JOIN feedback f ON f."messageId"=m."messageId"
+    WHERE c."conversationId"=%(cid)s
+    GROUP BY c."userId"
+) agg
+WHERE s."userId"=agg."userId"'''
+
+# One chat turn in a single statement: both messages, the user message's
+# feedback, the conversation's counter and the owner's aggregates.
+# The user message is stamped with clock_timestamp(), taken after the
+# conversation row lock, not NOW() (the transaction's start): a turn that
+# waited on the lock must not sort before the turn that committed first.
+# The AI reply is stamped one microsecond after the user message so both
+# rows keep a strict order.
+# With %(scored)s false (deferred feedback) no feedback row is written and
+# only the message count is added; Database.saveFeedback fills it in later.
+_SAVE_TURN = '''WITH u AS (
+    INSERT INTO messages("conversationId","content","senderId","timestamp")
+    VALUES (%(cid)s, %(userText)s, 'user', clock_timestamp())
+    RETURNING "messageId","timestamp"
+), a AS (
+    INSERT INTO messages("conversationId","content","senderId","timestamp")
+    SELECT %(cid)s::uuid, %(aiText)s::text, 'ai', u."timestamp" + interval '1 microsecond' FROM u
+    RETURNING "messageId","timestamp"
+), f AS (
+    INSERT INTO feedback("messageId","fluencyScore","wordChoiceScore","grammarScore","feedbackTips")
+    SELECT u."messageId", %(fluency)s, %(wordChoice)s, %(grammar)s, %(tips)s::text[] FROM u WHERE %(scored)s
+), c AS (
+    UPDATE conversations SET "messageCount"="messageCount"+2 WHERE "conversationId"=%(cid)s
+    RETURNING "userId"
+), s AS (
+    INSERT INTO user_stats("userId","fluencySum","wordChoiceSum","grammarSum","scoreCount","messageCount","conversationCount")
+    SELECT c."userId", %(fluency)s, %(wordChoice)s, %(grammar)s, %(scoreCount)s, 1, 0 FROM c
+    ''' + _STATS_ADD + '''
+)
+SELECT u."messageId", u."timestamp", a."messageId", a."timestamp" FROM u, a'''
+
+_LOCK_CONVERSATION = 'SELECT "messageCount" FROM conversations WHERE "conversationId"=%s AND "userId"=%s FOR UPDATE'
+
+# Conversation counter and summary plus its last N messages (newest first) in one round trip.
+_TURN_CONTEXT = '''SELECT c."messageCount", c."summary", c."summaryCount",
+       m."messageId", m."content", m."senderId", m."timestamp"
+FROM conversations c
+LEFT JOIN LATERAL (
+    SELECT * FROM messages
+    WHERE "conversationId"=c."conversationId"
+    ORDER BY "timestamp" DESC LIMIT %s
+) m ON TRUE
+WHERE c."conversationId"=%s AND c."userId"=%s'''
+
+# Only replaces the title it expects, so a late AI title cannot overwrite a newer one.
+_REPLACE_TITLE = 'UPDATE conversations SET "title"=%s WHERE "conversationId"=%s AND "userId"=%s AND "title"=%s'
+
+DEFAULT_TITLE = "New conversation"
+
+# The CTEs see the feedback row as it was before the upsert, so a re-score
+# only adds the difference to the owner's aggregates.
+_UPSERT_SCORES = '''WITH old AS (
+    SELECT "fluencyScore" AS f, "wordChoiceScore" AS w, "grammarScore" AS g
+    FROM feedback WHERE "messageId"=%(mid)s
+), up AS (
+    INSERT INTO feedback("messageId","fluencyScore","wordChoiceScore","grammarScore")
+    VALUES (%(mid)s,%(f)s,%(w)s,%(g)s)
+    ON CONFLICT ("messageId") DO UPDATE SET
+    "fluencyScore"=EXCLUDED."fluencyScore",
+    "wordChoiceScore"=EXCLUDED."wordChoiceScore",
+    "grammarScore"=EXCLUDED."grammarScore"
+), owner AS (
+    SELECT c."userId" FROM messages m
+    JOIN conversations c ON c."conversationId"=m."conversationId"
+    WHERE m."messageId"=%(mid)s AND m."senderId"='user'
+)
+INSERT INTO user_stats("userId","fluencySum","wordChoiceSum","grammarSum","scoreCount","messageCount","conversationCount")
+SELECT owner."userId",
+       %(f)s - COALESCE((SELECT f FROM old),0),
+       %(w)s - COALESCE((SELECT w FROM old),0),
+       %(g)s - COALESCE((SELECT g FROM old),0),
+       CASE WHEN EXISTS (SELECT 1 FROM old) THEN 0 ELSE 1 END,
+       0, 0
+FROM owner
+''' + _STATS_ADD
+
+_SAVE_TIPS = 'UPDATE feedback SET "feedbackTips"=%s WHERE "messageId"=%s'
+
+# Only moves the summary forward from the coverage it was computed against.
+_SAVE_SUMMARY = '''UPDATE conversations SET "summary"=%s, "summaryCount"=%s
+WHERE "conversationId"=%s AND "summaryCount"=%s'''
+
+_FIND_SESSION = 'SELECT "sessionId","userId","createdAt","expiresAt","invalidatedAt" FROM sessions WHERE "sessionId"=%s'
+
+def _saveTurnParams(conversationId: str, userText: str, aiText: str, scores: Optional[Scores],
+                    tips: List[str]) -> Dict[str, Any]:
+    return {
+        "cid": conversationId,
+        "userText": userText,
+        "aiText": aiText,
+        "scored": scores is not None,
+        "scoreCount": 1 if scores is not None else 0,
+        "fluency": scores.fluency if scores is not None else 0,
+        "wordChoice": scores.wordChoice if scores is not None else 0,
+        "grammar": scores.grammar if scores is not None else 0,
+        "tips": list(tips),
+    }
+
+class UnitOfWork:
+    """Writes of one chat turn, committed together by Database.unitOfWork()"""
+
+    def __init__(self, conn, contextCache: Optional[ConversationContextCache] = None):
+        self._conn = conn
+        self._contextCache = contextCache
+        self._locked: Dict[str, int] = {}
+        self._afterCommit = []
+
+    def lockConversation(self, conversationId: str, userId: str) -> int:
+        with self._conn.cursor() as cur:
+            cur.execute(_LOCK_CONVERSATION, (conversationId, userId))
+            row = cur.fetchone()
+            if not row:
+                raise ConversationNotFoundError("Conversation not found")
+            self._locked[conversationId] = int(row[0])
+            return int(row[0])
+
+    def saveTurn(self, conversationId: str, userText: str, aiText: str,
+                 scores: Optional[Scores], tips: List[str]) -> Tuple[Message, Message]:
+        """scores=None saves the turn without feedback (deferred mode)"""
+        with self._conn.cursor() as cur:
+            cur.execute(_SAVE_TURN, _saveTurnParams(conversationId, userText, aiText, scores, tips))
+            userMessageId, userTs, aiMessageId, aiTs = cur.fetchone()
+            saved = (
+                Message(str(userMessageId), conversationId, userText, "user", userTs),
+                Message(str(aiMessageId), conversationId, aiText, "ai", aiTs),
+            )
+            
+            if self._contextCache is not None:
+                cache = self._contextCache
+                expected = self._locked.get(conversationId)
+                self._afterCommit.append(lambda: cache.append(conversationId, list(saved), expected))
+            return saved
+
+    def replaceTitle(self, conversationId: str, userId: str, old: str, new: str) -> bool:
+        with self._conn.cursor() as cur:
+            cur.execute(_REPLACE_TITLE, (new, conversationId, userId, old))
+            return cur.rowcount > 0
 
 class Database:
-    def __init__(self, connectionString: str):
+    def __init__(self, connectionString: str, minConnections: int = 1, maxConnections: int = 10,
+                 checkoutTimeout: float = 10.0, maxIdleSeconds: float = 300.0,
+                 contextCache: Optional[ConversationContextCache] = None):
         self.connectionString = connectionString
+        self.contextCache = contextCache
+        self._pool = ConnectionPool(
+            connectionString,
+            minSize=minConnections,
+            maxSize=maxConnections,
+            timeout=checkoutTimeout,
+            maxIdle=maxIdleSeconds,
+        )
 
     @contextmanager
     def _conn(self):
-        conn = psycopg2.connect(self.connectionString)
+        conn = self._pool.getconn()
+        broken = False
         try:
             yield conn
             conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
         except Exception:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            self._pool.putconn(conn, broken)
+
+    @contextmanager
+    def unitOfWork(self):
+        with self._conn() as conn:
+            uow = UnitOfWork(conn, self.contextCache)
+            yield uow
+        
+        for callback in uow._afterCommit:
+            callback()
+
+    @metrics.counters("checkouts", "waits", "waitTimeMs", "timeouts", "created", "healthChecks", "discardedBroken", "closedIdle")
+    def poolStats(self) -> Dict[str, Any]:
+        return self._pool.stats()
+
+    def close(self):
+        self._pool.closeAll()
 
     def saveUser(self, email: str, hash: str, nickname: str):
         with self._conn() as conn:
@@ -84,15 +545,24 @@ class Database:
                     (userId, sessionId, "New conversation", 0),
                 )
                 (cid,) = cur.fetchone()
+                
+                cur.execute(
+                    '''INSERT INTO user_stats("userId","fluencySum","wordChoiceSum","grammarSum","scoreCount","messageCount","conversationCount")
+                       VALUES (%s,0,0,0,0,0,1) ''' + _STATS_ADD,
+                    (userId,)
+                )
                 return str(cid)
 
-    def findConversation(self, conversationId: str) -> Conversation:
+    def findConversation(self, conversationId: str, userId: str) -> Conversation:
         with self._conn() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute('SELECT * FROM conversations WHERE "conversationId"=%s', (conversationId,))
+                cur.execute(
+                    'SELECT * FROM conversations WHERE "conversationId"=%s AND "userId"=%s',
+                    (conversationId, userId)
+                )
                 r = cur.fetchone()
                 if not r:
-                    raise ValueError("Conversation not found")
+                    raise ConversationNotFoundError("Conversation not found")
                 return Conversation(
                     conversationId=str(r["conversationId"]),
                     userId=str(r["userId"]),
@@ -117,13 +587,48 @@ class Database:
                     createdAt=r["createdAt"],
                 ) for r in rows]
 
-    def updateTitle(self, conversationId: str, title: str):
+    def findConversationsPage(self, userId: str, limit: int,
+                              before: Optional[Tuple[datetime, str]] = None) -> List[Conversation]:
+        """Newest-first page of a user's conversations, strictly older than the (createdAt, conversationId) cursor"""
+        with self._conn() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                if before is None:
+                    cur.execute(
+                        '''SELECT * FROM conversations WHERE "userId"=%s
+                           ORDER BY "createdAt" DESC, "conversationId" DESC LIMIT %s''',
+                        (userId, limit)
+                    )
+                else:
+                    cur.execute(
+                        '''SELECT * FROM conversations
+                           WHERE "userId"=%s AND ("createdAt","conversationId") < (%s, %s::uuid)
+                           ORDER BY "createdAt" DESC, "conversationId" DESC LIMIT %s''',
+                        (userId, before[0], before[1], limit)
+                    )
+                rows = cur.fetchall()
+                return [Conversation(
+                    conversationId=str(r["conversationId"]),
+                    userId=str(r["userId"]),
+                    title=r["title"],
+                    messageCount=int(r["messageCount"]),
+                    createdAt=r["createdAt"],
+                ) for r in rows]
+
+    def updateTitle(self, conversationId: str, userId: str, title: str):
         with self._conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    'UPDATE conversations SET "title"=%s WHERE "conversationId"=%s',
-                    (title, conversationId)
+                    'UPDATE conversations SET "title"=%s WHERE "conversationId"=%s AND "userId"=%s',
+                    (title, conversationId, userId)
                 )
+                if cur.rowcount == 0:
+                    raise ConversationNotFoundError("Conversation not found")
+
+    def replaceTitle(self, conversationId: str, userId: str, old: str, new: str) -> bool:
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_REPLACE_TITLE, (new, conversationId, userId, old))
+                return cur.rowcount > 0
 
     def countConversations(self, userId: str) -> int:
         with self._conn() as conn:
@@ -139,22 +644,43 @@ class Database:
         with self._conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    'INSERT INTO messages("conversationId","content","senderId") VALUES (%s,%s,%s) RETURNING "messageId"',
+                    'INSERT INTO messages("conversationId","content","senderId") VALUES (%s,%s,%s) RETURNING "messageId","timestamp"',
                     (conversationId, text, senderId),
                 )
-                (mid,) = cur.fetchone()
+                mid, ts = cur.fetchone()
                 
                 cur.execute(
-                    'UPDATE conversations SET "messageCount"="messageCount"+1 WHERE "conversationId"=%s',
+                    'UPDATE conversations SET "messageCount"="messageCount"+1 WHERE "conversationId"=%s RETURNING "userId","messageCount"',
                     (conversationId,)
                 )
+                userId, newCount = cur.fetchone()
                 
-                return str(mid)
+                if senderId == "user":
+                    cur.execute(
+                        '''INSERT INTO user_stats("userId","fluencySum","wordChoiceSum","grammarSum","scoreCount","messageCount","conversationCount")
+                           VALUES (%s,0,0,0,0,1,0) ''' + _STATS_ADD,
+                        (userId,)
+                    )
+        
+        if self.contextCache is not None:
+            self.contextCache.append(
+                conversationId,
+                [Message(str(mid), conversationId, text, senderId, ts)],
+                int(newCount) - 1
+            )
+        return str(mid)
 
-    def deleteConversation(self, conversationId: str):
+    def deleteConversation(self, conversationId: str, userId: str):
         with self._conn() as conn:
             with conn.cursor() as cur:
+                cur.execute(_LOCK_CONVERSATION, (conversationId, userId))
+                if cur.fetchone() is None:
+                    raise ConversationNotFoundError("Conversation not found")
+                cur.execute(_STATS_SUBTRACT_CONVERSATION, {"cid": conversationId, "dropConversation": 1})
                 cur.execute('DELETE FROM conversations WHERE "conversationId"=%s', (conversationId,))
+        
+        if self.contextCache is not None:
+            self.contextCache.invalidate(conversationId)
 
     def findMessages(self, conversationId: str) -> List[Message]:
         with self._conn() as conn:
@@ -172,7 +698,57 @@ class Database:
                     timestamp=r["timestamp"],
                 ) for r in rows]
 
+    def findMessagesPage(self, conversationId: str, limit: int,
+                         before: Optional[Tuple[datetime, str]] = None) -> List[Message]:
+        """The newest `limit` messages older than the (timestamp, messageId) cursor, returned oldest first"""
+        with self._conn() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                if before is None:
+                    cur.execute(
+                        '''SELECT * FROM messages WHERE "conversationId"=%s
+                           ORDER BY "timestamp" DESC, "messageId" DESC LIMIT %s''',
+                        (conversationId, limit)
+                    )
+                else:
+                    cur.execute(
+                        '''SELECT * FROM messages
+                           WHERE "conversationId"=%s AND ("timestamp","messageId") < (%s, %s::uuid)
+                           ORDER BY "timestamp" DESC, "messageId" DESC LIMIT %s''',
+                        (conversationId, before[0], before[1], limit)
+                    )
+                rows = cur.fetchall()
+                rows.reverse()
+                return [Message(
+                    messageId=str(r["messageId"]),
+                    conversationId=str(r["conversationId"]),
+                    content=r["content"],
+                    senderId=r["senderId"],
+                    timestamp=r["timestamp"],
+                ) for r in rows]
+
+    def findMessagesRange(self, conversationId: str, start: int, end: int) -> List[Message]:
+        """Messages [start, end) in conversation order, oldest first"""
+        with self._conn() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(
+                    '''SELECT * FROM messages WHERE "conversationId"=%s
+                       ORDER BY "timestamp" ASC, "messageId" ASC OFFSET %s LIMIT %s''',
+                    (conversationId, start, max(0, end - start))
+                )
+                return [Message(
+                    messageId=str(r["messageId"]),
+                    conversationId=str(r["conversationId"]),
+                    content=r["content"],
+                    senderId=r["senderId"],
+                    timestamp=r["timestamp"],
+                ) for r in cur.fetchall()]
+
     def getLastMessages(self, conversationId: str, count: int) -> List[Message]:
+        if self.contextCache is not None:
+            cached = self.contextCache.get(conversationId, count)
+            if cached is not None:
+                return cached[1]
+        
         with self._conn() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute(
@@ -189,76 +765,201 @@ class Database:
                     timestamp=r["timestamp"],
                 ) for r in rows]
 
-    def deleteMessages(self, conversationId: str):
+    def getTurnContext(self, conversationId: str, userId: str,
+                       count: int) -> Tuple[int, List[Message], ConversationSummary]:
+        if self.contextCache is not None:
+            cached = self.contextCache.get(conversationId, count, userId)
+            if cached is not None:
+                return cached
+        
+        with self._conn() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(_TURN_CONTEXT, (count, conversationId, userId))
+                rows = cur.fetchall()
+                if not rows:
+                    raise ConversationNotFoundError("Conversation not found")
+                rows.reverse()
+                messageCount = int(rows[0]["messageCount"])
+                summary = ConversationSummary(rows[0]["summary"], int(rows[0]["summaryCount"]))
+                messages = [Message(
+                    messageId=str(r["messageId"]),
+                    conversationId=conversationId,
+                    content=r["content"],
+                    senderId=r["senderId"],
+                    timestamp=r["timestamp"],
+                ) for r in rows if r["messageId"] is not None]
+        
+        if self.contextCache is not None and count >= self.contextCache.window:
+            self.contextCache.fill(conversationId, userId, messageCount, messages, summary)
+        return messageCount, messages, summary
+
+    def findSummary(self, conversationId: str) -> Tuple[int, ConversationSummary]:
+        """The conversation's message count and current rolling summary"""
         with self._conn() as conn:
             with conn.cursor() as cur:
-                cur.execute('DELETE FROM messages WHERE "conversationId"=%s', (conversationId,))
                 cur.execute(
-                    'UPDATE conversations SET "messageCount"=0 WHERE "conversationId"=%s',
+                    'SELECT "messageCount","summary","summaryCount" FROM conversations WHERE "conversationId"=%s',
                     (conversationId,)
                 )
+                r = cur.fetchone()
+                if not r:
+                    raise ValueError("Conversation not found")
+                return int(r[0]), ConversationSummary(r[1], int(r[2]))
 
-    def checkMessageLimit(self, conversationId: str) -> int:
+    def saveSummary(self, conversationId: str, summary: ConversationSummary, previousCount: int) -> bool:
+        """Store a new summary unless another writer already moved it past previousCount"""
         with self._conn() as conn:
             with conn.cursor() as cur:
-                cur.execute('SELECT COUNT(*) FROM messages WHERE "conversationId"=%s', (conversationId,))
-                (c,) = cur.fetchone()
-                return int(c)
+                cur.execute(_SAVE_SUMMARY, (summary.text, summary.messageCount, conversationId, previousCount))
+                saved = cur.rowcount > 0
+        
+        if saved and self.contextCache is not None:
+            self.contextCache.setSummary(conversationId, summary)
+        return saved
 
-    def saveScores(self, messageId: str, scores: Scores):
+    def deleteMessages(self, conversationId: str, userId: str):
         with self._conn() as conn:
             with conn.cursor() as cur:
+                cur.execute(_LOCK_CONVERSATION, (conversationId, userId))
+                if cur.fetchone() is None:
+                    raise ConversationNotFoundError("Conversation not found")
+                cur.execute(_STATS_SUBTRACT_CONVERSATION, {"cid": conversationId, "dropConversation": 0})
+                cur.execute('DELETE FROM messages WHERE "conversationId"=%s', (conversationId,))
                 cur.execute(
-                    '''INSERT INTO feedback("messageId","fluencyScore","wordChoiceScore","grammarScore")
-                       VALUES (%s,%s,%s,%s)
-                       ON CONFLICT ("messageId") DO UPDATE SET
-                       "fluencyScore"=EXCLUDED."fluencyScore",
-                       "wordChoiceScore"=EXCLUDED."wordChoiceScore",
-                       "grammarScore"=EXCLUDED."grammarScore"''',
-                    (messageId, scores.fluency, scores.wordChoice, scores.grammar),
+                    '''UPDATE conversations SET "messageCount"=0, "summary"='', "summaryCount"=0
+                       WHERE "conversationId"=%s''',
+                    (conversationId,)
                 )
+        
+        if self.contextCache is not None:
+            self.contextCache.reset(conversationId)
+
+    def saveScores(self, messageId: str, scores: Scores):
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_UPSERT_SCORES, {"mid": messageId, "f": scores.fluency, "w": scores.wordChoice, "g": scores.grammar})
 
     def saveTips(self, messageId: str, tips: List[str]):
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_SAVE_TIPS, (tips, messageId))
+
+    def saveFeedback(self, messageId: str, scores: Scores, tips: List[str]):
+        """Scores and tips of a turn saved without feedback, in one transaction"""
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_UPSERT_SCORES, {"mid": messageId, "f": scores.fluency, "w": scores.wordChoice, "g": scores.grammar})
+                cur.execute(_SAVE_TIPS, (list(tips), messageId))
+
+    def findFeedback(self, messageId: str, userId: str) -> Optional[Tuple[Scores, List[str]]]:
+        """Feedback of one of the user's messages; None while it has not been saved yet"""
         with self._conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    'UPDATE feedback SET "feedbackTips"=%s WHERE "messageId"=%s',
-                    (tips, messageId)
+                    '''SELECT f."fluencyScore", f."wordChoiceScore", f."grammarScore", f."feedbackTips"
+                       FROM messages m
+                       JOIN conversations c ON c."conversationId"=m."conversationId"
+                       LEFT JOIN feedback f ON f."messageId"=m."messageId"
+                       WHERE m."messageId"=%s AND c."userId"=%s AND m."senderId"='user' ''',
+                    (messageId, userId),
                 )
+                r = cur.fetchone()
+                if not r:
+                    raise ValueError("Message not found")
+                if r[0] is None:
+                    return None
+                return Scores(int(r[0]), int(r[1]), int(r[2])), list(r[3] or [])
 
-    def getAllScores(self, userId: str) -> List[Scores]:
+    def findUnscoredText(self, messageId: str, userId: str, olderThanSeconds: float) -> Optional[str]:
+        """Text of one of the user's messages that has had no feedback row for olderThanSeconds"""
         with self._conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    '''SELECT f."fluencyScore", f."wordChoiceScore", f."grammarScore"
-                       FROM feedback f
-                       JOIN messages m ON m."messageId"=f."messageId"
+                    '''SELECT m."content"
+                       FROM messages m
                        JOIN conversations c ON c."conversationId"=m."conversationId"
-                       WHERE c."userId"=%s AND m."senderId"='user' ''',
-                    (userId,),
+                       LEFT JOIN feedback f ON f."messageId"=m."messageId"
+                       WHERE m."messageId"=%s AND c."userId"=%s AND m."senderId"='user'
+                         AND f."messageId" IS NULL AND m."timestamp" < NOW() - make_interval(secs => %s)''',
+                    (messageId, userId, olderThanSeconds),
                 )
-                rows = cur.fetchall()
-                return [Scores(int(r[0]), int(r[1]), int(r[2])) for r in rows]
+                r = cur.fetchone()
+                return r[0] if r else None
 
-    def getAllUserMessages(self, userId: str) -> List[Message]:
+    def getUserStats(self, userId: str) -> Optional[UserStats]:
         with self._conn() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute(
-                    '''SELECT m.*
-                       FROM messages m
-                       JOIN conversations c ON c."conversationId"=m."conversationId"
-                       WHERE c."userId"=%s AND m."senderId"='user'
-                       ORDER BY m."timestamp" ASC''',
-                    (userId,),
+                    '''SELECT u."email", u."nickname", u."selectedVoice", u."createdAt",
+                              s."fluencySum", s."wordChoiceSum", s."grammarSum",
+                              s."scoreCount", s."messageCount", s."conversationCount"
+                       FROM users u
+                       LEFT JOIN user_stats s ON s."userId"=u."userId"
+                       WHERE u."userId"=%s''',
+                    (userId,)
+                )
+                r = cur.fetchone()
+                if not r:
+                    return None
+                return UserStats(
+                    userId=userId,
+                    fluencySum=int(r["fluencySum"] or 0),
+                    wordChoiceSum=int(r["wordChoiceSum"] or 0),
+                    grammarSum=int(r["grammarSum"] or 0),
+                    scoreCount=int(r["scoreCount"] or 0),
+                    messageCount=int(r["messageCount"] or 0),
+                    conversationCount=int(r["conversationCount"] or 0),
+                    accountInfo={
+                        "email": r["email"],
+                        "nickname": r["nickname"],
+                        "selectedVoice": r["selectedVoice"],
+                        "createdAt": r["createdAt"].isoformat()
+                    },
                 )
-                rows = cur.fetchall()
-                return [Message(
-                    messageId=str(r["messageId"]),
-                    conversationId=str(r["conversationId"]),
-                    content=r["content"],
-                    senderId=r["senderId"],
-                    timestamp=r["timestamp"],
-                ) for r in rows]
+
+    def rebuildUserStats(self, userId: Optional[str] = None) -> int:
+        """Recompute user_stats from the base tables (backfill, or repair after manual edits)"""
+        with self._conn() as conn:
+            with conn.cursor() as cur:
+                # Blocks incremental updates until the rebuild commits, so none are lost
+                # or counted twice.
+                cur.execute("LOCK TABLE user_stats IN EXCLUSIVE MODE")
+                cur.execute(
+                    '''INSERT INTO user_stats("userId","fluencySum","wordChoiceSum","grammarSum","scoreCount","messageCount","conversationCount")
+                       SELECT u."userId",
+                              COALESCE(sc.f,0), COALESCE(sc.w,0), COALESCE(sc.g,0), COALESCE(sc.n,0),
+                              COALESCE(mc.n,0), COALESCE(cc.n,0)
+                       FROM users u
+                       LEFT JOIN (
+                           SELECT c."userId", SUM(f."fluencyScore") AS f, SUM(f."wordChoiceScore") AS w,
+                                  SUM(f."grammarScore") AS g, COUNT(*) AS n
+                           FROM feedback f
+                           JOIN messages m ON m."messageId"=f."messageId"
+                           JOIN conversations c ON c."conversationId"=m."conversationId"
+                           WHERE m."senderId"='user'
+                           GROUP BY c."userId"
+                       ) sc ON sc."userId"=u."userId"
+                       LEFT JOIN (
+                           SELECT c."userId", COUNT(*) AS n
+                           FROM messages m
+                           JOIN conversations c ON c."conversationId"=m."conversationId"
+                           WHERE m."senderId"='user'
+                           GROUP BY c."userId"
+                       ) mc ON mc."userId"=u."userId"
+                       LEFT JOIN (
+                           SELECT "userId", COUNT(*) AS n FROM conversations GROUP BY "userId"
+                       ) cc ON cc."userId"=u."userId"
+                       WHERE %(uid)s::uuid IS NULL OR u."userId"=%(uid)s::uuid
+                       ON CONFLICT ("userId") DO UPDATE SET
+                       "fluencySum"=EXCLUDED."fluencySum",
+                       "wordChoiceSum"=EXCLUDED."wordChoiceSum",
+                       "grammarSum"=EXCLUDED."grammarSum",
+                       "scoreCount"=EXCLUDED."scoreCount",
+                       "messageCount"=EXCLUDED."messageCount",
+                       "conversationCount"=EXCLUDED."conversationCount"''',
+                    {"uid": userId},
+                )
+                return cur.rowcount
 
     def getConversationCount(self, userId: str) -> int:
         return self.countConversations(userId)
@@ -296,6 +997,11 @@ class Database:
                 )
 
     def _get_last_sender(self, conversationId: str) -> Optional[str]:
+        if self.contextCache is not None:
+            known, sender = self.contextCache.lastSender(conversationId)
+            if known:
+                return sender
+        
         with self._conn() as conn:
             with conn.cursor() as cur:
                 cur.execute(
@@ -305,6 +1011,21 @@ class Database:
                 row = cur.fetchone()
                 return row[0] if row else None
 
+    def findSession(self, sessionId: str) -> Optional[Session]:
+        with self._conn() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(_FIND_SESSION, (sessionId,))
+                r = cur.fetchone()
+                if not r:
+                    return None
+                return Session(
+                    sessionId=str(r["sessionId"]),
+                    userId=str(r["userId"]),
+                    createdAt=r["createdAt"],
+                    expiresAt=r["expiresAt"],
+                    invalidatedAt=r["invalidatedAt"],
+                )
+
     def _saveSession(self, sessionId: str, userId: str, createdAt, expiresAt):
         with self._conn() as conn:
             with conn.cursor() as cur:
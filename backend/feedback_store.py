@@ -0,0 +1,183 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple, Union
+import queue
+import threading
+import uuid
+from database import Database
+from models import Scores
+from nlp_engine import NLPEngine
+from nlp_service import NLPScoringService
+import metrics
+
+class _Entry:
+    __slots__ = ("userId", "status", "scores", "tips", "error")
+
+    def __init__(self, userId: str):
+        self.userId = userId
+        self.status = "pending"
+        self.scores: Optional[Scores] = None
+        self.tips: List[str] = []
+        self.error = ""
+
+def feedbackView(status: str, scores: Optional[Scores] = None, tips: Optional[List[str]] = None,
+                 error: str = "") -> Dict[str, Any]:
+    out: Dict[str, Any] = {"status": status}
+    if scores is not None:
+        out["scores"] = {
+            "fluency": scores.fluency,
+            "wordChoice": scores.wordChoice,
+            "grammar": scores.grammar
+        }
+        out["tips"] = list(tips or [])
+    if error:
+        out["error"] = error
+    return out
+
+class FeedbackStore:
+    """Deferred feedback: turns saved without scores get them here once scoring finishes.
+
+    track() takes the scoring future of a saved user message. When it resolves, a
+    worker thread writes the feedback row (Database.saveFeedback) and keeps the
+    result in memory for the polling endpoint. Finished entries are kept for the
+    last maxEntries messages; older ones are answered from the database.
+
+    The feedback row is what counts: if scoring fails, the saved text is scored
+    again here, and a message still without a row rescoreAfterSeconds after it
+    was sent (its scoring was lost to a restart or ran in another process) is
+    scored from its text when it is polled.
+    """
+
+    def __init__(self, database: Database, mlEngine: Optional[Union[NLPEngine, NLPScoringService]] = None,
+                 workers: int = 1, maxEntries: int = 10000, rescoreAfterSeconds: float = 60.0):
+        self.database = database
+        self.mlEngine = mlEngine
+        self.maxEntries = maxEntries
+        self.rescoreAfterSeconds = rescoreAfterSeconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats = {"tracked": 0, "saved": 0, "failed": 0, "rescored": 0}
+        self.workers = max(1, workers)
+        self._workers: List[threading.Thread] = []
+
+    def track(self, messageId: str, userId: str, text: str, scoring: Future):
+        with self._lock:
+            self._entries[messageId] = _Entry(userId)
+            self._stats["tracked"] += 1
+            self._startWorkers()
+        # Done-callbacks run on the scoring pool's threads; the database write goes to our workers.
+        scoring.add_done_callback(lambda f: self._queue.put((messageId, text, f)))
+
+    def get(self, messageId: str, userId: str) -> Dict[str, Any]:
+        try:
+            messageId = str(uuid.UUID(messageId))
+        except (ValueError, TypeError, AttributeError):
+            raise ValueError("Message not found")
+        
+        with self._lock:
+            entry = self._entries.get(messageId)
+            if entry is not None:
+                if entry.userId != userId:
+                    raise ValueError("Message not found")
+                return feedbackView(entry.status, entry.scores, entry.tips, entry.error)
+        
+        saved = self.database.findFeedback(messageId, userId)
+        if saved is None:
+            # Not scored yet, possibly by another worker process.
+            self._recover(messageId, userId)
+            return feedbackView("pending")
+        return feedbackView("ready", *saved)
+
+    @metrics.counters("tracked", "saved", "failed", "rescored")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["pending"] = sum(1 for e in self._entries.values() if e.status == "pending")
+        out["queueDepth"] = self._queue.qsize()
+        return out
+
+    def shutdown(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for t in self._workers:
+            t.join()
+
+    def _startWorkers(self):
+        # Called with the lock held: the threads start with the first tracked message, not when the app is built.
+        if not self._workers:
+            self._workers = [
+                threading.Thread(target=self._run, name=f"feedback-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._workers:
+                t.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._save(*item)
+
+    def _save(self, messageId: str, text: str, scoring: Optional[Future]):
+        try:
+            sc, tips = self._score(messageId, text, scoring)
+            self.database.saveFeedback(messageId, sc, tips)
+        except Exception as e:
+            print(f"Deferred feedback for {messageId} failed: {e}")
+            self._finish(messageId, "failed", error="Feedback could not be computed")
+            return
+        self._finish(messageId, "ready", sc, tips)
+
+    def _score(self, messageId: str, text: str, scoring: Optional[Future]) -> Tuple[Scores, List[str]]:
+        """The tracked scoring result; if it failed (or there is none), the saved text scored here"""
+        if scoring is not None:
+            try:
+                return scoring.result()
+            except Exception as e:
+                if self.mlEngine is None:
+                    raise
+                print(f"Deferred feedback for {messageId} failed, scoring the text again: {e}")
+        return self.mlEngine.evaluate(text)
+
+    def _recover(self, messageId: str, userId: str):
+        """No feedback row and nothing in flight here: score the saved text if it is overdue"""
+        if self.mlEngine is None:
+            return
+        text = self.database.findUnscoredText(messageId, userId, self.rescoreAfterSeconds)
+        if text is None:
+            return
+        with self._lock:
+            if messageId in self._entries:
+                return
+            self._entries[messageId] = _Entry(userId)
+            self._stats["rescored"] += 1
+            self._startWorkers()
+        self._queue.put((messageId, text, None))
+
+    def _finish(self, messageId: str, status: str, scores: Optional[Scores] = None,
+                tips: Optional[List[str]] = None, error: str = ""):
+        with self._lock:
+            entry = self._entries.get(messageId)
+            if entry is not None:
+                entry.status = status
+                entry.scores = scores
+                entry.tips = list(tips or [])
+                entry.error = error
+                self._entries.move_to_end(messageId)
+            self._stats["saved" if status == "ready" else "failed"] += 1
+            self._evict()
+
+    def _evict(self):
+        # Only finished entries are dropped; pending ones must survive until their write lands.
+        excess = len(self._entries) - self.maxEntries
+        if excess <= 0:
+            return
+        for key in list(self._entries):
+            if excess <= 0:
+                return
+            if self._entries[key].status != "pending":
+                del self._entries[key]
+                excess -= 1
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Union, Dict, Any, Optional
+import threading
+import time
+from nlp_engine import NLPEngine
+from nlp_service import NLPScoringService
+import metrics
+
+def normalizeSpeech(text: str) -> str:
+    return " ".join((text or "").split())
+
+class _Utterance:
+    __slots__ = ("analyzed", "parsed", "segments", "updatedAt")
+
+    def __init__(self):
+        self.analyzed = ""
+        self.parsed: Optional[Future] = None
+        self.segments = 0
+        self.updatedAt = time.monotonic()
+
+class InterimAnalyzer:
+    """Parses a learner's speech while they are still talking.
+
+    The client streams the recognizer's transcript: the finalized text so far and the
+    interim tail. Whenever the finalized text grows, it is parsed in the background as a
+    whole (features of separately parsed segments would put sentence boundaries, and the
+    capitalization and end-punctuation checks, wherever the recognizer happened to split).
+    When the turn is sent with exactly the last parsed text, scoringFor() only has to
+    score those features, so feedback is nearly ready when the utterance ends. Otherwise
+    the turn is scored from scratch as usual.
+
+    One utterance is tracked per user (the first spoken message of a conversation is
+    sent before the conversation exists).
+    """
+
+    def __init__(self, mlEngine: Union[NLPEngine, NLPScoringService], maxUtterances: int = 1000,
+                 ttlSeconds: float = 300.0):
+        self.mlEngine = mlEngine
+        self.engine = mlEngine.engine if isinstance(mlEngine, NLPScoringService) else mlEngine
+        self.maxUtterances = maxUtterances
+        self.ttlSeconds = ttlSeconds
+        self._lock = threading.Lock()
+        self._utterances: "OrderedDict[str, _Utterance]" = OrderedDict()
+        # Only used when parsing happens in this process (plain NLPEngine).
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"updates": 0, "segments": 0, "resets": 0, "superseded": 0, "turns": 0, "hits": 0,
+                       "mismatches": 0, "reusedChars": 0}
+
+    def update(self, userId: str, finalText: str, partialText: str = "") -> Dict[str, Any]:
+        """Record the transcript so far; parses the finalized text again when it has grown"""
+        final = normalizeSpeech(finalText)
+        with self._lock:
+            self._stats["updates"] += 1
+            utterance = self._utterances.get(userId)
+            if utterance is not None and not self._extends(final, utterance.analyzed) \
+                    and not self._extends(utterance.analyzed, final):
+                # The recognizer revised text we already parsed: start over.
+                self._stats["resets"] += 1
+                self._supersede(utterance)
+                utterance = None
+            if utterance is None:
+                utterance = _Utterance()
+                self._utterances[userId] = utterance
+            self._utterances.move_to_end(userId)
+            utterance.updatedAt = time.monotonic()
+        
+            slot = None
+            if len(final) > len(utterance.analyzed):
+                # Reserve the parse; it may run inline, so it happens outside the lock.
+                self._supersede(utterance)
+                slot = Future()
+                utterance.parsed = slot
+                utterance.analyzed = final
+                utterance.segments += 1
+                self._stats["segments"] += 1
+            self._evict()
+            out = {"segments": utterance.segments, "analyzedChars": len(utterance.analyzed),
+                   "partialChars": len(normalizeSpeech(partialText))}
+        
+        if slot is not None:
+            self._analyzeInto(final, slot)
+        return out
+
+    def discard(self, userId: str):
+        with self._lock:
+            utterance = self._utterances.pop(userId, None)
+            if utterance is not None:
+                self._supersede(utterance)
+
+    def scoringFor(self, userId: str, text: str) -> Optional[Future]:
+        """Future of (Scores, tips) for the sent text from its parse made while it was spoken; None if
+        the sent text is not the one that was parsed
+        """
+        final = normalizeSpeech(text)
+        with self._lock:
+            utterance = self._utterances.pop(userId, None)
+            if utterance is None or utterance.parsed is None:
+                return None
+            self._stats["turns"] += 1
+            if final != utterance.analyzed:
+                self._stats["mismatches"] += 1
+                self._supersede(utterance)
+                return None
+            self._stats["hits"] += 1
+            self._stats["reusedChars"] += len(final)
+        
+        return self._evaluate(utterance.parsed)
+
+    @metrics.counters("updates", "segments", "resets", "superseded", "turns", "hits", "mismatches", "reusedChars")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["utterances"] = len(self._utterances)
+        out["hitRate"] = round(out["hits"] / out["turns"], 3) if out["turns"] else 0.0
+        return out
+
+    def _extends(self, text: str, prefix: str) -> bool:
+        return text.startswith(prefix) and (len(text) == len(prefix) or not prefix or text[len(prefix)] == " ")
+
+    def _supersede(self, utterance: _Utterance):
+        # Called with the lock held. A parse still queued is dropped (the scoring service skips cancelled work).
+        if utterance.parsed is not None and utterance.parsed.cancel():
+            self._stats["superseded"] += 1
+        utterance.parsed = None
+
+    def _analyzeInto(self, text: str, slot: Future):
+        if isinstance(self.mlEngine, NLPScoringService):
+            parsed = self.mlEngine.analyze(text)
+        else:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="interim-nlp")
+            parsed = self._executor.submit(self.engine.analyze, text)
+        
+        def copy(f: Future):
+            if not slot.set_running_or_notify_cancel():
+                return
+            try:
+                slot.set_result(f.result())
+            except Exception as e:
+                slot.set_exception(e)
+        
+        slot.add_done_callback(lambda s: parsed.cancel() if s.cancelled() else None)
+        parsed.add_done_callback(copy)
+
+    def _evaluate(self, parsed: Future) -> Future:
+        out: Future = Future()
+        
+        def done(_):
+            if not out.set_running_or_notify_cancel():
+                # The turn was cancelled before its scoring finished.
+                return
+            try:
+                out.set_result(self.engine.evaluateFeatures(parsed.result()))
+            except Exception as e:
+                out.set_exception(e)
+        
+        parsed.add_done_callback(done)
+        return out
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._utterances:
+            userId, oldest = next(iter(self._utterances.items()))
+            if len(self._utterances) <= self.maxUtterances and now - oldest.updatedAt < self.ttlSeconds:
+                return
+            self._supersede(oldest)
+            del self._utterances[userId]
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Any, Optional
+import asyncio
+import threading
+import time
+import metrics
+
+CHAT = 0
+TITLE = 1
+BACKGROUND = 2
+SPECULATIVE = 3
+PRIORITY_NAMES = {CHAT: "chat", TITLE: "title", BACKGROUND: "background", SPECULATIVE: "speculative"}
+
+class LLMBusyError(Exception):
+    pass
+
+class _Waiter:
+    __slots__ = ("priority", "userId", "enqueuedAt", "grant", "granted")
+
+    def __init__(self, priority: int, userId: str, grant: Callable[[], None]):
+        self.priority = priority
+        self.userId = userId
+        self.enqueuedAt = time.monotonic()
+        self.grant = grant
+        self.granted = False
+
+class LLMScheduler:
+    """Caps concurrent LLM calls and orders the ones waiting for a slot.
+
+    Lower priority numbers go first (chat turns, then titles, then background work
+    such as summaries, then replies started speculatively). Within a priority, users are served round-robin so one
+    chatty user cannot starve the rest. At
+    most maxQueue calls wait; beyond that, and after maxWait seconds in the queue,
+    callers get LLMBusyError instead of piling onto a slow model.
+    """
+
+    def __init__(self, maxConcurrent: int = 4, maxQueue: int = 64, maxWait: float = 10.0):
+        if maxConcurrent < 1:
+            raise ValueError("maxConcurrent must be at least 1")
+        self.maxConcurrent = maxConcurrent
+        self.maxQueue = max(0, maxQueue)
+        self.maxWait = maxWait
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._stats = {"granted": 0, "queuedTotal": 0, "rejected": 0, "timeouts": 0, "waitMsTotal": 0.0, "waitMsMax": 0.0}
+
+    @contextmanager
+    def slot(self, priority: int = CHAT, userId: str = ""):
+        event = threading.Event()
+        waiter = self._enter(priority, userId, event.set)
+        if waiter is not None and not event.wait(self.maxWait):
+            self._giveUp(waiter)
+        if waiter is not None:
+            self._recordWait(waiter)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def asyncSlot(self, priority: int = CHAT, userId: str = ""):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        
+        def grant():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        
+        waiter = self._enter(priority, userId, grant)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.maxWait)
+            except asyncio.TimeoutError:
+                self._giveUp(waiter)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release()
+                raise
+            self._recordWait(waiter)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @metrics.counters("granted", "queuedTotal", "rejected", "timeouts", "waitMsTotal")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["active"] = self._active
+            out["queued"] = self._queued
+            for p, name in PRIORITY_NAMES.items():
+                out["queued" + name.capitalize()] = sum(len(q) for q in self._queues[p].values())
+        out["maxConcurrent"] = self.maxConcurrent
+        out["maxQueue"] = self.maxQueue
+        out["avgWaitMs"] = round(out["waitMsTotal"] / out["queuedTotal"], 1) if out["queuedTotal"] else 0.0
+        return out
+
+    def _enter(self, priority: int, userId: str, grant: Callable[[], None]) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or join the queue (returns the waiter)"""
+        with self._lock:
+            if self._active < self.maxConcurrent and self._queued == 0:
+                self._active += 1
+                self._stats["granted"] += 1
+                return None
+            if self._queued >= self.maxQueue:
+                self._stats["rejected"] += 1
+                raise LLMBusyError("The AI is busy right now. Please try again in a moment.")
+        
+            waiter = _Waiter(priority, userId, grant)
+            self._queues[priority].setdefault(userId, deque()).append(waiter)
+            self._queued += 1
+            self._stats["queuedTotal"] += 1
+            return waiter
+
+    def _release(self):
+        with self._lock:
+            waiter = self._next()
+            if waiter is None:
+                self._active -= 1
+                return
+            # The slot passes straight to the waiter; _active stays the same.
+            waiter.granted = True
+            self._stats["granted"] += 1
+        waiter.grant()
+
+    def _next(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if not users:
+                continue
+            userId, queue = next(iter(users.items()))
+            waiter = queue.popleft()
+            if queue:
+                users.move_to_end(userId)
+            else:
+                del users[userId]
+            self._queued -= 1
+            return waiter
+        return None
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Take a waiter out of the queue; True if it was granted a slot in the meantime"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue = self._queues[waiter.priority].get(waiter.userId)
+            if queue is not None:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[waiter.priority][waiter.userId]
+            self._queued -= 1
+            return False
+
+    def _giveUp(self, waiter: _Waiter):
+        if self._abandon(waiter):
+            return
+        with self._lock:
+            self._stats["timeouts"] += 1
+        raise LLMBusyError("Timed out waiting for the AI. Please try again in a moment.")
+
+    def _recordWait(self, waiter: _Waiter):
+        wait = time.monotonic() - waiter.enqueuedAt
+        metrics.record("llm_queue", wait)
+        metrics.LLM_QUEUE_SECONDS.observe(wait, priority=PRIORITY_NAMES[waiter.priority])
+        with self._lock:
+            self._stats["waitMsTotal"] += wait * 1000
+            self._stats["waitMsMax"] = max(self._stats["waitMsMax"], wait * 1000)
@@ -1,32 +1,193 @@
 from __future__ import annotations
-from database import Database
-from ai_service import AIService
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Union, Iterator, Dict, Any, List, Optional, Tuple
+import contextvars
+import threading
+import time
+from database import Database, DEFAULT_TITLE
+from ai_service import AIService, SentenceBuffer
+from llm_scheduler import LLMBusyError
+from models import ConversationSummary, Message
 from nlp_engine import NLPEngine
+from nlp_service import NLPScoringService
+from title_jobs import TitleJobQueue
+from summary_jobs import SummaryJobQueue
+from interim_analysis import InterimAnalyzer
+from speculation import SpeculativeResponder
+from feedback_store import FeedbackStore
+import metrics
+
+class TurnCancelledError(Exception):
+    pass
+
+class _ScoringClock:
+    """When a turn's scoring started and finished, for the llm/nlp overlap in the timing breakdown"""
+
+    __slots__ = ("startedAt", "finishedAt")
+
+    def __init__(self):
+        self.startedAt = time.monotonic()
+        self.finishedAt: Optional[float] = None
+
+    def stop(self, _future: Future = None):
+        self.finishedAt = time.monotonic()
+
+class _ActiveTurn:
+    """A turn that has not been saved yet; cancel() stops it at the next token or before the save.
+
+    Also carries the turn's timestamps, so the sync and async pipelines time it the same way.
+    """
+
+    def __init__(self, conversationId: str, userId: str, text: str, scoring: Future, clock: _ScoringClock,
+                 start: float):
+        self.conversationId = conversationId
+        self.userId = userId
+        self.text = text
+        self.scoring = scoring
+        self.clock = clock
+        self.start = start
+        self.llmStart = start
+        self.llmEnd: Optional[float] = None
+        self.reason = ""
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+        # Only succeeds while the scoring job is still queued.
+        self.scoring.cancel()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise TurnCancelledError("The message was cancelled")
+
+class _ReplyStream:
+    """A streamed reply's tokens, the sentences completed so far and its time to first token"""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.ttftMs: Optional[float] = None
+        self.parts: List[str] = []
+        self._sentences = SentenceBuffer()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+    def feed(self, token: str) -> List[Dict[str, Any]]:
+        if self.ttftMs is None:
+            self.ttftMs = round((time.monotonic() - self.start) * 1000, 1)
+        self.parts.append(token)
+        events = [{"type": "token", "text": token}]
+        events.extend({"type": "sentence", "text": s} for s in self._sentences.feed(token))
+        return events
+
+    def flush(self) -> List[Dict[str, Any]]:
+        rest = self._sentences.flush()
+        return [{"type": "sentence", "text": rest}] if rest else []
 
 class MessageController:
-    def __init__(self, database: Database, aiService: AIService, mlEngine: NLPEngine):
+    """Runs chat turns; holds no per-request state, so one instance is shared by all request threads.
+
+    The only per-conversation state is the last sent text used by retry(), kept in a bounded map,
+    and the turns in progress, which cancelInput() can stop.
+    """
+
+    MAX_MESSAGES = 100
+    MAX_RETRY_ENTRIES = 10000
+    LIMIT_ERROR = "This conversation has reached the maximum of 100 message exchanges. Please start a new conversation to continue."
+
+    def __init__(self, database: Database, aiService: AIService, mlEngine: Union[NLPEngine, NLPScoringService],
+                 scoringThreads: int = 4, titleJobs: Optional[TitleJobQueue] = None,
+                 feedbackStore: Optional[FeedbackStore] = None, summaryJobs: Optional[SummaryJobQueue] = None,
+                 interimAnalyzer: Optional[InterimAnalyzer] = None,
+                 speculation: Optional[SpeculativeResponder] = None):
         self.database = database
         self.aiService = aiService
         self.mlEngine = mlEngine
-        self._activeConversationId = ""
-        self._activeUserId = ""
-        self._lastText = ""
-
-    def _setActive(self, conversationId: str, userId: str):
-        self._activeConversationId = conversationId
-        self._activeUserId = userId
+        self.titleJobs = titleJobs
+        self.feedbackStore = feedbackStore
+        self.summaryJobs = summaryJobs
+        self.interimAnalyzer = interimAnalyzer
+        self.speculation = speculation
+        self.contextBuilder = aiService.contextBuilder
+        self._retryLock = threading.Lock()
+        self._lastTexts: "OrderedDict[str, tuple]" = OrderedDict()
+        self._scoringExecutor = ThreadPoolExecutor(max_workers=scoringThreads, thread_name_prefix="scoring")
+        self._statsLock = threading.Lock()
+        self._pipelineStats = {"turns": 0, "llmMs": 0.0, "nlpMs": 0.0, "totalMs": 0.0, "overlapMs": 0.0}
+        self._activeTurns: Dict[str, List[_ActiveTurn]] = {}
+        self._cancelStats = {"cancelled": 0, "disconnected": 0, "llmAborted": 0, "scoringDropped": 0,
+                             "scoringWasted": 0, "tokensDiscarded": 0, "llmMsWasted": 0.0}
 
-    def sendMessage(self, text: str):
-        return self.processMessage(text)
+    def sendMessage(self, conversationId: str, userId: str, text: str, deferFeedback: bool = False):
+        return self.processMessage(conversationId, userId, text, deferFeedback)
 
-    def receiveMessage(self, text: str):
-        self._lastText = text
+    def receiveMessage(self, conversationId: str, userId: str, text: str):
+        with self._retryLock:
+            self._lastTexts[conversationId] = (userId, text)
+            self._lastTexts.move_to_end(conversationId)
+            while len(self._lastTexts) > self.MAX_RETRY_ENTRIES:
+                self._lastTexts.popitem(last=False)
         return {"ok": True}
 
-    def cancelInput(self):
-        self._lastText = ""
+    def receiveInterim(self, userId: str, finalText: str, partialText: str = "") -> Dict[str, Any]:
+        """Transcript of the utterance in progress; its finalized text is parsed ahead of the send"""
+        if self.interimAnalyzer is None:
+            return {"segments": 0}
+        return self.interimAnalyzer.update(userId, finalText, partialText)
+
+    def discardInterim(self, userId: str):
+        if self.interimAnalyzer is not None:
+            self.interimAnalyzer.discard(userId)
+        if self.speculation is not None:
+            self.speculation.discard(userId)
         return {"ok": True}
 
+    def speculate(self, userId: str, conversationId: str, finalText: str, partialText: str = "") -> Dict[str, Any]:
+        """The transcript stopped changing: start the reply to it before the message is sent"""
+        # It is likely to be sent as it stands, interim tail included, so that is the text to parse too.
+        text = finalText + " " + partialText
+        out = self.receiveInterim(userId, text)
+        out["speculating"] = self.speculation is not None and self.speculation.start(userId, conversationId, text)
+        return out
+
+    def interimEvent(self, userId: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        """One message of the interim-transcript channel: {"type": "interim" | "stable", "final", "partial"}
+        ("stable" also carries "conversationId") or {"type": "reset"}
+        """
+        if not isinstance(event, dict):
+            raise ValueError("Invalid interim event")
+        kind = event.get("type")
+        if kind == "interim":
+            return self.receiveInterim(userId, str(event.get("final") or ""), str(event.get("partial") or ""))
+        if kind == "stable":
+            return self.speculate(userId, str(event.get("conversationId") or ""), str(event.get("final") or ""),
+                                  str(event.get("partial") or ""))
+        if kind == "reset":
+            return self.discardInterim(userId)
+        raise ValueError("Unknown interim event type")
+
+    def cancelInput(self, conversationId: str, userId: str = ""):
+        """Forget the text to retry and stop the conversation's unsaved turns: the model request is
+        aborted, queued scoring is dropped and the reply is not saved
+        """
+        with self._retryLock:
+            self._lastTexts.pop(conversationId, None)
+        with self._statsLock:
+            turns = [t for t in self._activeTurns.get(conversationId, []) if not userId or t.userId == userId]
+        for active in turns:
+            active.cancel("cancelled")
+        if userId:
+            self.discardInterim(userId)
+        return {"ok": True, "cancelled": len(turns)}
+
     def validateMessage(self, text: str):
         t = (text or "").strip()
         if not t:
@@ -35,47 +196,328 @@ class MessageController:
             raise ValueError("Message too long (max 2000 characters)")
         return True
 
-    def prepareContext(self):
-        if not self._activeConversationId:
+    def prepareContext(self, conversationId: str):
+        if not conversationId:
             return []
-        return self.database.getLastMessages(self._activeConversationId, 6)
+        return self.database.getLastMessages(conversationId, self.contextBuilder.window)
 
-    def retry(self):
-        if not self._lastText:
-            raise ValueError("Nothing to retry")
-        return self.processMessage(self._lastText)
+    @metrics.counters("turns", "llmMs", "nlpMs", "totalMs", "overlapMs")
+    def pipelineStats(self) -> Dict[str, Any]:
+        with self._statsLock:
+            out = dict(self._pipelineStats)
+        turns = out["turns"] or 1
+        for k in ("llmMs", "nlpMs", "totalMs", "overlapMs"):
+            out["avg" + k[0].upper() + k[1:]] = round(out[k] / turns, 1)
+        return out
 
-    def processMessage(self, text: str):
-        if not self._activeConversationId:
-            raise ValueError("No active conversation")
-        
-        if self.database.checkMessageLimit(self._activeConversationId) >= 100:
-            raise ValueError("This conversation has reached the maximum of 100 message exchanges. Please start a new conversation to continue.")
+    @metrics.counters("cancelled", "disconnected", "llmAborted", "scoringDropped", "scoringWasted",
+                      "tokensDiscarded", "llmMsWasted")
+    def cancellationStats(self) -> Dict[str, Any]:
+        with self._statsLock:
+            out = dict(self._cancelStats)
+            out["active"] = sum(len(turns) for turns in self._activeTurns.values())
+        out["llmMsWasted"] = round(out["llmMsWasted"], 1)
+        return out
+
+    def _startTurn(self, conversationId: str, userId: str, text: str) -> _ActiveTurn:
+        """Start scoring the text and register the turn so cancelInput() can stop it"""
+        start = time.monotonic()
+        scoring, clock = self._startScoring(text, userId)
+        active = _ActiveTurn(conversationId, userId, text, scoring, clock, start)
+        with self._statsLock:
+            self._activeTurns.setdefault(conversationId, []).append(active)
+        return active
+
+    def _untrackTurn(self, active: _ActiveTurn):
+        with self._statsLock:
+            turns = self._activeTurns.get(active.conversationId, [])
+            if active in turns:
+                turns.remove(active)
+            if not turns:
+                self._activeTurns.pop(active.conversationId, None)
+
+    def _replyFinished(self, active: _ActiveTurn):
+        active.llmEnd = time.monotonic()
+        active.check()
+
+    def _releaseTurn(self, active: _ActiveTurn):
+        """Right before the save: from here on the turn can no longer be cancelled"""
+        self._untrackTurn(active)
+        active.check()
 
+    def _scoringDropped(self, active: _ActiveTurn) -> bool:
+        """cancelInput() dropped the scoring job (rather than the caller itself being cancelled)"""
+        return active.scoring.cancelled() and active.cancelled
+
+    def _scoringResult(self, active: _ActiveTurn):
+        try:
+            return active.scoring.result()
+        except CancelledError:
+            if self._scoringDropped(active):
+                raise TurnCancelledError("The message was cancelled")
+            raise
+
+    def _abortTurn(self, active: _ActiveTurn, discarded: int):
+        """The turn ends unsaved (its reply stream is already closed, which aborts the Ollama request): count the work"""
+        phase = "llm" if active.llmEnd is None else "scoring"
+        metrics.TURNS_CANCELLED.inc(reason=active.reason, phase=phase)
+        with self._statsLock:
+            stats = self._cancelStats
+            stats[active.reason] += 1
+            stats["llmAborted"] += phase == "llm"
+            stats["scoringDropped" if active.scoring.cancelled() else "scoringWasted"] += 1
+            stats["tokensDiscarded"] += discarded
+            stats["llmMsWasted"] += round(((active.llmEnd or time.monotonic()) - active.llmStart) * 1000, 1)
+
+    def _checkLimit(self, messageCount: int):
+        if messageCount >= self.MAX_MESSAGES:
+            raise ValueError(self.LIMIT_ERROR)
+
+    def _turnContext(self, turn: Tuple[int, List[Message], ConversationSummary],
+                     text: str) -> Tuple[int, List[Message], ConversationSummary]:
+        """Check the message limit and the text; return the message count, the messages the summary
+        does not cover, and the summary
+        """
+        messageCount, messages, summary = turn
+        self._checkLimit(messageCount)
         self.validateMessage(text)
-        
-        userMessageId = self.database.saveMessage(self._activeConversationId, text)
+        return messageCount, self.contextBuilder.recent(messageCount, messages, summary), summary
 
-        context = self.prepareContext()
-        
-        aiText = self.aiService.generateResponse(text, context)
-        self.database.saveMessage(self._activeConversationId, aiText)
+    def _loadTurn(self, conversationId: str, userId: str, text: str) -> Tuple[int, List[Message], ConversationSummary]:
+        if not conversationId:
+            raise ValueError("No active conversation")
+        return self._turnContext(self.database.getTurnContext(conversationId, userId, self.contextBuilder.window), text)
 
-        sc = self.mlEngine.analyzeText(text)
-        
-        tips = self.mlEngine.generateTips(text, sc)
+    def _claimSpeculation(self, conversationId: str, userId: str, text: str, messageCount: int):
+        """The reply already being generated for exactly this turn, if any"""
+        if self.speculation is None:
+            return None
+        return self.speculation.claim(userId, conversationId, text, messageCount)
 
-        self.database.saveScores(userMessageId, sc)
-        self.database.saveTips(userMessageId, tips)
+    def _endReplay(self, speculation):
+        if not speculation.done:
+            # The turn was cancelled: stop the speculative request too.
+            speculation.cancelled = True
+
+    def _replayAnswered(self, speculation, produced: bool) -> bool:
+        # A speculation that never got a model slot: the turn asks for the reply itself.
+        return produced or not speculation.failed
+
+    def _replyTokens(self, text: str, context: List[Message], userId: str, summary: ConversationSummary,
+                     speculation=None) -> Iterator[str]:
+        if speculation is not None:
+            produced = False
+            try:
+                for token in speculation.replay():
+                    produced = True
+                    yield token
+            finally:
+                self._endReplay(speculation)
+            if self._replayAnswered(speculation, produced):
+                return
+        yield from self.aiService.streamResponse(text, context, userId, summary.text)
+
+    def _firstTitle(self, messageCount: int, text: str) -> Optional[str]:
+        return self.aiService.fallbackTitle(text) if messageCount == 0 else None
+
+    def _saveTurn(self, active: _ActiveTurn, aiText: str, sc, tips,
+                  summary: Optional[ConversationSummary] = None) -> Tuple[str, Optional[str]]:
+        """Persist the turn (sc=None: without feedback); on a conversation's first turn also set
+        its fallback title. Returns the user message id and the new title.
+        """
+        conversationId = active.conversationId
+        with self.database.unitOfWork() as uow:
+            count = uow.lockConversation(conversationId, active.userId)
+            self._checkLimit(count)
+            userMessage, _ = uow.saveTurn(conversationId, active.text, aiText, sc, tips)
+            title = self._firstTitle(count, active.text)
+            if title and not uow.replaceTitle(conversationId, active.userId, DEFAULT_TITLE, title):
+                title = None
         
-        self.receiveMessage(text)
+        self._turnSaved(active, count, title, summary)
+        return userMessage.messageId, title
+
+    def _turnSaved(self, active: _ActiveTurn, count: int, title: Optional[str],
+                   summary: Optional[ConversationSummary]):
+        """Queue the AI title after a first turn, and a summary update when one is due"""
+        if title:
+            self._queueTitle(active.conversationId, active.userId, active.text, title)
+        self._queueSummary(active.conversationId, active.userId, count + 2, summary)
+
+    def _queueTitle(self, conversationId: str, userId: str, text: str, fallback: str):
+        if self.titleJobs is not None:
+            self.titleJobs.enqueue(conversationId, userId, text, fallback)
+
+    def _queueSummary(self, conversationId: str, userId: str, messageCount: int,
+                      summary: Optional[ConversationSummary]):
+        if self.summaryJobs is not None and self.contextBuilder.summaryDue(messageCount, summary):
+            self.summaryJobs.enqueue(conversationId, userId)
 
+    def _startScoring(self, text: str, userId: str = "") -> Tuple[Future, _ScoringClock]:
+        """Start scoring the user's text in the background; it only depends on the text, not on the reply"""
+        # Speech parsed while the learner was still talking only needs its remainder parsed.
+        fut = self.interimAnalyzer.scoringFor(userId, text) if self.interimAnalyzer is not None else None
+        if fut is None and isinstance(self.mlEngine, NLPScoringService) and self.mlEngine.workers:
+            fut = self.mlEngine.submit(text)
+        elif fut is None:
+            # Run in a copy of the caller's context so NLPEngine's spans land in this request's trace.
+            fut = self._scoringExecutor.submit(contextvars.copy_context().run, self.mlEngine.evaluate, text)
+        clock = _ScoringClock()
+        fut.add_done_callback(clock.stop)
+        return fut, clock
+
+    def _recordTiming(self, active: _ActiveTurn) -> Dict[str, float]:
+        llmStart, llmEnd = active.llmStart, active.llmEnd
+        nlpStart = active.clock.startedAt
+        nlpEnd = active.clock.finishedAt or time.monotonic()
+        timing = {
+            "llmMs": round((llmEnd - llmStart) * 1000, 1),
+            "nlpMs": round((nlpEnd - nlpStart) * 1000, 1),
+            "overlapMs": round(max(0.0, min(llmEnd, nlpEnd) - max(llmStart, nlpStart)) * 1000, 1),
+            "totalMs": round((time.monotonic() - active.start) * 1000, 1),
+        }
+        metrics.record("nlp", nlpEnd - nlpStart)
+        with self._statsLock:
+            self._pipelineStats["turns"] += 1
+            for k, v in timing.items():
+                self._pipelineStats[k] += v
+        return timing
+
+    def _deferScoring(self, scoring: Future, deferFeedback: bool) -> bool:
+        """Deferred mode only matters while scoring is still running; finished scores go out inline"""
+        return deferFeedback and self.feedbackStore is not None and not scoring.done()
+
+    def _finishTurn(self, active: _ActiveTurn, aiText: str, messageId: str, title: Optional[str], sc, tips,
+                    deferred: bool) -> Dict[str, Any]:
+        """After the save: hand deferred scoring to the feedback store, remember the text for retry()"""
+        if deferred:
+            self.feedbackStore.track(messageId, active.userId, active.text, active.scoring)
+        self.receiveMessage(active.conversationId, active.userId, active.text)
+        return self._turnResult(aiText, messageId, title, sc, tips, active)
+
+    def _turnResult(self, aiText: str, messageId: str, title: Optional[str], sc, tips,
+                    active: _ActiveTurn) -> Dict[str, Any]:
+        if sc is None:
+            # Feedback follows via GET /api/messages/<messageId>/feedback.
+            return {
+                "aiText": aiText,
+                "messageId": messageId,
+                "feedback": "pending",
+                "scores": None,
+                "tips": [],
+                "title": title,
+                "timing": {
+                    "llmMs": round((active.llmEnd - active.llmStart) * 1000, 1),
+                    "totalMs": round((time.monotonic() - active.start) * 1000, 1),
+                }
+            }
         return {
             "aiText": aiText,
+            "messageId": messageId,
+            "feedback": "ready",
             "scores": {
                 "fluency": sc.fluency,
                 "wordChoice": sc.wordChoice,
                 "grammar": sc.grammar
             },
-            "tips": tips
-        }
\ No newline at end of file
+            "tips": tips,
+            "title": title,
+            "timing": self._recordTiming(active)
+        }
+
+    def retry(self, conversationId: str, userId: str, deferFeedback: bool = False):
+        with self._retryLock:
+            owner, text = self._lastTexts.get(conversationId, ("", ""))
+        if not text or owner != userId:
+            raise ValueError("Nothing to retry")
+        return self.processMessage(conversationId, userId, text, deferFeedback)
+
+    def processMessageStream(self, conversationId: str, userId: str, text: str,
+                             deferFeedback: bool = False) -> Iterator[Dict[str, Any]]:
+        """Validate the turn up front, then return an iterator of stream events.
+        
+        Events: {"type": "token"}, {"type": "sentence"} while the reply is generated,
+        then one {"type": "done"} (or {"type": "error"}) after the turn is saved.
+        With deferFeedback, "done" does not wait for scoring (feedback: "pending").
+        """
+        messageCount, context, summary = self._loadTurn(conversationId, userId, text)
+        speculation = self._claimSpeculation(conversationId, userId, text, messageCount)
+        return self._streamTurn(conversationId, userId, text, context, summary, deferFeedback, speculation)
+
+    def _streamTurn(self, conversationId: str, userId: str, text: str, context: List[Message],
+                    summary: ConversationSummary, deferFeedback: bool = False,
+                    speculation=None) -> Iterator[Dict[str, Any]]:
+        active = self._startTurn(conversationId, userId, text)
+        reply = _ReplyStream(active.start)
+        tokens = self._replyTokens(text, context, userId, summary, speculation)
+        active.llmStart = time.monotonic()
+        
+        try:
+            for token in tokens:
+                active.check()
+                yield from reply.feed(token)
+            self._replyFinished(active)
+            yield from reply.flush()
+            
+            deferred = self._deferScoring(active.scoring, deferFeedback)
+            sc, tips = (None, []) if deferred else self._scoringResult(active)
+            self._releaseTurn(active)
+            messageId, title = self._saveTurn(active, reply.text, sc, tips, summary)
+        except LLMBusyError as e:
+            active.scoring.cancel()
+            yield {"type": "error", "error": str(e)}
+            return
+        except TurnCancelledError as e:
+            tokens.close()
+            self._abortTurn(active, len(reply.parts))
+            yield {"type": "cancelled", "error": str(e)}
+            return
+        except GeneratorExit:
+            # The client went away: the server closes the response iterator at its next write.
+            active.cancel("disconnected")
+            tokens.close()
+            self._abortTurn(active, len(reply.parts))
+            raise
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+            return
+        finally:
+            self._untrackTurn(active)
+        
+        done = self._finishTurn(active, reply.text, messageId, title, sc, tips, deferred)
+        done["type"] = "done"
+        done["ttftMs"] = reply.ttftMs
+        yield done
+
+    def processMessage(self, conversationId: str, userId: str, text: str, deferFeedback: bool = False):
+        messageCount, context, summary = self._loadTurn(conversationId, userId, text)
+        
+        active = self._startTurn(conversationId, userId, text)
+        speculation = self._claimSpeculation(conversationId, userId, text, messageCount)
+        tokens = self._replyTokens(text, context, userId, summary, speculation)
+        parts = []
+        
+        active.llmStart = time.monotonic()
+        try:
+            # Streamed internally too, so a cancel stops the model request at the next token.
+            for token in tokens:
+                active.check()
+                parts.append(token)
+            self._replyFinished(active)
+            aiText = "".join(parts).strip()
+            
+            deferred = self._deferScoring(active.scoring, deferFeedback)
+            sc, tips = (None, []) if deferred else self._scoringResult(active)
+            self._releaseTurn(active)
+        except LLMBusyError:
+            active.scoring.cancel()
+            raise
+        except TurnCancelledError:
+            tokens.close()
+            self._abortTurn(active, len(parts))
+            raise
+        finally:
+            self._untrackTurn(active)
+        
+        messageId, title = self._saveTurn(active, aiText, sc, tips, summary)
+        return self._finishTurn(active, aiText, messageId, title, sc, tips, deferred)
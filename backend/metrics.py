@@ -0,0 +1,219 @@
+"""Request tracing and Prometheus metrics without external dependencies.
+
+span("db") / span("llm") / ... time a phase. The time is added to the phase
+histogram and, when a request is being traced, to that request's RequestTrace.
+The app turns the trace into a Server-Timing header and a per-route histogram.
+The trace lives in a ContextVar, so it follows the request through
+generators and asyncio tasks. Executor jobs need contextvars.copy_context()
+to see it.
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+TOKEN_BUCKETS = (64, 128, 256, 512, 768, 1024, 1536, 2048, 4096)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted((labels or {}).items()))
+
+def _formatLabels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_formatLabels(k)} {_number(v)}" for k, v in items]
+        return out
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[idx] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                out.append(f"{self.name}_bucket{_formatLabels(key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_formatLabels(key)} {_number(total)}")
+            out.append(f"{self.name}_count{_formatLabels(key)} {cumulative}")
+        return out
+
+class RequestTrace:
+    """Time spent per phase during one request (thread-safe: executor jobs may add to it)"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.phases: Dict[str, List[float]] = {}
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            entry = self.phases.setdefault(phase, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def count(self, phase: str) -> int:
+        with self._lock:
+            return int(self.phases.get(phase, (0.0, 0))[1])
+
+    def serverTiming(self) -> str:
+        with self._lock:
+            items = sorted(self.phases.items())
+        parts = [f'{phase};dur={seconds * 1000:.1f};desc="{n}x"' for phase, (seconds, n) in items]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+_currentTrace: ContextVar[Optional[RequestTrace]] = ContextVar("requestTrace", default=None)
+
+PHASE_SECONDS = Histogram("echera_phase_seconds", "Time spent per phase (db, llm, nlp_parse, ...)")
+REQUEST_SECONDS = Histogram("echera_request_seconds", "Request latency by route")
+REQUEST_DB_QUERIES = Histogram("echera_request_db_queries", "Database queries issued per request", COUNT_BUCKETS)
+LLM_REQUESTS = Counter("echera_llm_requests_total", "Calls to the LLM by mode and outcome")
+LLM_TOKENS = Counter("echera_llm_tokens_total", "Tokens reported by Ollama (prompt_eval_count / eval_count)")
+LLM_SECONDS = Histogram("echera_llm_seconds", "LLM call latency by mode")
+LLM_TTFT_SECONDS = Histogram("echera_llm_ttft_seconds", "Time to first streamed token, by model state (cold/warm)")
+LLM_LOAD_SECONDS = Histogram("echera_llm_load_seconds", "Model load time reported by Ollama (load_duration)")
+LLM_QUEUE_SECONDS = Histogram("echera_llm_queue_seconds", "Time LLM calls waited for a scheduler slot, by priority")
+PROMPT_TOKENS = Histogram("echera_prompt_tokens", "Estimated chat prompt size in tokens", TOKEN_BUCKETS)
+TURNS_CANCELLED = Counter("echera_turns_cancelled_total", "Chat turns stopped before they were saved, by reason and phase")
+
+_registry = [PHASE_SECONDS, REQUEST_SECONDS, REQUEST_DB_QUERIES, LLM_REQUESTS, LLM_TOKENS, LLM_SECONDS, LLM_TTFT_SECONDS,
+             LLM_QUEUE_SECONDS, PROMPT_TOKENS, LLM_LOAD_SECONDS, TURNS_CANCELLED]
+
+def startRequest() -> RequestTrace:
+    trace = RequestTrace()
+    _currentTrace.set(trace)
+    return trace
+
+def currentTrace() -> Optional[RequestTrace]:
+    return _currentTrace.get()
+
+def finishRequest(route: str, method: str, status: int) -> Optional[RequestTrace]:
+    trace = _currentTrace.get()
+    if trace is None:
+        return None
+    _currentTrace.set(None)
+    REQUEST_SECONDS.observe(time.perf_counter() - trace.start, route=route, method=method, status=str(status))
+    REQUEST_DB_QUERIES.observe(trace.count("db"), route=route)
+    return trace
+
+def record(phase: str, seconds: float):
+    PHASE_SECONDS.observe(seconds, phase=phase)
+    trace = _currentTrace.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+@contextmanager
+def span(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+def recordLlmTokens(data: Dict, mode: str):
+    """Count the token totals from Ollama's final (done) message"""
+    if data.get("prompt_eval_count"):
+        LLM_TOKENS.inc(data["prompt_eval_count"], kind="prompt", mode=mode)
+    if data.get("eval_count"):
+        LLM_TOKENS.inc(data["eval_count"], kind="completion", mode=mode)
+
+def counters(*keys: str):
+    """Mark the keys of a stats() collector that only ever grow; render() exports them as counters.
+    
+    Nested keys are joined with "_", e.g. "breaker_opens".
+    """
+    def mark(collect):
+        collect.counters = frozenset(keys)
+        return collect
+    return mark
+
+def _flatten(prefix: str, stats: Dict, out: List[Tuple[str, float]]):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}" if prefix else key
+        if isinstance(value, dict):
+            _flatten(name, value, out)
+        elif isinstance(value, bool):
+            out.append((name, float(value)))
+        elif isinstance(value, (int, float)):
+            out.append((name, value))
+
+def render(collectors: Dict[str, Callable[[], Dict]]) -> str:
+    """Prometheus text format: the registry plus each component's stats(), flattened.
+    
+    Keys marked with @counters become <name>_total counters (waitMsTotal: waitMs_total),
+    the rest gauges.
+    """
+    lines: List[str] = []
+    for metric in _registry:
+        lines += metric.render()
+
+    for prefix, collect in collectors.items():
+        try:
+            stats = collect()
+        except Exception as e:
+            print(f"Metrics collector {prefix} failed: {e}")
+            continue
+        marked = getattr(collect, "counters", frozenset())
+        flat: List[Tuple[str, float]] = []
+        _flatten("", stats, flat)
+        for key, value in flat:
+            name = "".join(c if c.isalnum() or c == "_" else "_" for c in f"echera_{prefix}_{key}")
+            if key in marked:
+                name = (name[:-len("Total")] if name.endswith("Total") else name) + "_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {_number(value)}")
+            else:
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
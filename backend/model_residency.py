@@ -0,0 +1,125 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional
+import threading
+import time
+import requests
+import metrics
+
+# Ollama reports load_duration on every reply; above this the call paid for loading the model.
+COLD_LOAD_SECONDS = 0.5
+
+class ModelResidency:
+    """Keeps the Ollama model loaded while the app has traffic, and lets it go when idle.
+
+    start() preloads the model (an empty /api/chat request loads it) on a background
+    thread. Every model call carries keep_alive=leaseSeconds, and while there was
+    traffic in the last idleSeconds a heartbeat renews the lease every
+    heartbeatSeconds. After idleSeconds without traffic the heartbeat stops and the
+    lease runs out on its own. There is no explicit unload: every app worker
+    runs its own ModelResidency, and one that is idle must not unload the
+    model while another is serving turns. Their calls keep renewing the lease.
+
+    AIService calls touch() with every model call and asks state() before each
+    streamed one, so first-token latency is reported separately for cold and
+    warm starts.
+    """
+
+    def __init__(self, apiEndpoint: str, model: str, leaseSeconds: float = 300.0,
+                 heartbeatSeconds: float = 60.0, idleSeconds: float = 900.0, loadTimeout: float = 120.0):
+        self.apiEndpoint = apiEndpoint
+        self.model = model
+        self.leaseSeconds = leaseSeconds
+        self.heartbeatSeconds = heartbeatSeconds
+        self.idleSeconds = idleSeconds
+        self.loadTimeout = loadTimeout
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._residentUntil = 0.0
+        self._lastActivity = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"preloads": 0, "heartbeats": 0, "failures": 0, "coldLoads": 0,
+                       "coldStarts": 0, "warmStarts": 0, "coldTtftMsTotal": 0.0, "warmTtftMsTotal": 0.0,
+                       "lastLoadMs": 0.0}
+
+    @property
+    def keepAlive(self) -> str:
+        return f"{int(self.leaseSeconds)}s"
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Startup counts as activity: the model stays loaded for one idle window.
+            self._lastActivity = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="model-residency", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def touch(self):
+        """Record traffic: the heartbeat keeps renewing the lease for another idleSeconds"""
+        with self._lock:
+            self._lastActivity = time.monotonic()
+
+    def state(self) -> str:
+        """Whether the next call should find the model loaded ("warm") or not ("cold")"""
+        with self._lock:
+            return "warm" if time.monotonic() < self._residentUntil else "cold"
+
+    def observe(self, data: Dict[str, Any]):
+        """A model call finished: the model is loaded for another lease. data is Ollama's final message."""
+        loadSeconds = (data.get("load_duration") or 0) / 1e9
+        if loadSeconds:
+            metrics.LLM_LOAD_SECONDS.observe(loadSeconds)
+        with self._lock:
+            self._residentUntil = time.monotonic() + self.leaseSeconds
+            if loadSeconds >= COLD_LOAD_SECONDS:
+                self._stats["coldLoads"] += 1
+                self._stats["lastLoadMs"] = round(loadSeconds * 1000, 1)
+
+    def recordFirstToken(self, state: str, ttftMs: float):
+        with self._lock:
+            self._stats[state + "Starts"] += 1
+            self._stats[state + "TtftMsTotal"] += ttftMs
+
+    @metrics.counters("preloads", "heartbeats", "failures", "coldLoads", "coldStarts", "warmStarts",
+                      "coldTtftMsTotal", "warmTtftMsTotal")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            now = time.monotonic()
+            out["resident"] = now < self._residentUntil
+            out["idleSeconds"] = round(now - self._lastActivity, 1)
+        for state in ("cold", "warm"):
+            n = out[state + "Starts"]
+            out[state + "AvgTtftMs"] = round(out[state + "TtftMsTotal"] / n, 1) if n else 0.0
+        return out
+
+    def _run(self):
+        self._load("preloads")
+        while not self._stop.wait(self.heartbeatSeconds):
+            with self._lock:
+                idle = time.monotonic() - self._lastActivity
+            if idle < self.idleSeconds:
+                self._load("heartbeats")
+
+    def _load(self, kind: str) -> bool:
+        payload = {"model": self.model, "messages": [], "keep_alive": self.keepAlive}
+        try:
+            r = self._session.post(self.apiEndpoint, json=payload, timeout=self.loadTimeout)
+            r.raise_for_status()
+            data = r.json()
+        except Exception as e:
+            print(f"Model residency: {kind} request failed: {e}")
+            with self._lock:
+                self._stats["failures"] += 1
+            return False
+        
+        with self._lock:
+            self._stats[kind] += 1
+        self.observe(data)
+        return True
@@ -68,6 +68,12 @@ class Conversation:
         self.messageCount += 1
 
 
+@dataclass
+class ConversationSummary:
+    text: str = ""
+    messageCount: int = 0  # how many of the oldest messages the summary covers
+
+
 @dataclass
 class Message:
     messageId: str
@@ -102,6 +108,27 @@ class Scores:
         return self.grammar
 
 
+@dataclass
+class UserStats:
+    userId: str
+    fluencySum: int
+    wordChoiceSum: int
+    grammarSum: int
+    scoreCount: int
+    messageCount: int
+    conversationCount: int
+    accountInfo: Dict[str, Any]
+
+    def getAverages(self) -> Dict[str, float]:
+        if not self.scoreCount:
+            return {"fluency": 0.0, "wordChoice": 0.0, "grammar": 0.0}
+        return {
+            "fluency": round(self.fluencySum / self.scoreCount, 1),
+            "wordChoice": round(self.wordChoiceSum / self.scoreCount, 1),
+            "grammar": round(self.grammarSum / self.scoreCount, 1),
+        }
+
+
 @dataclass
 class Feedback:
     feedbackId: str
@@ -1,118 +1,191 @@
 from __future__ import annotations
-from typing import List
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Set, Tuple
+import threading
 import spacy
 from models import Scores
+import metrics
+
+@dataclass
+class TextFeatures:
+    """Everything the scorers and tips need from one spaCy parse of a message"""
+    tokenCount: int = 0
+    posCounts: Dict[str, int] = field(default_factory=dict)
+    sentenceCount: int = 0
+    lowercaseStarts: int = 0
+    unpunctuatedEnds: int = 0
+    posPatterns: Set[Tuple[str, ...]] = field(default_factory=set)
+    hasSubject: bool = False
+    hasVerb: bool = False
+    orphanedDeps: int = 0
+    lemmas: List[str] = field(default_factory=list)
+    entities: List[Tuple[str, str]] = field(default_factory=list)
+
+    def countPos(self, *tags: str) -> int:
+        return sum(self.posCounts.get(t, 0) for t in tags)
+
+    def lemmaDiversity(self) -> Optional[float]:
+        if not self.lemmas:
+            return None
+        return len(set(self.lemmas)) / len(self.lemmas)
 
 class NLPEngine:
-    def __init__(self, apiEndpoint: str):
+    def __init__(self, apiEndpoint: str, cacheSize: int = 128):
         self.apiEndpoint = apiEndpoint
         try:
             self._nlp = spacy.load("en_core_web_sm")
         except Exception:
             self._nlp = None
+        self._cacheSize = cacheSize
+        self._cache: "OrderedDict[str, TextFeatures]" = OrderedDict()
+        self._cacheLock = threading.Lock()
+
+    def analyze(self, text: str) -> Optional[TextFeatures]:
+        """Parse text once and return its feature record (None if there is nothing to parse)"""
+        t = (text or "").strip()
+        if not t or not self._nlp:
+            return None
+        
+        with self._cacheLock:
+            features = self._cache.get(t)
+            if features is not None:
+                self._cache.move_to_end(t)
+                return features
+        
+        with metrics.span("nlp_parse"):
+            features = self.extractFeatures(self._nlp(t))
+        
+        with self._cacheLock:
+            self._cache[t] = features
+            if len(self._cache) > self._cacheSize:
+                self._cache.popitem(last=False)
+        return features
+
+    def extractFeatures(self, doc) -> TextFeatures:
+        features = TextFeatures(tokenCount=len(doc))
+        
+        features.posCounts = dict(Counter(token.pos_ for token in doc))
+        
+        for sent in doc.sents:
+            features.sentenceCount += 1
+            first = sent[0].text
+            if first and first[0].islower():
+                features.lowercaseStarts += 1
+            if sent[-1].text not in [".", "!", "?"]:
+                features.unpunctuatedEnds += 1
+            features.posPatterns.add(tuple(token.pos_ for token in sent))
+        
+        features.hasSubject = any(token.dep_ in ["nsubj", "nsubjpass"] for token in doc)
+        features.hasVerb = features.posCounts.get("VERB", 0) > 0
+        features.orphanedDeps = sum(1 for token in doc if token.dep_ == "dep")
+        features.lemmas = [token.lemma_.lower() for token in doc if token.is_alpha]
+        features.entities = [(ent.text, ent.label_) for ent in doc.ents]
+        return features
+
+    def evaluate(self, text: str) -> Tuple[Scores, List[str]]:
+        return self.evaluateFeatures(self.analyze(text))
+
+    def evaluateFeatures(self, features: Optional[TextFeatures]) -> Tuple[Scores, List[str]]:
+        with metrics.span("nlp_score"):
+            scores = self.scoreFeatures(features)
+        with metrics.span("nlp_tips"):
+            tips = self.tipsFromFeatures(features, scores)
+        return scores, tips
+
+    def analyzeMany(self, texts: List[str], batchSize: int = 32) -> List[Optional[TextFeatures]]:
+        """Parse several texts with one nlp.pipe pass"""
+        stripped = [(t or "").strip() for t in texts]
+        features: List[Optional[TextFeatures]] = [None] * len(texts)
+        
+        if self._nlp:
+            idx = [i for i, t in enumerate(stripped) if t]
+            docs = self._nlp.pipe((stripped[i] for i in idx), batch_size=batchSize)
+            for i, doc in zip(idx, docs):
+                features[i] = self.extractFeatures(doc)
+        return features
+
+    def evaluateMany(self, texts: List[str], batchSize: int = 32) -> List[Tuple[Scores, List[str]]]:
+        """Score several messages with one nlp.pipe pass (used by the batched scoring service)"""
+        out = []
+        for f in self.analyzeMany(texts, batchSize):
+            scores = self.scoreFeatures(f)
+            out.append((scores, self.tipsFromFeatures(f, scores)))
+        return out
 
     def analyzeText(self, text: str) -> Scores:
+        return self.scoreFeatures(self.analyze(text))
+
+    def scoreFeatures(self, features: Optional[TextFeatures]) -> Scores:
         return Scores(
-            fluency=self.calculateFluency(text),
-            wordChoice=self.calculateWordChoice(text),
-            grammar=self.calculateGrammar(text),
+            fluency=self._fluency(features),
+            wordChoice=self._wordChoice(features),
+            grammar=self._grammar(features),
         )
 
     def calculateFluency(self, text: str) -> int:
-        t = (text or "").strip()
-        if not t or not self._nlp:
-            return 0
-        
-        doc = self._nlp(t)
-        
-        sentences = list(doc.sents)
-        if not sentences:
+        return self._fluency(self.analyze(text))
+
+    def calculateWordChoice(self, text: str) -> int:
+        return self._wordChoice(self.analyze(text))
+
+    def calculateGrammar(self, text: str) -> int:
+        return self._grammar(self.analyze(text))
+
+    def _fluency(self, f: Optional[TextFeatures]) -> int:
+        if f is None or f.sentenceCount == 0:
             return 0
         
         score = 50 
         
-        if len(sentences) > 1:
-            score += min(15, len(sentences) * 5)
-        
-        conjunctions = [token for token in doc if token.pos_ == "CCONJ" or token.pos_ == "SCONJ"]
-        score += min(15, len(conjunctions) * 5)
+        if f.sentenceCount > 1:
+            score += min(15, f.sentenceCount * 5)
         
-        pos_patterns = set()
-        for sent in sentences:
-            pattern = tuple(token.pos_ for token in sent)
-            pos_patterns.add(pattern)
+        score += min(15, f.countPos("CCONJ", "SCONJ") * 5)
         
-        if len(pos_patterns) > 1:
+        if len(f.posPatterns) > 1:
             score += 10
         
-        adverbs = [token for token in doc if token.pos_ == "ADV"]
-        score += min(10, len(adverbs) * 3)
+        score += min(10, f.countPos("ADV") * 3)
         
         return max(0, min(100, score))
 
-    def calculateWordChoice(self, text: str) -> int:
-        t = (text or "").strip()
-        if not t or not self._nlp:
-            return 0
-        
-        doc = self._nlp(t)
-        
-        if len(doc) == 0:
+    def _wordChoice(self, f: Optional[TextFeatures]) -> int:
+        if f is None or f.tokenCount == 0:
             return 0
         
         score = 40  
         
-        lemmas = [token.lemma_.lower() for token in doc if token.is_alpha]
-        if lemmas:
-            diversity = len(set(lemmas)) / len(lemmas)
+        diversity = f.lemmaDiversity()
+        if diversity is not None:
             score += int(20 * diversity)
         
-        adjectives = [token for token in doc if token.pos_ == "ADJ"]
-        score += min(15, len(adjectives) * 5)
+        score += min(15, f.countPos("ADJ") * 5)
         
-        adverbs = [token for token in doc if token.pos_ == "ADV"]
-        score += min(10, len(adverbs) * 4)
+        score += min(10, f.countPos("ADV") * 4)
         
-        entities = list(doc.ents)
-        score += min(15, len(entities) * 8)
+        score += min(15, len(f.entities) * 8)
         
         return max(0, min(100, score))
 
-    def calculateGrammar(self, text: str) -> int:
-        t = (text or "").strip()
-        if not t or not self._nlp:
+    def _grammar(self, f: Optional[TextFeatures]) -> int:
+        if f is None:
             return 0
         
-        doc = self._nlp(t)
-        
         score = 100 
         
-        sentences = list(doc.sents)
-        for sent in sentences:
-            first_token = sent[0]
-            if first_token.text and first_token.text[0].islower():
-                score -= 10
+        score -= 10 * f.lowercaseStarts
         
-        for sent in sentences:
-            last_token = sent[-1]
-            if last_token.text not in [".", "!", "?"]:
-                score -= 8
+        score -= 8 * f.unpunctuatedEnds
         
-        has_subject = any(token.dep_ in ["nsubj", "nsubjpass"] for token in doc)
-        has_verb = any(token.pos_ == "VERB" for token in doc)
-        
-        if not has_subject:
+        if not f.hasSubject:
             score -= 15
-        if not has_verb:
+        if not f.hasVerb:
             score -= 15
         
-        orphaned = sum(1 for token in doc if token.dep_ == "dep")
-        score -= min(20, orphaned * 5)
-        
-        determiners = [token for token in doc if token.pos_ == "DET"]
-        nouns = [token for token in doc if token.pos_ in ["NOUN", "PROPN"]]
+        score -= min(20, f.orphanedDeps * 5)
         
-        if nouns and not determiners:
+        if f.countPos("NOUN", "PROPN") and not f.countPos("DET"):
             score -= 5
         
         return max(0, min(100, score))
@@ -121,29 +194,22 @@ class NLPEngine:
         return Scores(0, 0, 0)
 
     def generateTips(self, text: str, scores: Scores) -> List[str]:
-        if not text or not self._nlp:
+        return self.tipsFromFeatures(self.analyze(text), scores)
+
+    def tipsFromFeatures(self, f: Optional[TextFeatures], scores: Scores) -> List[str]:
+        if f is None:
             return ["Keep practicing your English skills!"]
         
-        doc = self._nlp(text)
         tips = []
         
         if scores.grammar < 70:
-            sentences = list(doc.sents)
-            
-            for sent in sentences:
-                if sent[0].text and sent[0].text[0].islower():
-                    tips.append("Remember to capitalize the first letter of sentences.")
-                    break
-            
-            for sent in sentences:
-                if sent[-1].text not in [".", "!", "?"]:
-                    tips.append("End your sentences with proper punctuation (. ! ?).")
-                    break
+            if f.lowercaseStarts:
+                tips.append("Remember to capitalize the first letter of sentences.")
             
-            has_subject = any(token.dep_ in ["nsubj", "nsubjpass"] for token in doc)
-            has_verb = any(token.pos_ == "VERB" for token in doc)
+            if f.unpunctuatedEnds:
+                tips.append("End your sentences with proper punctuation (. ! ?).")
             
-            if not has_subject or not has_verb:
+            if not f.hasSubject or not f.hasVerb:
                 tips.append("Make sure your sentences have both a subject and a verb.")
         elif scores.grammar >= 90:
             tips.append("Excellent grammar! Your sentence structure is very clear.")
@@ -151,17 +217,14 @@ class NLPEngine:
             tips.append("Good grammar! Just minor improvements needed.")
         
         if scores.wordChoice < 60:
-            adjectives = [token for token in doc if token.pos_ == "ADJ"]
-            adverbs = [token for token in doc if token.pos_ == "ADV"]
-            
-            if len(adjectives) == 0:
+            if f.countPos("ADJ") == 0:
                 tips.append("Try using adjectives to describe nouns (e.g., 'beautiful day', 'fast car').")
             
-            if len(adverbs) == 0:
+            if f.countPos("ADV") == 0:
                 tips.append("Use adverbs to modify verbs (e.g., 'speak clearly', 'run quickly').")
             
-            lemmas = [token.lemma_.lower() for token in doc if token.is_alpha]
-            if lemmas and len(set(lemmas)) / len(lemmas) < 0.7:
+            diversity = f.lemmaDiversity()
+            if diversity is not None and diversity < 0.7:
                 tips.append("Try to use a wider variety of words instead of repeating the same ones.")
         elif scores.wordChoice >= 80:
             tips.append("Great vocabulary! Your word choice is sophisticated and varied.")
@@ -169,17 +232,13 @@ class NLPEngine:
             tips.append("Good word choice! Consider using more descriptive words.")
         
         if scores.fluency < 60:
-            sentences = list(doc.sents)
-            
-            if len(sentences) <= 1:
+            if f.sentenceCount <= 1:
                 tips.append("Try expressing your thoughts in multiple sentences for better flow.")
             
-            conjunctions = [token for token in doc if token.pos_ in ["CCONJ", "SCONJ"]]
-            if len(conjunctions) == 0:
+            if f.countPos("CCONJ", "SCONJ") == 0:
                 tips.append("Connect your ideas using words like 'and', 'but', 'because', or 'however'.")
             
-            adverbs = [token for token in doc if token.pos_ == "ADV"]
-            if len(adverbs) == 0:
+            if f.countPos("ADV") == 0:
                 tips.append("Add adverbs to make your expression more nuanced and fluent.")
         elif scores.fluency >= 80:
             tips.append("Excellent fluency! Your expression flows very naturally.")
@@ -195,4 +254,4 @@ class NLPEngine:
             else:
                 tips.append("Keep practicing! You're making progress.")
         
-        return tips[:3]  
\ No newline at end of file
+        return tips[:3]
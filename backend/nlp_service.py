@@ -0,0 +1,181 @@
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional
+import multiprocessing
+import queue
+import threading
+import time
+from models import Scores
+from nlp_engine import NLPEngine, TextFeatures
+import metrics
+
+_workerEngine: Optional[NLPEngine] = None
+
+def _initWorker():
+    global _workerEngine
+    _workerEngine = NLPEngine("", cacheSize=0)
+
+def _evaluateBatch(texts: List[str], batchSize: int) -> List[Tuple[Scores, List[str]]]:
+    return _workerEngine.evaluateMany(texts, batchSize)
+
+def _analyzeBatch(texts: List[str], batchSize: int) -> List[Optional[TextFeatures]]:
+    return _workerEngine.analyzeMany(texts, batchSize)
+
+class NLPScoringService:
+    """Collects concurrent scoring requests into micro-batches and runs them on worker processes.
+
+    With workers=0 every call is scored inline on the calling thread. The pool and the
+    batching thread start on the first call, and the workers are spawned rather than
+    forked from a process that already runs threads.
+    """
+
+    def __init__(self, engine: NLPEngine, workers: int = 2, batchSize: int = 16, maxWaitMs: float = 5.0):
+        self.engine = engine
+        self.workers = max(0, workers)
+        self.batchSize = max(1, batchSize)
+        self.maxWait = max(0.0, maxWaitMs) / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._statsLock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "batchedItems": 0, "maxBatch": 0, "failures": 0, "dropped": 0}
+        self._startLock = threading.Lock()
+        self._closed = False
+        self._pool = None
+        self._dispatcher = None
+        # Two batches in flight per worker keeps every process busy while the
+        # dispatcher lets the next batch fill up.
+        self._slots = threading.BoundedSemaphore(self.workers * 2) if self.workers else None
+
+    def submit(self, text: str) -> Future:
+        with self._statsLock:
+            self._stats["requests"] += 1
+        
+        fut: Future = Future()
+        if not self._start():
+            try:
+                fut.set_result(self.engine.evaluate(text))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        
+        self._queue.put((text, fut))
+        return fut
+
+    def analyze(self, text: str) -> Future:
+        """Parse only (Future of TextFeatures); not batched, for the sporadic interim-speech segments"""
+        fut: Future = Future()
+        if not self._start():
+            try:
+                fut.set_result(self.engine.analyze(text))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        
+        def done(pf: Future):
+            try:
+                fut.set_result(pf.result()[0])
+            except Exception as e:
+                fut.set_exception(e)
+        
+        self._pool.submit(_analyzeBatch, [text], 1).add_done_callback(done)
+        return fut
+
+    def evaluate(self, text: str) -> Tuple[Scores, List[str]]:
+        return self.submit(text).result()
+
+    def analyzeText(self, text: str) -> Scores:
+        return self.evaluate(text)[0]
+
+    def generateTips(self, text: str, scores: Scores) -> List[str]:
+        return self.engine.generateTips(text, scores)
+
+    @metrics.counters("requests", "batches", "batchedItems", "failures", "dropped")
+    def stats(self) -> Dict[str, Any]:
+        with self._statsLock:
+            out = dict(self._stats)
+        out["workers"] = self.workers
+        out["queueDepth"] = self._queue.qsize()
+        out["avgBatch"] = round(out["batchedItems"] / out["batches"], 2) if out["batches"] else 0.0
+        return out
+
+    def shutdown(self):
+        with self._startLock:
+            self._closed = True
+        if self._dispatcher:
+            self._queue.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _start(self) -> bool:
+        """Start the worker pool and the batching thread if they are not running; False when scoring inline"""
+        with self._startLock:
+            if self.workers and self._pool is None and not self._closed:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_initWorker,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+                self._dispatcher = threading.Thread(target=self._run, name="nlp-batcher", daemon=True)
+                self._dispatcher.start()
+            return self._pool is not None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.maxWait
+            while len(batch) < self.batchSize:
+                remaining = deadline - time.monotonic()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            
+            # Jobs of cancelled turns are dropped here; the rest can no longer be cancelled.
+            pending = [(text, fut) for text, fut in batch if fut.set_running_or_notify_cancel()]
+            if len(pending) < len(batch):
+                with self._statsLock:
+                    self._stats["dropped"] += len(batch) - len(pending)
+            if pending:
+                self._slots.acquire()
+                self._dispatch(pending)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        with self._statsLock:
+            self._stats["batches"] += 1
+            self._stats["batchedItems"] += len(batch)
+            self._stats["maxBatch"] = max(self._stats["maxBatch"], len(batch))
+        
+        try:
+            pf = self._pool.submit(_evaluateBatch, [t for t, _ in batch], self.batchSize)
+        except Exception as e:
+            self._slots.release()
+            self._fail(batch, e)
+            return
+        
+        def done(pf: Future):
+            self._slots.release()
+            try:
+                results = pf.result()
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+        
+        pf.add_done_callback(done)
+
+    def _fail(self, batch, error: Exception):
+        with self._statsLock:
+            self._stats["failures"] += len(batch)
+        for _, fut in batch:
+            fut.set_exception(error)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Tuple
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import metrics
+
+# Parameters of hashes written before the format carried them: "<salt hex>$<dk hex>".
+LEGACY_PBKDF2_ITERATIONS = 120_000
+
+ALGORITHMS = ("pbkdf2-sha256", "scrypt")
+
+class HasherBusyError(Exception):
+    pass
+
+def _derive(algorithm: str, params: Dict[str, int], secret: bytes, salt: bytes) -> bytes:
+    if algorithm == "pbkdf2-sha256":
+        return hashlib.pbkdf2_hmac("sha256", secret, salt, params["i"])
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p, maxmem=128 * n * r * p + 1024 * 1024, dklen=32)
+    raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+
+def _encodeParams(params: Dict[str, int]) -> str:
+    return ",".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+def _decodeParams(text: str) -> Dict[str, int]:
+    return {k: int(v) for k, v in (part.split("=", 1) for part in text.split(",") if part)}
+
+def parseHash(stored: str) -> Tuple[str, Dict[str, int], bytes, bytes]:
+    """Split a stored hash into (algorithm, params, salt, dk); accepts the legacy salt$dk format"""
+    if stored.startswith("$"):
+        _, algorithm, params, salt, dk = stored.split("$")
+        return algorithm, _decodeParams(params), bytes.fromhex(salt), bytes.fromhex(dk)
+
+    salt, dk = stored.split("$", 1)
+    return "pbkdf2-sha256", {"i": LEGACY_PBKDF2_ITERATIONS}, bytes.fromhex(salt), bytes.fromhex(dk)
+
+class PasswordHasher:
+    """Runs the password KDF on a small dedicated process pool so logins cannot starve request workers.
+
+    Stored format: $<algorithm>$<k=v,...>$<salt hex>$<dk hex>. At most workers + maxQueue
+    hashes may be pending; beyond that callers get HasherBusyError instead of waiting, so keep
+    that sum below the number of request threads or a login burst can still occupy all of them.
+    With workers=0 hashing runs inline on the calling thread. The pool starts with the
+    first hash, its workers spawned rather than forked from the threaded server process.
+    """
+
+    def __init__(self, algorithm: str = "pbkdf2-sha256", iterations: int = 120_000,
+                 scryptN: int = 2 ** 14, scryptR: int = 8, scryptP: int = 1,
+                 workers: int = 2, maxQueue: int = 4, timeout: float = 10.0):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+        
+        self.algorithm = algorithm
+        if algorithm == "scrypt":
+            self.params = {"n": scryptN, "r": scryptR, "p": scryptP}
+        else:
+            self.params = {"i": iterations}
+        
+        self.workers = max(0, workers)
+        self.timeout = timeout
+        self._startLock = threading.Lock()
+        self._closed = False
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, maxQueue)) if self.workers else None
+        self._statsLock = threading.Lock()
+        self._stats = {"hashes": 0, "verifications": 0, "rejected": 0, "inFlight": 0, "maxInFlight": 0}
+
+    def hash(self, secret: bytes) -> str:
+        salt = os.urandom(16)
+        dk = self._run(self.algorithm, self.params, secret, salt)
+        self._count("hashes")
+        return f"${self.algorithm}${_encodeParams(self.params)}${salt.hex()}${dk.hex()}"
+
+    def verify(self, secret: bytes, stored: str) -> Tuple[bool, bool]:
+        """Return (matches, needsRehash); needsRehash is True when the hash uses outdated settings"""
+        try:
+            algorithm, params, salt, expected = parseHash(stored)
+        except Exception:
+            return False, False
+        if algorithm not in ALGORITHMS:
+            return False, False
+        
+        got = self._run(algorithm, params, secret, salt)
+        self._count("verifications")
+        if not hmac.compare_digest(got, expected):
+            return False, False
+        
+        return True, self.needsRehash(stored)
+
+    def needsRehash(self, stored: str) -> bool:
+        return not stored.startswith(f"${self.algorithm}${_encodeParams(self.params)}$")
+
+    @metrics.counters("hashes", "verifications", "rejected")
+    def stats(self) -> Dict[str, Any]:
+        with self._statsLock:
+            out = dict(self._stats)
+        out["workers"] = self.workers
+        out["algorithm"] = self.algorithm
+        out["params"] = _encodeParams(self.params)
+        return out
+
+    def shutdown(self):
+        with self._startLock:
+            self._closed = True
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _run(self, algorithm: str, params: Dict[str, int], secret: bytes, salt: bytes) -> bytes:
+        if not self._start():
+            return _derive(algorithm, params, secret, salt)
+        
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise HasherBusyError("Too many sign-in attempts in progress, try again shortly")
+        
+        with self._statsLock:
+            self._stats["inFlight"] += 1
+            self._stats["maxInFlight"] = max(self._stats["maxInFlight"], self._stats["inFlight"])
+        try:
+            fut = self._pool.submit(_derive, algorithm, params, secret, salt)
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the job itself ends, not just our wait for it: a timed-out
+        # hash still occupies its worker (or queue place) until it finishes.
+        fut.add_done_callback(self._release)
+        try:
+            return fut.result(self.timeout)
+        except FutureTimeoutError:
+            fut.cancel()
+            raise
+
+    def _start(self) -> bool:
+        with self._startLock:
+            if self.workers and self._pool is None and not self._closed:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool is not None
+
+    def _release(self, _future=None):
+        with self._statsLock:
+            self._stats["inFlight"] -= 1
+        self._slots.release()
+
+    def _count(self, key: str):
+        with self._statsLock:
+            self._stats[key] += 1
@@ -1,43 +1,29 @@
 from __future__ import annotations
-from typing import List, Dict, Any
 from database import Database
-from models import Scores
 
 class ProfileController:
     def __init__(self, database: Database):
         self.database = database
 
     def getStatistics(self, userId: str):
-        scores = self.database.getAllScores(userId)
+        stats = self.database.getUserStats(userId)
+        if stats is None:
+            return {
+                "avgFluency": 0.0,
+                "avgWordChoice": 0.0,
+                "avgGrammar": 0.0,
+                "messageCount": 0,
+                "conversationCount": 0,
+                "accountInfo": {}
+            }
         
-        msgs = self.database.getAllUserMessages(userId)
-        
-        convCount = self.database.getConversationCount(userId)
-        
-        info = self.database.getAccountInfo(userId)
+        averages = stats.getAverages()
         
         return {
-            "avgFluency": self.calculateAverageFluency(scores),
-            "avgWordChoice": self.calculateAverageWordChoice(scores),
-            "avgGrammar": self.calculateAverageGrammar(scores),
-            "messageCount": len(msgs),
-            "conversationCount": convCount,
-            "accountInfo": info
+            "avgFluency": averages["fluency"],
+            "avgWordChoice": averages["wordChoice"],
+            "avgGrammar": averages["grammar"],
+            "messageCount": stats.messageCount,
+            "conversationCount": stats.conversationCount,
+            "accountInfo": stats.accountInfo
         }
-
-    def calculateAverageFluency(self, scores: List[Scores]) -> float:
-        if not scores:
-            return 0.0
-        return round(sum(s.fluency for s in scores) / len(scores), 1)
-
-    def calculateAverageWordChoice(self, scores: List[Scores]) -> float:
-        if not scores:
-            return 0.0
-        return round(sum(s.wordChoice for s in scores) / len(scores), 1)
-
-    def calculateAverageGrammar(self, scores: List[Scores]) -> float:
-        if not scores:
-            return 0.0
-        return round(sum(s.grammar for s in scores) / len(scores), 1)
-
-
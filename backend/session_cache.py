@@ -0,0 +1,68 @@
+from __future__ import annotations
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+import threading
+import time
+import metrics
+
+class SessionCache:
+    """In-process TTL cache of sessionId -> userId, including negative entries for unknown/ended sessions"""
+
+    def __init__(self, ttl: float = 60.0, negativeTtl: float = 10.0, maxEntries: int = 10000):
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.maxEntries = maxEntries
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negativeHits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, sessionId: str) -> Tuple[bool, Optional[str]]:
+        """(True, userId) for a cached valid session, (True, None) for a cached rejection, (False, None) on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sessionId)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[sessionId]
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(sessionId)
+            self._stats["hits" if entry[0] else "negativeHits"] += 1
+            return True, entry[0]
+
+    def put(self, sessionId: str, userId: str, expiresAt: Optional[datetime] = None):
+        ttl = self.ttl
+        if expiresAt is not None:
+            # Never cache a session past its own expiry.
+            if expiresAt.tzinfo is None:
+                expiresAt = expiresAt.replace(tzinfo=timezone.utc)
+            remaining = (expiresAt - datetime.now(timezone.utc)).total_seconds()
+            ttl = min(ttl, max(0.0, remaining))
+        self._store(sessionId, userId, ttl)
+
+    def putNegative(self, sessionId: str):
+        self._store(sessionId, None, self.negativeTtl)
+
+    def invalidate(self, sessionId: str):
+        """Drop the entry and remember the session as rejected (used on logout)"""
+        with self._lock:
+            self._stats["invalidations"] += 1
+        self._store(sessionId, None, self.negativeTtl)
+
+    @metrics.counters("hits", "negativeHits", "misses", "invalidations", "evictions")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+        lookups = out["hits"] + out["negativeHits"] + out["misses"]
+        out["hitRate"] = round((out["hits"] + out["negativeHits"]) / lookups, 4) if lookups else 0.0
+        return out
+
+    def _store(self, sessionId: str, userId: Optional[str], ttl: float):
+        with self._lock:
+            self._entries[sessionId] = (userId, time.monotonic() + ttl)
+            self._entries.move_to_end(sessionId)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
@@ -0,0 +1,238 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Any, Iterator, List, Optional
+import asyncio
+import threading
+import time
+from ai_service import AIService
+from context_builder import ContextBuilder
+from database import Database
+from interim_analysis import normalizeSpeech
+from llm_scheduler import SPECULATIVE
+import metrics
+
+class _Abandoned(Exception):
+    pass
+
+class _Speculation:
+    """One reply generated ahead of the turn; tokens are buffered so the turn can replay and then follow them"""
+
+    def __init__(self, userId: str, conversationId: str, text: str):
+        self.userId = userId
+        self.conversationId = conversationId
+        self.text = text
+        self.messageCount = -1
+        self.granted = False
+        self.startedAt = time.monotonic()
+        self.finishedAt: Optional[float] = None
+        self.tokens: List[str] = []
+        self.failed = False
+        self.cancelled = False
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def done(self) -> bool:
+        return self.finishedAt is not None
+
+    def push(self, token: str):
+        with self._cond:
+            self.tokens.append(token)
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for notify in listeners:
+            notify()
+
+    def finish(self, failed: bool = False):
+        with self._cond:
+            self.failed = failed
+            self.finishedAt = time.monotonic()
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for notify in listeners:
+            notify()
+
+    def replay(self) -> Iterator[str]:
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.tokens) and not self.done:
+                    self._cond.wait()
+                pending = self.tokens[i:]
+                finished = self.done
+            yield from pending
+            i += len(pending)
+            if finished and i >= len(self.tokens):
+                return
+
+    async def replayAsync(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        notify = lambda: loop.call_soon_threadsafe(changed.set)
+        with self._cond:
+            self._listeners.append(notify)
+        try:
+            i = 0
+            while True:
+                with self._cond:
+                    pending = self.tokens[i:]
+                    finished = self.done
+                    changed.clear()
+                for token in pending:
+                    yield token
+                i += len(pending)
+                if finished and i >= len(self.tokens):
+                    return
+                if not pending:
+                    await changed.wait()
+        finally:
+            with self._cond:
+                self._listeners.remove(notify)
+
+class SpeculativeResponder:
+    """Starts the reply while the learner is still silent-but-listening.
+
+    Speech is only sent after several seconds of silence. Once the interim transcript
+    has been stable for a moment the client sends a "stable" event and a reply is
+    generated for that text right away. If the sent turn has the same text and the
+    conversation has not moved on, the turn replays the speculative tokens (and follows
+    the rest as they arrive); otherwise the speculation is cancelled and the turn calls
+    the model as usual. At most one speculation per user is kept.
+
+    Speculative calls queue at the scheduler's lowest priority, and at most
+    maxConcurrent - 1 of them run at once, so a chat turn always finds a slot.
+    A speculation still waiting for its slot when the turn is sent is dropped;
+    the turn asks at chat priority instead.
+    """
+
+    def __init__(self, database: Database, aiService: AIService, contextBuilder: ContextBuilder,
+                 workers: int = 2, minWords: int = 2, maxAgeSeconds: float = 30.0):
+        self.database = database
+        self.aiService = aiService
+        self.contextBuilder = contextBuilder
+        self.minWords = minWords
+        self.maxAgeSeconds = maxAgeSeconds
+        if aiService.scheduler is not None:
+            workers = min(workers, aiService.scheduler.maxConcurrent - 1)
+        self.workers = max(0, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="speculation") \
+            if self.workers else None
+        self._lock = threading.Lock()
+        self._byUser: Dict[str, _Speculation] = {}
+        self._stats = {"started": 0, "hits": 0, "misses": 0, "notStarted": 0, "replaced": 0, "expired": 0,
+                       "failed": 0, "savedMsTotal": 0.0}
+
+    def start(self, userId: str, conversationId: str, text: str) -> bool:
+        """Speculate on text for the user's next turn; False if it is too short or already running"""
+        text = normalizeSpeech(text)
+        if self._executor is None or not conversationId or len(text.split()) < self.minWords or len(text) > 2000:
+            return False
+        
+        with self._lock:
+            self._expire()
+            current = self._byUser.get(userId)
+            if current is not None and current.conversationId == conversationId and current.text == text:
+                return True
+            if current is not None:
+                current.cancelled = True
+                self._stats["replaced"] += 1
+            spec = _Speculation(userId, conversationId, text)
+            self._byUser[userId] = spec
+            self._stats["started"] += 1
+        
+        self._executor.submit(self._generate, spec)
+        return True
+
+    def discard(self, userId: str):
+        with self._lock:
+            spec = self._byUser.pop(userId, None)
+            if spec is not None:
+                spec.cancelled = True
+                self._stats["replaced"] += 1
+
+    def claim(self, userId: str, conversationId: str, text: str, messageCount: int) -> Optional[_Speculation]:
+        """The user's speculation if it answers exactly this turn (same text, same conversation state)"""
+        with self._lock:
+            spec = self._byUser.pop(userId, None)
+            if spec is None:
+                return None
+            hit = (spec.conversationId == conversationId and spec.text == normalizeSpeech(text)
+                   and not spec.failed and spec.messageCount in (-1, messageCount))
+            if not hit:
+                spec.cancelled = True
+                self._stats["misses"] += 1
+                return None
+            if not spec.granted:
+                # Still queued behind other model calls at speculative priority.
+                spec.cancelled = True
+                self._stats["notStarted"] += 1
+                return None
+            self._stats["hits"] += 1
+            # Time the reply was ahead: all of it if it already finished, else how long it has been running.
+            saved = (spec.finishedAt or time.monotonic()) - spec.startedAt
+            self._stats["savedMsTotal"] += saved * 1000
+        return spec
+
+    @metrics.counters("started", "hits", "misses", "notStarted", "replaced", "expired", "failed", "savedMsTotal")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["active"] = len(self._byUser)
+        decided = out["hits"] + out["misses"]
+        out["hitRate"] = round(out["hits"] / decided, 3) if decided else 0.0
+        out["avgSavedMs"] = round(out["savedMsTotal"] / out["hits"], 1) if out["hits"] else 0.0
+        return out
+
+    def _generate(self, spec: _Speculation):
+        if spec.cancelled:
+            spec.finish(failed=True)
+            return
+        
+        failed = error = False
+        try:
+            # Also the ownership check: only the conversation's owner gets a speculative reply.
+            messageCount, messages, summary = self.database.getTurnContext(
+                spec.conversationId, spec.userId, self.contextBuilder.window
+            )
+            spec.messageCount = messageCount
+            context = self.contextBuilder.recent(messageCount, messages, summary)
+            # Raising, not the fallback text: a failed speculation leaves the turn to call the model itself.
+            stream = self.aiService.streamResponse(spec.text, context, spec.userId, summary.text,
+                                                   priority=SPECULATIVE, onSlot=lambda: self._granted(spec),
+                                                   raiseOnError=True)
+            try:
+                for token in stream:
+                    if spec.cancelled:
+                        failed = True
+                        break
+                    spec.push(token)
+            finally:
+                # Closing the generator closes the HTTP response and frees the scheduler slot.
+                stream.close()
+        except _Abandoned:
+            failed = True
+        except Exception as e:
+            print(f"Speculative reply for {spec.conversationId} failed: {e}")
+            failed = error = True
+        
+        spec.finish(failed=failed)
+        if failed:
+            with self._lock:
+                self._stats["failed"] += int(error)
+                if self._byUser.get(spec.userId) is spec:
+                    del self._byUser[spec.userId]
+
+    def _granted(self, spec: _Speculation):
+        with self._lock:
+            if spec.cancelled:
+                # Replaced or missed while queued: give the slot back without calling the model.
+                raise _Abandoned()
+            spec.granted = True
+
+    def _expire(self):
+        now = time.monotonic()
+        for userId, spec in list(self._byUser.items()):
+            if now - spec.startedAt > self.maxAgeSeconds:
+                spec.cancelled = True
+                del self._byUser[userId]
+                self._stats["expired"] += 1
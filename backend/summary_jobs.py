@@ -0,0 +1,109 @@
+from __future__ import annotations
+from typing import Dict, Any, List
+import queue
+import threading
+from database import Database
+from ai_service import AIService
+from context_builder import ContextBuilder
+from models import ConversationSummary
+import metrics
+
+class SummaryJobQueue:
+    """Folds messages that aged out of the recent window into the conversation summary.
+
+    Runs on background threads at the scheduler's lowest priority. At most one job per
+    conversation is pending; a failed job is not retried, the next due turn queues a
+    new one. Each job summarizes at most maxBatch messages so one call stays short on
+    conversations that were never summarized.
+    """
+
+    def __init__(self, database: Database, aiService: AIService, contextBuilder: ContextBuilder,
+                 workers: int = 1, maxBatch: int = 40, maxPending: int = 1000):
+        self.database = database
+        self.aiService = aiService
+        self.contextBuilder = contextBuilder
+        self.maxBatch = maxBatch
+        self.maxPending = maxPending
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, str] = {}
+        self._closed = False
+        self._stats = {"enqueued": 0, "deduplicated": 0, "dropped": 0, "completed": 0, "skipped": 0, "failed": 0}
+        self.workers = max(1, workers)
+        self._workers: List[threading.Thread] = []
+
+    def enqueue(self, conversationId: str, userId: str) -> bool:
+        """Queue a summary update; False if one is already pending for the conversation or the queue is full"""
+        with self._lock:
+            if self._closed:
+                return False
+            if conversationId in self._pending:
+                self._stats["deduplicated"] += 1
+                return False
+            if len(self._pending) >= self.maxPending:
+                self._stats["dropped"] += 1
+                return False
+            self._pending[conversationId] = userId
+            self._startWorkers()
+            self._stats["enqueued"] += 1
+        self._queue.put((conversationId, userId))
+        return True
+
+    @metrics.counters("enqueued", "deduplicated", "dropped", "completed", "skipped", "failed")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["pending"] = len(self._pending)
+        out["queueDepth"] = self._queue.qsize()
+        return out
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for t in self._workers:
+            t.join()
+
+    def _startWorkers(self):
+        # Called with the lock held: the threads start with the first job, not when the app is built.
+        if not self._workers:
+            self._workers = [
+                threading.Thread(target=self._run, name=f"summary-jobs-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._workers:
+                t.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._finish(job[0], self._process(*job))
+
+    def _process(self, conversationId: str, userId: str) -> str:
+        try:
+            messageCount, current = self.database.findSummary(conversationId)
+            end = min(messageCount - self.contextBuilder.maxRecentMessages, current.messageCount + self.maxBatch)
+            if end <= current.messageCount:
+                return "skipped"
+        
+            messages = self.database.findMessagesRange(conversationId, current.messageCount, end)
+            if not messages:
+                return "skipped"
+            text = self.aiService.summarize(current.text, messages, userId)
+            if not text:
+                return "skipped"
+        
+            updated = ConversationSummary(text, current.messageCount + len(messages))
+            saved = self.database.saveSummary(conversationId, updated, current.messageCount)
+            return "completed" if saved else "skipped"
+        except Exception as e:
+            print(f"Summary job for {conversationId} failed: {e}")
+            return "failed"
+
+    def _finish(self, conversationId: str, outcome: str):
+        with self._lock:
+            self._pending.pop(conversationId, None)
+            self._stats[outcome] += 1
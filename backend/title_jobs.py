@@ -0,0 +1,126 @@
+from __future__ import annotations
+from typing import Dict, Any, List
+import queue
+import threading
+from database import Database
+from ai_service import AIService
+import metrics
+
+class _TitleJob:
+    __slots__ = ("conversationId", "userId", "text", "fallback", "attempts")
+
+    def __init__(self, conversationId: str, userId: str, text: str, fallback: str):
+        self.conversationId = conversationId
+        self.userId = userId
+        self.text = text
+        self.fallback = fallback
+        self.attempts = 0
+
+class TitleJobQueue:
+    """Generates AI conversation titles on background threads, off the request path.
+
+    The caller writes the fallback title first; a job replaces it only if it is still
+    the title on record. At most one job per conversation is pending, failed calls are
+    retried with backoff, and after the last retry the fallback title simply stays.
+    """
+
+    def __init__(self, database: Database, aiService: AIService, workers: int = 1,
+                 maxRetries: int = 2, retryDelay: float = 2.0, maxPending: int = 1000):
+        self.database = database
+        self.aiService = aiService
+        self.maxRetries = maxRetries
+        self.retryDelay = retryDelay
+        self.maxPending = maxPending
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _TitleJob] = {}
+        self._closed = False
+        self._stats = {"enqueued": 0, "deduplicated": 0, "dropped": 0, "completed": 0, "retries": 0, "failed": 0}
+        self.workers = max(1, workers)
+        self._workers: List[threading.Thread] = []
+
+    def enqueue(self, conversationId: str, userId: str, text: str, fallback: str) -> bool:
+        """Queue a title job; False if one is already pending for the conversation or the queue is full"""
+        with self._lock:
+            if self._closed:
+                return False
+            if conversationId in self._pending:
+                self._stats["deduplicated"] += 1
+                return False
+            if len(self._pending) >= self.maxPending:
+                self._stats["dropped"] += 1
+                return False
+            job = _TitleJob(conversationId, userId, text, fallback)
+            self._pending[conversationId] = job
+            self._startWorkers()
+            self._stats["enqueued"] += 1
+        self._queue.put(job)
+        return True
+
+    def isPending(self, conversationId: str) -> bool:
+        with self._lock:
+            return conversationId in self._pending
+
+    @metrics.counters("enqueued", "deduplicated", "dropped", "completed", "retries", "failed")
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["pending"] = len(self._pending)
+        out["queueDepth"] = self._queue.qsize()
+        return out
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for t in self._workers:
+            t.join()
+
+    def _startWorkers(self):
+        # Called with the lock held: the threads start with the first job, not when the app is built.
+        if not self._workers:
+            self._workers = [
+                threading.Thread(target=self._run, name=f"title-jobs-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._workers:
+                t.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._process(job)
+
+    def _process(self, job: _TitleJob):
+        try:
+            title = self.aiService.requestTitle(job.text, job.userId)
+        except Exception as e:
+            if job.attempts < self.maxRetries and not self._closed:
+                job.attempts += 1
+                with self._lock:
+                    self._stats["retries"] += 1
+                timer = threading.Timer(self.retryDelay * (2 ** (job.attempts - 1)), self._queue.put, (job,))
+                timer.daemon = True
+                timer.start()
+                return
+            print(f"Title job for {job.conversationId} failed: {e}")
+            self._finish(job, "failed")
+            return
+        
+        if not title or title == job.fallback:
+            self._finish(job, "completed")
+            return
+        try:
+            self.database.replaceTitle(job.conversationId, job.userId, job.fallback, title)
+            self._finish(job, "completed")
+        except Exception as e:
+            print(f"Title job for {job.conversationId} could not save: {e}")
+            self._finish(job, "failed")
+
+    def _finish(self, job: _TitleJob, outcome: str):
+        with self._lock:
+            self._pending.pop(job.conversationId, None)
+            self._stats[outcome] += 1
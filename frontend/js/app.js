@@ -1,4 +1,4 @@
-import { api } from './utils/api.js';
+import { api, apiStream } from './utils/api.js';
 import { AccountController } from './controllers/AccountController.js';
 import { SettingsController } from './controllers/SettingsController.js';
 import { ProfileController } from './controllers/ProfileController.js';
@@ -9,6 +9,7 @@ import { FeedbackPanel } from './ui/FeedbackPanel.js';
 import { SettingsPage } from './ui/SettingsPage.js';
 import { ProfilePage } from './ui/ProfilePage.js';
 import { SpeechSystem } from './services/SpeechSystem.js';
+import { InterimChannel } from './services/InterimChannel.js';
 import { createModalContainer, showModal, showConfirm } from './utils/modal.js';
 
 const App = {
@@ -22,10 +23,14 @@ const App = {
   chatInterface: null,
   feedbackPanel: null,
   speechSystem: null,
+  interimChannel: null,
 
   userId: "",
   sessionId: "",
   conversationId: "",
+  messageCursor: null,
+  // The reply being streamed: { controller, conversationId }.
+  turnAbort: null,
 
   api,
 
@@ -81,13 +86,17 @@ const App = {
     console.log("App booting...");
 
     this.speechSystem = new SpeechSystem();
+    this.interimChannel = new InterimChannel();
     this.loginPage = new LoginPage();
     this.accountController = new AccountController();
     this.settingsPage = new SettingsPage();
     this.settingsController = new SettingsController(this.speechSystem);
     this.profilePage = new ProfilePage();
     this.profileController = new ProfileController();
-    this.historyPanel = new HistoryPanel((id) => this.onSelectConversation(id));
+    this.historyPanel = new HistoryPanel(
+      (id) => this.onSelectConversation(id),
+      () => this.loadMoreHistory()
+    );
     this.chatInterface = new ChatInterface();
     this.feedbackPanel = new FeedbackPanel();
     
@@ -161,6 +170,9 @@ const App = {
     if (btnUpdateProfile) btnUpdateProfile.onclick = () => this.onUpdateProfile();
     
     window.addEventListener("hashchange", () => this.route());
+    window.addEventListener("session-expired", () => {
+      if (this.sessionId) this.onLogout();
+    });
     
     this.loadSession();
     console.log("Session loaded, routing...");
@@ -225,12 +237,15 @@ const App = {
   },
 
   async onLogout() {
+    this.cancelTurn();
     try {
       await this.accountController.logout(this.sessionId);
     } catch {}
   
     this.speechSystem.stopListening();
     this.speechSystem.setOnFinalResultCallback(null);
+    this.speechSystem.setOnInterimCallback(null);
+    this.interimChannel.close();
   
     this.chatInterface.isListening = false;
     this.chatInterface.removeIndicators();
@@ -250,9 +265,91 @@ const App = {
   async refreshHistory() {
     const out = await api("/api/conversations?userId=" + encodeURIComponent(this.userId));
     this.historyPanel.conversationList = out.conversations || [];
+    this.historyPanel.nextCursor = out.nextCursor || null;
     this.historyPanel.displayConversations();
   },
 
+  showFeedback(feedback) {
+    this.feedbackPanel.removeLoading();
+    this.feedbackPanel.displayFluency(feedback.scores.fluency);
+    this.feedbackPanel.displayWordChoice(feedback.scores.wordChoice);
+    this.feedbackPanel.displayGrammar(feedback.scores.grammar);
+    this.feedbackPanel.displayTips(feedback.tips);
+  },
+
+  // Deferred feedback: the reply arrives first, scores follow once the server has them.
+  async pollFeedback(messageId, attempts = 20) {
+    this.pendingFeedbackId = messageId;
+    for (let i = 0; i < attempts; i++) {
+      await new Promise((resolve) => setTimeout(resolve, i < 5 ? 300 : 1000));
+      if (this.pendingFeedbackId !== messageId) return;
+      
+      let f;
+      try {
+        f = await api("/api/messages/" + messageId + "/feedback");
+      } catch {
+        break;
+      }
+      if (f.status === "ready") {
+        this.pendingFeedbackId = null;
+        this.showFeedback(f);
+        return;
+      }
+      if (f.status === "failed") break;
+    }
+    if (this.pendingFeedbackId === messageId) {
+      this.pendingFeedbackId = null;
+      this.feedbackPanel.removeLoading();
+    }
+  },
+
+  async onTitleChanged(conversationId, title) {
+    if (conversationId !== this.conversationId) return;
+    document.getElementById("chatTitle").textContent = title;
+    try {
+      await this.refreshHistory();
+      this.historyPanel._activeId = this.conversationId;
+      this.historyPanel.displayConversations();
+    } catch {}
+  },
+
+  // The AI title is generated in the background after the first turn;
+  // the fallback title is shown until it is ready.
+  async pollTitle(conversationId, attempts = 10) {
+    let last = document.getElementById("chatTitle").textContent;
+    for (let i = 0; i < attempts; i++) {
+      await new Promise((resolve) => setTimeout(resolve, 1500));
+      if (conversationId !== this.conversationId) return;
+      
+      let t;
+      try {
+        t = await api("/api/conversations/" + conversationId + "/title");
+      } catch {
+        return;
+      }
+      if (t.title !== last) {
+        last = t.title;
+        await this.onTitleChanged(conversationId, t.title);
+      }
+      if (!t.pending) return;
+    }
+  },
+
+  async loadMoreHistory() {
+    const cursor = this.historyPanel.nextCursor;
+    if (!cursor) return;
+    
+    try {
+      const out = await api(
+        "/api/conversations?userId=" + encodeURIComponent(this.userId) +
+        "&cursor=" + encodeURIComponent(cursor)
+      );
+      this.historyPanel.appendPage(out.conversations, out.nextCursor);
+    } catch (e) {
+      showModal(e.message);
+    }
+  },
+
   async showChat() {
     this.showPage("pageChat");
     await this.refreshHistory();
@@ -360,7 +457,20 @@ const App = {
     }
   },
 
+  // Stops the reply in progress: the aborted request ends the stream, and the cancel call
+  // makes sure the server drops the turn even if a proxy keeps the connection open.
+  cancelTurn() {
+    if (!this.turnAbort) return;
+    
+    const { controller, conversationId } = this.turnAbort;
+    this.turnAbort = null;
+    controller.abort();
+    this.speechSystem.cancelSpeech();
+    api("/api/messages/cancel", "POST", { conversationId }).catch(() => {});
+  },
+
   async onNewConversation() {
+    this.cancelTurn();
     try {
       const out = await api("/api/conversations", "POST", {
         userId: this.userId
@@ -380,6 +490,7 @@ const App = {
   },
 
   async onSelectConversation(conversationId) {
+    this.cancelTurn();
     this.conversationId = conversationId;  
     this.historyPanel._activeId = conversationId;
     this.historyPanel.displayConversations();
@@ -391,6 +502,34 @@ const App = {
     for (const m of data.messages || []) {
       this.chatInterface.appendBubble(m.senderId, m.content);
     }
+    
+    this.messageCursor = data.nextCursor || null;
+    if (this.messageCursor) {
+      this.chatInterface.showLoadEarlier(() => this.loadEarlierMessages());
+    }
+  },
+
+  async loadEarlierMessages() {
+    const conversationId = this.conversationId;
+    const cursor = this.messageCursor;
+    if (!conversationId || !cursor) return;
+    
+    try {
+      const data = await api(
+        "/api/conversations/" + conversationId + "?cursor=" + encodeURIComponent(cursor)
+      );
+      if (conversationId !== this.conversationId) return;
+      
+      this.chatInterface.removeLoadEarlier();
+      this.chatInterface.prependBubbles(data.messages || []);
+      
+      this.messageCursor = data.nextCursor || null;
+      if (this.messageCursor) {
+        this.chatInterface.showLoadEarlier(() => this.loadEarlierMessages());
+      }
+    } catch (e) {
+      showModal(e.message);
+    }
   },
 
   async onDeleteConversation() {
@@ -421,9 +560,14 @@ const App = {
     if (this.chatInterface.isSpeakingMode) {
       this.chatInterface.isListening = false;
     
+      this.interimChannel.open();
+      this.speechSystem.setOnInterimCallback((finalText, partialText) => {
+        this.interimChannel.update(finalText, partialText, this.conversationId);
+      });
       this.speechSystem.setOnFinalResultCallback(async (text) => {
         this.chatInterface.isListening = false;
         this.chatInterface.removeIndicators();
+        this.interimChannel.finish();
       
         if (text) {
           await this.sendMessageInMode(text, true);
@@ -432,6 +576,8 @@ const App = {
     } 
     else {
       this.speechSystem.setOnFinalResultCallback(null);
+      this.speechSystem.setOnInterimCallback(null);
+      this.interimChannel.close();
       this.speechSystem.stopListening();
       this.chatInterface.isListening = false;
       this.chatInterface.removeIndicators();
@@ -473,6 +619,7 @@ const App = {
     console.log(">>> STARTING listening");
     this.chatInterface.isListening = true;
     this.chatInterface.showIndicator("၊၊||၊ Listening... (will auto-send when you stop)");
+    this.interimChannel.reset();
   
     const started = this.speechSystem.startListening();
     console.log(">>> startListening returned:", started);
@@ -520,9 +667,13 @@ async sendMessageInMode(text, isSpeakingMode) {
       console.log("Using existing conversationId:", this.conversationId);
     }
     
+    const abort = new AbortController();
+    this.turnAbort = { controller: abort, conversationId: this.conversationId };
+    
     try {
       this.chatInterface.disableInputs();
       this.chatInterface.showIndicator("AI thinking...");
+      this.pendingFeedbackId = null;
       this.feedbackPanel.showLoading();
       
       this.chatInterface.appendBubble("user", text);
@@ -531,27 +682,9 @@ async sendMessageInMode(text, isSpeakingMode) {
         this.chatInterface.clearInput();
       }
       
-      if (document.getElementById("chatTitle").textContent === "New conversation") {
-        try {
-          const t = await api(
-            "/api/conversations/" + this.conversationId + "/first-title",
-            "POST",
-            { text }
-          );
-          document.getElementById("chatTitle").textContent = t.title;
-          await this.refreshHistory();
-          this.historyPanel._activeId = this.conversationId;
-          this.historyPanel.displayConversations();
-        } catch {}
-      }
-      
-      const out = await api("/api/messages/send", "POST", {
-        conversationId: this.conversationId,
-        userId: this.userId,
-        text
-      });
-      
-      this.chatInterface.appendBubble("ai", out.aiText);
+      let speak = false;
+      let voiceId = null;
+      let speakingIndicator = "";
       
       if (isSpeakingMode) {
         try {
@@ -562,61 +695,83 @@ async sendMessageInMode(text, isSpeakingMode) {
           const savedVoice = voiceSettings.selectedVoice;
           
           if (savedVoice && savedVoice !== 'default') {
-            this.chatInterface.showIndicator("🗣 AI speaking... (please wait)");
-            
-            const utterance = this.speechSystem.textToSpeech(out.aiText, savedVoice);
-            
-            if (utterance) {
-              utterance.onend = () => {
-                this.chatInterface.removeIndicators();
-                this.chatInterface.ready();
-              };
-              
-              utterance.onerror = () => {
-                this.chatInterface.removeIndicators();
-                this.chatInterface.ready();
-              };
-            } else {
-              this.chatInterface.removeIndicators();
-              this.chatInterface.ready();
-            }
+            voiceId = savedVoice;
+            speakingIndicator = "🗣 AI speaking... (please wait)";
           } else {
-            this.chatInterface.showIndicator("🔊 AI speaking... (please wait)");
-            
-            const utterance = this.speechSystem.textToSpeech(out.aiText, this.speechSystem.getAvailableVoices()[0]);
-            
-            if (utterance) {
-              utterance.onend = () => {
-                this.chatInterface.removeIndicators();
-                this.chatInterface.ready();
-              };
-              
-              utterance.onerror = () => {
-                this.chatInterface.removeIndicators();
-                this.chatInterface.ready();
-              };
-            } else {
-              this.chatInterface.removeIndicators();
-              this.chatInterface.ready();
-            }
+            voiceId = this.speechSystem.getAvailableVoices()[0];
+            speakingIndicator = "🔊 AI speaking... (please wait)";
           }
+          speak = true;
         } catch (e) {
           console.error("Voice error:", e);
-          this.chatInterface.removeIndicators();
-          this.chatInterface.ready();
         }
+      }
+      
+      let aiBubble = null;
+      let streamedText = "";
+      let lastUtterance = null;
+      
+      const out = await apiStream("/api/messages/send-stream", {
+        conversationId: this.conversationId,
+        userId: this.userId,
+        text,
+        deferFeedback: true
+      }, (event) => {
+        if (event.type === "token") {
+          streamedText += event.text;
+          if (!aiBubble) {
+            aiBubble = this.chatInterface.appendBubble("ai", streamedText);
+          } else {
+            this.chatInterface.updateBubble(aiBubble, streamedText);
+          }
+        } else if (event.type === "sentence" && speak) {
+          if (!lastUtterance) this.chatInterface.showIndicator(speakingIndicator);
+          lastUtterance = this.speechSystem.queueSpeech(event.text, voiceId) || lastUtterance;
+        }
+      }, abort.signal);
+      
+      if (this.turnAbort && this.turnAbort.controller === abort) this.turnAbort = null;
+      
+      if (aiBubble) {
+        this.chatInterface.updateBubble(aiBubble, out.aiText);
       } else {
+        this.chatInterface.appendBubble("ai", out.aiText);
+      }
+      console.log("Time to first token (ms):", out.ttftMs);
+      
+      if (out.title) {
+        this.onTitleChanged(this.conversationId, out.title);
+        this.pollTitle(this.conversationId);
+      }
+      
+      const finish = () => {
         this.chatInterface.removeIndicators();
         this.chatInterface.ready();
+      };
+      
+      if (lastUtterance && this.speechSystem.isSpeaking()) {
+        lastUtterance.onend = finish;
+        lastUtterance.onerror = finish;
+      } else {
+        finish();
       }
       
-      this.feedbackPanel.removeLoading();
-      this.feedbackPanel.displayFluency(out.scores.fluency);
-      this.feedbackPanel.displayWordChoice(out.scores.wordChoice);
-      this.feedbackPanel.displayGrammar(out.scores.grammar);
-      this.feedbackPanel.displayTips(out.tips);
+      if (out.feedback === "pending") {
+        this.pollFeedback(out.messageId);
+      } else {
+        this.showFeedback(out);
+      }
       
     } catch (e) {
+      if (abort.signal.aborted) {
+        // Cancelled by switching conversations or logging out; the page is already moving on.
+        this.feedbackPanel.removeLoading();
+        this.chatInterface.removeIndicators();
+        this.chatInterface.enableInputs();
+        return;
+      }
+      if (this.turnAbort && this.turnAbort.controller === abort) this.turnAbort = null;
+      
       if (e.message && e.message.toLowerCase().includes("100 message")) {
         const chatLog = document.getElementById("chatLog");
         const lastBubble = chatLog.lastElementChild;
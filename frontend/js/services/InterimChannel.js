@@ -0,0 +1,126 @@
+import { api } from '../utils/api.js';
+
+// Streams the recognizer's interim transcript to the server while the learner is
+// speaking, so their speech is parsed before the message is sent. Uses the
+// /api/ws/interim WebSocket and falls back to POST /api/messages/interim when the
+// server has no WebSocket support.
+// Once the transcript has not changed for stableMs it sends a "stable" event, so the
+// server can start the reply before the silence timeout sends the message.
+export class InterimChannel {
+  constructor(throttleMs = 300, stableMs = 1000) {
+    this._throttleMs = throttleMs;
+    this._stableMs = stableMs;
+    this._stableTimer = null;
+    this._ws = null;
+    this._useHttp = !("WebSocket" in window);
+    this._pending = null;
+    this._timer = null;
+    this._lastSent = "";
+  }
+  
+  open() {
+    if (this._ws || this._useHttp) return;
+    
+    const sessionId = localStorage.getItem("sessionId") || "";
+    const scheme = location.protocol === "https:" ? "wss:" : "ws:";
+    const ws = new WebSocket(
+      `${scheme}//${location.host}/api/ws/interim?sessionId=${encodeURIComponent(sessionId)}`
+    );
+    let opened = false;
+    
+    ws.onopen = () => {
+      opened = true;
+      this.flush();
+    };
+    ws.onclose = () => {
+      if (this._ws === ws) this._ws = null;
+      if (!opened) this._useHttp = true;
+    };
+    ws.onerror = () => {};
+    this._ws = ws;
+  }
+  
+  close() {
+    this._clearTimer();
+    this._clearStableTimer();
+    this._pending = null;
+    if (this._ws) {
+      const ws = this._ws;
+      this._ws = null;
+      ws.close();
+    }
+  }
+  
+  update(finalText, partialText, conversationId = "") {
+    const key = finalText + "\u0000" + partialText;
+    if (key === this._lastSent) return;
+    
+    this._pending = { type: "interim", final: finalText, partial: partialText, key };
+    // Reconnects if the socket was closed (e.g. server restart); no-op while open.
+    this.open();
+    if (!this._timer) {
+      this._timer = setTimeout(() => this.flush(), this._throttleMs);
+    }
+    
+    this._clearStableTimer();
+    if (conversationId) {
+      this._stableTimer = setTimeout(() => {
+        this._stableTimer = null;
+        this.flush();
+        this._send({ type: "stable", conversationId, final: finalText, partial: partialText });
+      }, this._stableMs);
+    }
+  }
+  
+  reset() {
+    this._clearTimer();
+    this._clearStableTimer();
+    this._pending = null;
+    this._lastSent = "";
+    this._send({ type: "reset" });
+  }
+  
+  // The message is being sent: push the last update, and no "stable" event after it.
+  finish() {
+    this._clearStableTimer();
+    this.flush();
+  }
+  
+  flush() {
+    this._clearTimer();
+    if (!this._pending) return;
+    
+    const { key, ...event } = this._pending;
+    if (this._send(event)) {
+      this._pending = null;
+      this._lastSent = key;
+    }
+  }
+  
+  _send(event) {
+    if (this._useHttp) {
+      api("/api/messages/interim", "POST", event).catch(() => {});
+      return true;
+    }
+    if (this._ws && this._ws.readyState === WebSocket.OPEN) {
+      this._ws.send(JSON.stringify(event));
+      return true;
+    }
+    // Still connecting: keep the latest update for onopen.
+    return false;
+  }
+  
+  _clearTimer() {
+    if (this._timer) {
+      clearTimeout(this._timer);
+      this._timer = null;
+    }
+  }
+  
+  _clearStableTimer() {
+    if (this._stableTimer) {
+      clearTimeout(this._stableTimer);
+      this._stableTimer = null;
+    }
+  }
+}
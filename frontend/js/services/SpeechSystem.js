@@ -12,6 +12,7 @@ export class SpeechSystem {
     this._partialText = "";
     this._error = "";
     this._onFinalResult = null;
+    this._onInterim = null;
     this._silenceTimer = null;
     this._silenceDuration = 4000;
     this._lastSpeechTime = null;
@@ -46,6 +47,10 @@ export class SpeechSystem {
         }
         this._partialText = partialText.trim();
         
+        if (this._onInterim) {
+          this._onInterim(this._finalText, this._partialText);
+        }
+        
         this._lastSpeechTime = Date.now();
         this._resetSilenceTimer();
       };
@@ -151,6 +156,12 @@ export class SpeechSystem {
     return u;
   }
   
+  queueSpeech(text, voiceId) {
+    // speechSynthesis plays queued utterances in order, so streamed sentences
+    // can be spoken while later ones are still being generated.
+    return this.textToSpeech(text, voiceId);
+  }
+  
   playSample(voiceId) {
     return this.textToSpeech("This is a voice preview.", voiceId);
   }
@@ -224,6 +235,10 @@ export class SpeechSystem {
   setOnFinalResultCallback(callback) {
     this._onFinalResult = callback;
   }
+  
+  setOnInterimCallback(callback) {
+    this._onInterim = callback;
+  }
 
   captureAudio() {
     return null;
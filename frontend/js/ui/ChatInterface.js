@@ -98,5 +98,41 @@ export class ChatInterface {
     div.textContent = text;
     this._log.appendChild(div);
     this._log.scrollTop = this._log.scrollHeight;
+    return div;
+  }
+  
+  prependBubbles(messages) {
+    const anchor = this._log.querySelector(".bubble");
+    const before = this._log.scrollHeight;
+    
+    for (const m of messages) {
+      const div = document.createElement("div");
+      div.className = "bubble " + (m.senderId === "ai" ? "ai" : "user");
+      div.textContent = m.content;
+      this._log.insertBefore(div, anchor);
+    }
+    
+    // Keep the bubble the user was looking at in place.
+    this._log.scrollTop += this._log.scrollHeight - before;
+  }
+  
+  showLoadEarlier(onClick) {
+    this.removeLoadEarlier();
+    const btn = document.createElement("button");
+    btn.className = "btn small loadMore";
+    btn.id = "btnLoadEarlier";
+    btn.textContent = "Load earlier messages";
+    btn.onclick = onClick;
+    this._log.insertBefore(btn, this._log.firstChild);
+  }
+  
+  removeLoadEarlier() {
+    const btn = document.getElementById("btnLoadEarlier");
+    if (btn) btn.remove();
+  }
+  
+  updateBubble(div, text) {
+    div.textContent = text;
+    this._log.scrollTop = this._log.scrollHeight;
   }
 }
\ No newline at end of file
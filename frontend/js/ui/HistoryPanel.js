@@ -1,9 +1,11 @@
 export class HistoryPanel {
-  constructor(onSelectCallback) {
+  constructor(onSelectCallback, onLoadMoreCallback) {
     this.conversationList = [];
+    this.nextCursor = null;
     this._root = document.getElementById("historyList");
     this._activeId = "";
     this._onSelectCallback = onSelectCallback;
+    this._onLoadMoreCallback = onLoadMoreCallback;
   }
   
   displayConversations() {
@@ -21,6 +23,23 @@ export class HistoryPanel {
       div.onclick = () => this._onSelectCallback(c.conversationId);
       this._root.appendChild(div);
     }
+    
+    if (this.nextCursor && this._onLoadMoreCallback) {
+      const more = document.createElement("button");
+      more.className = "btn small loadMore";
+      more.textContent = "Load more";
+      more.onclick = () => this._onLoadMoreCallback();
+      this._root.appendChild(more);
+    }
+  }
+  
+  appendPage(conversations, nextCursor) {
+    const known = new Set(this.conversationList.map(c => c.conversationId));
+    for (const c of conversations || []) {
+      if (!known.has(c.conversationId)) this.conversationList.push(c);
+    }
+    this.nextCursor = nextCursor || null;
+    this.displayConversations();
   }
   
   displayEmptyChat() {
@@ -1,11 +1,69 @@
+function headers() {
+  const h = { "Content-Type": "application/json" };
+  const sessionId = localStorage.getItem("sessionId");
+  if (sessionId) h["X-Session-Id"] = sessionId;
+  return h;
+}
+
+function checkSession(res) {
+  if (res.status === 401) {
+    window.dispatchEvent(new Event("session-expired"));
+  }
+}
+
 export async function api(path, method = "GET", body = null) {
   const res = await fetch(path, {
     method,
-    headers: { "Content-Type": "application/json" },
+    headers: headers(),
     body: body ? JSON.stringify(body) : null
   });
   
+  checkSession(res);
   const data = await res.json().catch(() => ({}));
   if (!res.ok) throw new Error(data.error || "Request failed");
   return data;
-}
\ No newline at end of file
+}
+
+export async function apiStream(path, body, onEvent, signal = null) {
+  const res = await fetch(path, {
+    method: "POST",
+    headers: headers(),
+    body: JSON.stringify(body),
+    signal
+  });
+  
+  checkSession(res);
+  if (!res.ok || !res.body) {
+    const data = await res.json().catch(() => ({}));
+    throw new Error(data.error || "Request failed");
+  }
+  
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let done = null;
+  
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (value) buffer += decoder.decode(value, { stream: true });
+    
+    let nl;
+    while ((nl = buffer.indexOf("\n")) >= 0) {
+      const line = buffer.slice(0, nl).trim();
+      buffer = buffer.slice(nl + 1);
+      if (!line) continue;
+      
+      const event = JSON.parse(line);
+      if (event.type === "error" || event.type === "cancelled") {
+        throw new Error(event.error || "Request failed");
+      }
+      if (event.type === "done") done = event;
+      onEvent(event);
+    }
+    
+    if (finished) break;
+  }
+  
+  if (!done) throw new Error("Connection closed before the reply finished");
+  return done;
+}
@@ -1,5 +1,6 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
+DROP TABLE IF EXISTS user_stats CASCADE;
 DROP TABLE IF EXISTS feedback CASCADE;
 DROP TABLE IF EXISTS messages CASCADE;
 DROP TABLE IF EXISTS conversations CASCADE;
@@ -29,10 +30,16 @@ CREATE TABLE conversations (
   "sessionId" uuid NULL REFERENCES sessions("sessionId") ON DELETE SET NULL,
   "title" text NOT NULL DEFAULT 'New conversation',
   "messageCount" int NOT NULL DEFAULT 0,
+  -- Rolling summary of the oldest "summaryCount" messages, kept by the backend's
+  -- summary jobs so prompts stay small on long conversations. Existing databases:
+  --   ALTER TABLE conversations ADD COLUMN "summary" text NOT NULL DEFAULT '',
+  --                             ADD COLUMN "summaryCount" int NOT NULL DEFAULT 0;
+  "summary" text NOT NULL DEFAULT '',
+  "summaryCount" int NOT NULL DEFAULT 0,
   "createdAt" timestamptz NOT NULL DEFAULT NOW()
 );
 
-CREATE INDEX idx_conversations_user_created ON conversations("userId", "createdAt" DESC);
+CREATE INDEX idx_conversations_user_created ON conversations("userId", "createdAt" DESC, "conversationId" DESC);
 
 CREATE TABLE messages (
   "messageId" uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -42,7 +49,7 @@ CREATE TABLE messages (
   "timestamp" timestamptz NOT NULL DEFAULT NOW()
 );
 
-CREATE INDEX idx_messages_conv_time ON messages("conversationId", "timestamp" ASC);
+CREATE INDEX idx_messages_conv_time ON messages("conversationId", "timestamp" ASC, "messageId" ASC);
 
 CREATE TABLE feedback (
   "feedbackId" uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -51,4 +58,16 @@ CREATE TABLE feedback (
   "wordChoiceScore" int NOT NULL DEFAULT 0,
   "grammarScore" int NOT NULL DEFAULT 0,
   "feedbackTips" text[] NOT NULL DEFAULT ARRAY[]::text[]
-);
\ No newline at end of file
+);
+
+-- Running per-user totals for the profile page, maintained by the backend on
+-- every write; rebuild with: flask --app app rebuild-stats
+CREATE TABLE user_stats (
+  "userId" uuid PRIMARY KEY REFERENCES users("userId") ON DELETE CASCADE,
+  "fluencySum" bigint NOT NULL DEFAULT 0,
+  "wordChoiceSum" bigint NOT NULL DEFAULT 0,
+  "grammarSum" bigint NOT NULL DEFAULT 0,
+  "scoreCount" int NOT NULL DEFAULT 0,
+  "messageCount" int NOT NULL DEFAULT 0,
+  "conversationCount" int NOT NULL DEFAULT 0
+);